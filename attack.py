@@ -16,6 +16,9 @@ import math
 # Custom
 
 import custom_typing as t
+from modifier_dict import modifier_bit
+
+WEAK = modifier_bit("weak")
 
 
 #########
@@ -39,7 +42,7 @@ class Attack:
         self.target = target
         self.multi_target = multi_target
 
-        if creature is not None and "weak" in creature.statuses:
+        if creature is not None and creature.statuses.mask & WEAK:
             self.damage = math.floor(self.damage * 0.75)
 
     def __eq__(self, __value: object) -> bool:
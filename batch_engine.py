@@ -0,0 +1,549 @@
+"""
+batch_engine.py
+Contains the class BatchEngine, which runs many independent battles between
+Jaw Worms and Hearts in lockstep as NumPy arrays. Every creature slot keeps one
+column per battle, and the rules of JawWorm, Heart, Creature.take_hit,
+Creature.take_damage and Simulator.resolve_one_creature_turn are reproduced as
+masked array operations. Battle i draws from the same BattleRandom stream
+(seed, i) as in the python engine, one draw wherever the python engine makes
+one, so both engines give the same battles for the same seed. NumPy is
+optional, and only needed when this engine is selected.
+"""
+
+#########
+# Imports
+#########
+
+# Builtins
+
+import time
+
+# Customs
+
+from battle_random import uniform_block
+from creature import Creature
+from heart import Heart
+from jaw_worm import JawWorm
+from simulation_result import SimulationResult
+import custom_typing as t
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore
+
+
+###########
+# Constants
+###########
+
+NO_MOVE = -1
+MOVE_NAMES = ("chomp", "thrash", "bellow", "debilitate", "blood_shots", "echo", "buff")
+CHOMP, THRASH, BELLOW, DEBILITATE, BLOOD_SHOTS, ECHO, BUFF = range(len(MOVE_NAMES))
+NUM_MOVES = len(MOVE_NAMES)
+
+# Draws per battle generated up front, doubled whenever a battle runs out
+BLOCK_DRAWS = 32
+
+# every ModifierDict carries strength and dexterity, only permanents are read
+SUPPORTED_STATUSES = set(("dexterity", "frail", "strength", "vulnerable", "weak"))
+SUPPORTED_PERMANENTS = set(
+    (
+        "artifact",
+        "beat_of_death",
+        "dexterity",
+        "invincible",
+        "painful_stabs",
+        "strength",
+    )
+)
+
+# Stands in for "no invincible permanent", large enough to never cap a hit
+NOT_INVINCIBLE = 2**62
+
+
+###########
+# Functions
+###########
+
+
+def move_id(action: str) -> int:
+    """The index of a move in MOVE_NAMES."""
+    return MOVE_NAMES.index(action)
+
+
+#########
+# Classes
+#########
+
+
+class _BatchState:
+    def __init__(
+        self, engine: "BatchEngine", seed: int, first_battle: int, num_battles: int
+    ) -> None:
+        """Allocates the per battle, per slot arrays for one batch, filled with
+        the starting state of every creature, and the first draws of every
+        battle's stream.
+
+        Args:
+            engine (BatchEngine): The engine holding the starting values.
+            seed (int): The base seed of the run.
+            first_battle (int): The index of the batch's first battle.
+            num_battles (int): How many battles run in this batch.
+        """
+        shape = (num_battles, engine.num_slots)
+
+        def tile(values: t.List[int]) -> t.Any:
+            return np.tile(np.asarray(values, dtype=np.int64), (num_battles, 1))
+
+        self.hp = tile(engine.start_hp)
+        self.block = tile(engine.start_block)
+        self.strength = tile(engine.start_strength)
+        self.weak = tile(engine.start_weak)
+        self.vulnerable = tile(engine.start_vulnerable)
+        self.frail = tile(engine.start_frail)
+        self.beat = tile(engine.start_beat)
+        self.invincible = tile(engine.start_invincible)
+        self.turns = np.zeros(shape, dtype=np.int64)
+        self.buffs = np.zeros(shape, dtype=np.int64)
+        self.prev1 = np.full(shape, NO_MOVE, dtype=np.int64)
+        self.prev2 = np.full(shape, NO_MOVE, dtype=np.int64)
+        self.alive = self.hp > 0
+        self.running = np.ones(num_battles, dtype=bool)
+        self.left_won = np.zeros(num_battles, dtype=bool)
+        self.seed = seed
+        self.battle = np.arange(first_battle, first_battle + num_battles)
+        # draws used so far by each battle, the column of its next draw
+        self.drawn = np.zeros(num_battles, dtype=np.int64)
+        self.uniforms = uniform_block(seed, first_battle, num_battles, BLOCK_DRAWS)
+
+    def keep(self, rows: t.Any) -> None:
+        """Drops every battle not selected by rows, compacting the arrays.
+
+        Args:
+            rows (t.Any): Boolean mask of the battles to keep.
+        """
+        for name, value in vars(self).items():
+            if isinstance(value, np.ndarray):
+                setattr(self, name, value[rows])
+
+    def draw(self, rows: t.Any) -> t.Any:
+        """The next draw of each of the given battles' streams, what
+        BattleRandom.random returns for them in the python engine.
+
+        Args:
+            rows (t.Any): Indices of the battles drawing, each at most once.
+
+        Returns:
+            t.Any: One float64 in [0, 1) per battle.
+        """
+        drawn = self.drawn[rows]
+        if drawn.size and drawn.max() >= self.uniforms.shape[1]:
+            # the battles left need not be consecutive any more
+            first_battle = int(self.battle.min())
+            span = int(self.battle.max()) - first_battle + 1
+            draws = 2 * self.uniforms.shape[1]
+            block = uniform_block(self.seed, first_battle, span, draws)
+            self.uniforms = block[self.battle - first_battle]
+        self.drawn[rows] = drawn + 1
+        return self.uniforms[rows, drawn]
+
+
+class _IntentArrays:
+    def __init__(self, spec: t.Any) -> None:
+        """The intent rules of a spec, compiled for the current ascension and
+        act, as arrays indexed by the creature's last two moves, NO_MOVE + 1
+        standing for none yet. Row [prev2 + 1, prev1 + 1] holds the intent
+        table CompiledSpec.pick_action uses after those moves.
+
+        Args:
+            spec (t.Any): The CreatureSpec of JawWorm or Heart.
+        """
+        compiled = spec.current()
+        self.first = NO_MOVE if compiled.first is None else move_id(compiled.first)
+        self.period = compiled.period
+        self.scheduled = (
+            NO_MOVE if compiled.scheduled is None else move_id(compiled.scheduled)
+        )
+        shape = (NUM_MOVES + 1, NUM_MOVES + 1, NUM_MOVES)
+        self.num_actions = np.zeros(shape[:2], dtype=np.int64)
+        self.actions = np.full(shape, NO_MOVE, dtype=np.int64)
+        self.probabilities = np.zeros(shape, dtype=np.float64)
+        self.aliases = np.zeros(shape, dtype=np.int64)
+        moves = [NO_MOVE] + [move_id(action) for action in compiled.moves]
+        for prev2 in moves:
+            for prev1 in moves:
+                if prev1 == NO_MOVE and prev2 != NO_MOVE:
+                    continue
+                history = [MOVE_NAMES[move] for move in (prev2, prev1) if move >= 0]
+                try:
+                    actions, _, probabilities, aliases = compiled.intent_table(
+                        spec.state_of(history)
+                    )
+                except ValueError:
+                    continue  # no move is allowed, never reached
+                row = (prev2 + 1, prev1 + 1)
+                self.num_actions[row] = len(actions)
+                self.actions[row][: len(actions)] = [move_id(a) for a in actions]
+                self.probabilities[row][: len(actions)] = probabilities
+                self.aliases[row][: len(actions)] = aliases
+
+    def pick(
+        self,
+        state: _BatchState,
+        rows: t.Any,
+        turns: t.Any,
+        prev1: t.Any,
+        prev2: t.Any,
+    ) -> t.Any:
+        """Vectorized CompiledSpec.pick_action, drawing only for the battles
+        the python engine draws for.
+
+        Args:
+            state (_BatchState): The batch, drawn from.
+            rows (t.Any): Indices of the battles picking.
+            turns (t.Any): The picking creature's turns_taken in each battle.
+            prev1 (t.Any): Its last move in each battle.
+            prev2 (t.Any): Its move before that in each battle.
+
+        Returns:
+            t.Any: The picked move of each battle.
+        """
+        table = (prev2 + 1, prev1 + 1)
+        move = self.actions[table + (0,)]
+        forced = np.zeros(rows.size, dtype=bool)
+        if self.first != NO_MOVE:
+            forced = turns == 0
+            move = np.where(forced, self.first, move)
+        if self.period:
+            scheduled = ~forced & (turns >= self.period) & (turns % self.period == 0)
+            move = np.where(scheduled, self.scheduled, move)
+            forced |= scheduled
+        drawing = np.flatnonzero(~forced & (self.num_actions[table] > 1))
+        if drawing.size:
+            table = (table[0][drawing], table[1][drawing])
+            u = state.draw(rows[drawing]) * self.num_actions[table]
+            column = u.astype(np.int64)
+            kept = u - column < self.probabilities[table + (column,)]
+            column = np.where(kept, column, self.aliases[table + (column,)])
+            move[drawing] = self.actions[table + (column,)]
+        return move
+
+
+class BatchEngine:
+    def __init__(
+        self, left_creatures: t.List[Creature], right_creatures: t.List[Creature]
+    ) -> None:
+        """Reads the starting state of both teams, which every battle in a batch
+        begins from. Only fresh Jaw Worms and Hearts are supported.
+
+        Args:
+            left_creatures (t.List[Creature]): The side that goes first
+            right_creatures (t.List[Creature]): The side that goes second
+
+        Raises:
+            ImportError: If NumPy is not installed.
+            ValueError: If a creature or its state is not supported.
+        """
+        if np is None:
+            raise ImportError("The numpy engine requires numpy to be installed.")
+
+        creatures = list(left_creatures) + list(right_creatures)
+        for creature in creatures:
+            self._check_supported(creature)
+
+        self.num_left = len(left_creatures)
+        self.num_slots = len(creatures)
+        self.left_slots = slice(0, self.num_left)
+        self.right_slots = slice(self.num_left, self.num_slots)
+        self.left_names = [creature.name for creature in left_creatures]
+        self.right_names = [creature.name for creature in right_creatures]
+        self.is_heart = [isinstance(creature, Heart) for creature in creatures]
+        intents = {
+            creature_type: _IntentArrays(creature_type.spec)
+            for creature_type in (JawWorm, Heart)
+        }
+        self.intents = [intents[type(creature)] for creature in creatures]
+
+        self.start_hp = [creature.hp for creature in creatures]
+        self.start_block = [creature.block for creature in creatures]
+
+        def start_values(modifiers: str, name: str, default: int) -> t.List[int]:
+            return [
+                getattr(creature, modifiers)[name] or default for creature in creatures
+            ]
+
+        self.start_strength = start_values("permanents", "strength", 0)
+        self.start_weak = start_values("statuses", "weak", 0)
+        self.start_vulnerable = start_values("statuses", "vulnerable", 0)
+        self.start_frail = start_values("statuses", "frail", 0)
+        self.start_beat = start_values("permanents", "beat_of_death", 0)
+        self.start_invincible = start_values("permanents", "invincible", NOT_INVINCIBLE)
+
+        self._build_move_table()
+
+    @staticmethod
+    def _check_supported(creature: Creature) -> None:
+        """Raises if the engine cannot reproduce a creature's behavior.
+
+        Args:
+            creature (Creature): The creature to check.
+
+        Raises:
+            ValueError: If the creature is not a fresh Jaw Worm or Heart.
+        """
+        if type(creature) not in (JawWorm, Heart):
+            raise ValueError(
+                f"The numpy engine only supports JawWorm and Heart, got {creature.name}."
+            )
+        if creature.turns_taken != 0 or creature.prev_actions:
+            raise ValueError("The numpy engine only starts from fresh creatures.")
+        unsupported = (set(creature.statuses) - SUPPORTED_STATUSES) | (
+            set(creature.permanents) - SUPPORTED_PERMANENTS
+        )
+        if unsupported:
+            raise ValueError(
+                f"The numpy engine does not support {sorted(unsupported)} "
+                f"on {creature.name}."
+            )
+
+    def _build_move_table(self) -> None:
+        """Builds the per move arrays for the current ascension and act from
+        the compiled specs of JawWorm and Heart. Buff's escalation and the
+        statuses of debilitate, 2 weak, 2 vulnerable and 2 frail, are handled
+        in _resolve_slot_turn.
+        """
+        damage = [0] * NUM_MOVES
+        hits = [0] * NUM_MOVES
+        block = [0] * NUM_MOVES
+        strength = [0] * NUM_MOVES
+        multi_target = [False] * NUM_MOVES
+        debuff = [0] * NUM_MOVES
+        for creature_type in (JawWorm, Heart):
+            moves = creature_type.spec.current().moves
+            for action, (
+                move_damage,
+                move_hits,
+                move_block,
+                move_strength,
+                statuses,
+                move_multi_target,
+                _,
+            ) in moves.items():
+                move = MOVE_NAMES.index(action)
+                damage[move] = move_damage or 0
+                hits[move] = move_hits
+                block[move] = move_block
+                strength[move] = move_strength
+                multi_target[move] = move_multi_target
+                debuff[move] = statuses["weak"] if statuses else 0
+
+        self.move_damage = np.asarray(damage, dtype=np.int64)
+        self.move_hits = np.asarray(hits, dtype=np.int64)
+        self.move_block = np.asarray(block, dtype=np.int64)
+        self.move_strength = np.asarray(strength, dtype=np.int64)
+        self.move_multi_target = np.asarray(multi_target, dtype=bool)
+        self.move_debuff = np.asarray(debuff, dtype=np.int64)
+
+    @staticmethod
+    def _take_damage(
+        state: _BatchState, rows: t.Any, slot: t.Any, damage: t.Any
+    ) -> None:
+        """Vectorized Creature.take_damage for the given battles and slots."""
+        block = state.block[rows, slot]
+        hp = state.hp[rows, slot]
+        pierces = damage > block
+        unblocked = np.minimum(damage - block, state.invincible[rows, slot])
+        hp = np.where(pierces, np.maximum(hp - unblocked, 0), hp)
+        state.hp[rows, slot] = hp
+        state.block[rows, slot] = np.where(pierces, 0, block - damage)
+        state.alive[rows, slot] = hp > 0
+
+    def _resolve_slot_turn(self, state: _BatchState, slot: int) -> None:
+        """Resolves one creature slot's turn in every running battle where it is
+        still alive, the batched resolve_one_creature_turn.
+
+        Args:
+            state (_BatchState): The batch to advance.
+            slot (int): The acting creature's slot.
+        """
+        rows = np.flatnonzero(state.running & state.alive[:, slot])
+        if rows.size == 0:
+            return
+        is_left = slot < self.num_left
+        enemy_slots = self.right_slots if is_left else self.left_slots
+        first_enemy = enemy_slots.start
+
+        # start of turn: block is lost, except on the first turn
+        turns = state.turns[rows, slot]
+        block = np.where(turns > 0, 0, state.block[rows, slot])
+
+        # beat of death is tallied before acting
+        left_beat = state.beat[rows, self.left_slots].sum(axis=1)
+        right_beat = state.beat[rows, self.right_slots].sum(axis=1)
+        beat_damage = right_beat if is_left else np.where(left_beat > 0, right_beat, 0)
+
+        # pick and perform the move
+        prev1 = state.prev1[rows, slot]
+        move = self.intents[slot].pick(
+            state, rows, turns, prev1, state.prev2[rows, slot]
+        )
+        strength = state.strength[rows, slot]
+        damage = self.move_damage[move] + strength
+        damage = np.where(state.weak[rows, slot] > 0, (damage * 3) // 4, damage)
+        hits = self.move_hits[move]
+        state.block[rows, slot] = block + self.move_block[move]
+        strength = strength + self.move_strength[move]
+        if self.is_heart[slot]:
+            buffed = move == BUFF
+            buffs = state.buffs[rows, slot]
+            strength += np.where(buffed & (buffs == 3), 10, 0)
+            strength += np.where(buffed & (buffs > 3), 50, 0)
+            state.beat[rows, slot] += buffed & (buffs == 1)
+            state.buffs[rows, slot] = buffs + buffed
+        state.strength[rows, slot] = strength
+
+        # targets: every living enemy, or one picked uniformly among them,
+        # which moves that do not attack draw for too
+        enemy_alive = state.alive[rows, enemy_slots]
+        num_alive = enemy_alive.sum(axis=1)
+        single = np.flatnonzero(~self.move_multi_target[move])
+        choice = np.zeros(rows.size, dtype=np.int64)
+        choice[single] = (state.draw(rows[single]) * num_alive[single]).astype(np.int64)
+        chosen = np.argmax(enemy_alive.cumsum(axis=1) > choice[:, None], axis=1)
+        targeted = np.zeros_like(enemy_alive)
+        targeted[np.arange(rows.size), chosen] = True
+        targeted = np.where(
+            self.move_multi_target[move][:, None], enemy_alive, targeted
+        )
+
+        for enemy in range(targeted.shape[1]):
+            enemy_slot = first_enemy + enemy
+            # each hit lands until the target dies
+            for hit in range(int(hits.max(initial=0))):
+                hitting = (
+                    targeted[:, enemy] & (hit < hits) & state.alive[rows, enemy_slot]
+                )
+                if not hitting.any():
+                    break
+                hit_rows = rows[hitting]
+                hit_damage = damage[hitting]
+                hit_damage = np.where(
+                    state.vulnerable[hit_rows, enemy_slot] > 0,
+                    (hit_damage * 3) // 2,
+                    hit_damage,
+                )
+                self._take_damage(state, hit_rows, enemy_slot, hit_damage)
+
+            debuff = np.where(targeted[:, enemy], self.move_debuff[move], 0)
+            state.weak[rows, enemy_slot] += debuff
+            state.vulnerable[rows, enemy_slot] += debuff
+            state.frail[rows, enemy_slot] += debuff
+
+        beaten = beat_damage > 0
+        if beaten.any():
+            self._take_damage(state, rows[beaten], slot, beat_damage[beaten])
+
+        # end of turn: take_action and end_turn_resolution each count a turn
+        state.turns[rows, slot] = turns + 2
+        for statuses in (state.weak, state.vulnerable, state.frail):
+            statuses[rows, slot] = np.maximum(statuses[rows, slot] - 1, 0)
+        state.prev2[rows, slot] = prev1
+        state.prev1[rows, slot] = move
+
+    def _run_batch(
+        self, seed: int, first_battle: int, num_battles: int, result: SimulationResult
+    ) -> None:
+        """Runs one batch of battles in lockstep until all of them finish.
+
+        Args:
+            seed (int): The base seed of the run.
+            first_battle (int): The index of the batch's first battle.
+            num_battles (int): The number of battles in the batch.
+            result (SimulationResult): Where to add the finished battles.
+        """
+        state = _BatchState(self, seed, first_battle, num_battles)
+        num_rounds = 0
+        while state.running.size > 0:
+            for slot in range(self.num_slots):
+                self._resolve_slot_turn(state, slot)
+                left_dead = ~state.alive[:, self.left_slots].any(axis=1)
+                right_dead = ~state.alive[:, self.right_slots].any(axis=1)
+                finished = state.running & (left_dead | right_dead)
+                state.left_won[finished] = right_dead[finished]
+                state.running &= ~finished
+            num_rounds += 1
+
+            # set aside finished battles so later rounds only touch live ones
+            finished = ~state.running
+            num_finished = int(finished.sum())
+            result.add_totals(
+                num_finished,
+                int(state.left_won[finished].sum()),
+                (state.hp[finished] > 0).sum(axis=0),
+                state.hp[finished].sum(axis=0),
+                num_rounds * num_finished,
+            )
+            if num_finished:
+                self._add_histograms(result, state.hp[finished], num_rounds)
+            state.keep(state.running)
+
+    def _add_histograms(
+        self, result: SimulationResult, hp: t.Any, num_rounds: int
+    ) -> None:
+        """Adds the distributions of battles that finished together, as
+        bincounts over the bins of SimulationResult's histograms.
+
+        Args:
+            result (SimulationResult): Where to add the battles.
+            hp (t.Any): Remaining hp of the finished battles, battles by slots.
+            num_rounds (int): Rounds the battles took.
+        """
+
+        def add(histogram: t.Any, values: t.Any) -> None:
+            max_value = len(histogram.counts) - 1
+            histogram.add_counts(
+                np.bincount(np.clip(values, 0, max_value), minlength=max_value + 1)
+            )
+
+        for slot, histogram in enumerate(result.hp_histograms):
+            add(histogram, hp[:, slot])
+        result.turn_histogram.add(num_rounds, len(hp))
+        left_hp = hp[:, self.left_slots].sum(axis=1)
+        right_hp = hp[:, self.right_slots].sum(axis=1)
+        left_damage, right_damage = result.damage_histograms
+        add(left_damage, sum(self.start_hp[self.num_left :]) - right_hp)
+        add(right_damage, sum(self.start_hp[: self.num_left]) - left_hp)
+
+    def run(
+        self,
+        num_battles: int,
+        seed: None | int = None,
+        batch_size: int = 8192,
+        stop: None | t.Callable[[int, int], bool] = None,
+    ) -> SimulationResult:
+        """Simulates a number of battles, batch_size of them at a time.
+
+        Args:
+            num_battles (int): Number of battles to simulate.
+            seed (None | int, optional): The base seed. Battle i draws from the
+                stream (seed, i), as in Simulator.simulate. Defaults to None, a
+                seed taken from the clock.
+            batch_size (int, optional): How many battles run in lockstep.
+                Defaults to 8192.
+            stop (None | t.Callable[[int, int], bool], optional): Called after
+                each batch with (wins by left side, battles so far). Returning
+                True ends the run early. Defaults to None.
+
+        Returns:
+            SimulationResult: The totals of every battle simulated.
+        """
+        if seed is None:
+            seed = time.time_ns()
+        result = SimulationResult(self.left_names, self.right_names, self.start_hp)
+        while result.num_battles < num_battles:
+            batch_battles = min(batch_size, num_battles - result.num_battles)
+            self._run_batch(seed, result.num_battles, batch_battles, result)
+            if stop is not None and stop(result.left_wins, result.num_battles):
+                break
+        return result
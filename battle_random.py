@@ -0,0 +1,246 @@
+"""
+battle_random.py
+Contains BattleRandom, a counter based random number generator. Each battle
+draws from its own stream, keyed by (base seed, battle index), so a battle's
+outcome does not depend on which core or chunk ran it, and starting a battle
+only resets a key and a counter rather than reseeding a generator. As draw n
+of a stream is a function of (key, n), whole blocks of draws can also be
+generated at once with NumPy and read back one by one, see UniformBuffer.
+"""
+
+#########
+# Imports
+#########
+
+# Builtins
+
+import random
+import time
+
+# Customs
+
+import custom_typing as t
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore
+
+###########
+# Constants
+###########
+
+MASK_64 = (1 << 64) - 1
+GOLDEN_GAMMA = 0x9E3779B97F4A7C15
+TO_UNIT = 2.0**-53
+# Pre-generated draws per battle start at MIN_BLOCK_DRAWS and grow to cover the
+# longest stream seen, up to MAX_BLOCK_DRAWS, past which draws are computed
+# one at a time
+MIN_BLOCK_DRAWS = 8
+MAX_BLOCK_DRAWS = 512
+# Battles per refill of a UniformBuffer
+BLOCK_BATTLES = 256
+
+
+###########
+# Functions
+###########
+
+
+def mix_64(value: int) -> int:
+    """The SplitMix64 finalizer, a bijection scrambling a 64 bit integer.
+
+    Args:
+        value (int): A 64 bit integer.
+
+    Returns:
+        int: The scrambled 64 bit integer.
+    """
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK_64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK_64
+    return value ^ (value >> 31)
+
+
+def stream_key(seed: int, battle: int) -> int:
+    """Derives the key of a battle's stream from the base seed and the index
+    of the battle.
+
+    Args:
+        seed (int): The base seed of the run.
+        battle (int): The index of the battle within the run.
+
+    Returns:
+        int: The 64 bit key of the stream.
+    """
+    return mix_64((mix_64(seed & MASK_64) + battle * GOLDEN_GAMMA) & MASK_64)
+
+
+def _mix_64_array(values: t.Any) -> t.Any:
+    """mix_64 of every element of a uint64 array, which wraps like & MASK_64."""
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def uniform_block(seed: int, first_battle: int, num_battles: int, draws: int) -> t.Any:
+    """The first draws of the streams of consecutive battles, computed at once.
+    Row i, column j is what BattleRandom(seed, first_battle + i).random()
+    returns on its (j + 1)th call, bit for bit.
+
+    Args:
+        seed (int): The base seed of the run.
+        first_battle (int): The battle of the first row.
+        num_battles (int): Number of rows.
+        draws (int): Number of draws per row.
+
+    Raises:
+        ImportError: If NumPy is not installed.
+
+    Returns:
+        t.Any: A (num_battles, draws) float64 array.
+    """
+    if np is None:
+        raise ImportError("Generating blocks of draws requires numpy.")
+    battles = np.arange(first_battle, first_battle + num_battles, dtype=np.uint64)
+    keys = _mix_64_array(
+        np.uint64(mix_64(seed & MASK_64)) + battles * np.uint64(GOLDEN_GAMMA)
+    )
+    counters = np.arange(1, draws + 1, dtype=np.uint64) * np.uint64(GOLDEN_GAMMA)
+    values = _mix_64_array(keys[:, None] + counters[None, :])
+    return (values >> np.uint64(11)).astype(np.float64) * TO_UNIT
+
+
+#########
+# Classes
+#########
+
+
+class UniformBuffer:
+    __slots__ = ("block_battles", "draws", "first_battle", "rows", "seed")
+
+    def __init__(self, block_battles: int = BLOCK_BATTLES) -> None:
+        """Pre-generated draws of the streams of block_battles consecutive
+        battles at a time, refilled with uniform_block when a battle outside
+        the current block is asked for. Battle b's row holds the first draws
+        of stream (seed, b), so which block it came from does not matter.
+
+        Args:
+            block_battles (int, optional): Battles per refill.
+                Defaults to BLOCK_BATTLES.
+        """
+        self.block_battles = max(1, block_battles)
+        self.draws = MIN_BLOCK_DRAWS
+        self.seed: None | int = None
+        self.first_battle = 0
+        self.rows: t.List[t.List[float]] = []
+
+    def row(self, seed: int, battle: int) -> t.List[float]:
+        """The pre-generated first draws of the stream (seed, battle)."""
+        index = battle - self.first_battle
+        if seed != self.seed or not 0 <= index < len(self.rows):
+            self.rows = uniform_block(
+                seed, battle, self.block_battles, self.draws
+            ).tolist()
+            self.seed = seed
+            self.first_battle = battle
+            index = 0
+        return self.rows[index]
+
+    def note_draws(self, draws: int) -> None:
+        """Records that a stream took draws draws, so later refills generate
+        enough of them."""
+        if draws > self.draws:
+            self.draws = min(1 << (draws - 1).bit_length(), MAX_BLOCK_DRAWS)
+
+
+class BattleRandom(random.Random):
+    def __init__(self, seed: int = 0, battle: int = 0, block_battles: int = 0) -> None:
+        """A random.Random whose draws are mix_64(key + counter * gamma), so
+        draw n of a stream can be computed without drawing the ones before it.
+        Every method of random.Random (choices, randrange, ...) works on top.
+
+        Args:
+            seed (int, optional): The base seed of the run. Defaults to 0.
+            battle (int, optional): The index of the battle. Defaults to 0.
+            block_battles (int, optional): If positive and NumPy is installed,
+                the first draws of each stream are read from a UniformBuffer
+                refilled for this many battles at a time. The draws are the
+                same either way. Defaults to 0.
+        """
+        # pre-generated draws of the current stream, draw n at index n - 1
+        self.buffer: t.Sequence[float] = ()
+        self.uniforms: None | UniformBuffer = None
+        super().__init__(seed)
+        if block_battles > 0 and np is not None:
+            self.uniforms = UniformBuffer(block_battles)
+        self.reset(seed, battle)
+
+    def __new__(cls, *args: t.Any, **kwargs: t.Any) -> "BattleRandom":
+        # random.Random only accepts a single seed argument
+        return super().__new__(cls)
+
+    def reset(self, seed: int, battle: int) -> None:
+        """Restarts at the first draw of a battle's stream.
+
+        Args:
+            seed (int): The base seed of the run.
+            battle (int): The index of the battle within the run.
+        """
+        self.key = stream_key(seed, battle)
+        uniforms = self.uniforms
+        if uniforms is not None:
+            uniforms.note_draws(self.counter)
+            self.buffer = uniforms.row(seed, battle)
+        self.counter = 0
+
+    def seed(self, a: t.Any = None, version: int = 2) -> None:
+        """Restarts the stream of battle 0 for seed a, or for a seed from the
+        clock if a is None, like random.seed.
+        """
+        self.reset(time.time_ns() if a is None else a, 0)
+
+    def random(self) -> float:
+        # mix_64 inlined, this is the hottest call of a battle
+        self.counter = counter = self.counter + 1
+        try:
+            return self.buffer[counter - 1]
+        except IndexError:
+            pass
+        value = (self.key + counter * GOLDEN_GAMMA) & MASK_64
+        value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK_64
+        value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK_64
+        return ((value ^ (value >> 31)) >> 11) * TO_UNIT
+
+    def getrandbits(self, k: int) -> int:
+        bits = 0
+        for shift in range(0, k, 64):
+            self.counter += 1
+            bits |= mix_64((self.key + self.counter * GOLDEN_GAMMA) & MASK_64) << shift
+        return bits & ((1 << k) - 1)
+
+    def getstate(self) -> t.Tuple[int, int]:
+        return self.key, self.counter
+
+    def setstate(self, state: t.Tuple[int, int]) -> None:
+        key, self.counter = state
+        if key != self.key:
+            self.buffer = ()
+        self.key = key
+
+
+class GlobalRandom:
+    """Draws from the random module's shared generator, so random.seed applies.
+    Copies and pickles of it resolve back to GLOBAL_RANDOM.
+    """
+
+    __slots__ = ()
+
+    choices = staticmethod(random.choices)
+    # last, as it shadows the module within the class body
+    random = staticmethod(random.random)
+
+    def __reduce__(self) -> str:
+        return "GLOBAL_RANDOM"
+
+
+GLOBAL_RANDOM = GlobalRandom()
@@ -0,0 +1,244 @@
+"""
+battle_records.py
+Contains BattleRecords, a preallocated columnar file holding the outcome of
+every battle of a run: row i is battle i of the run with the base seed in the
+header, Simulator.replay(i, seed=records.seed) plays it again. Each field is one fixed dtype column
+stored contiguously, so workers write their chunk's rows straight into the
+memory-mapped file instead of sending them back through the pool, and the
+columns load back as NumPy arrays without copying.
+
+Rows are appended a chunk at a time, in whatever order the chunks finish, and
+a resumed run carries on filling the same file. The file cannot grow past the
+battles it was created for though: keeping each column contiguous is what
+makes the zero copy load possible, so a longer run needs a new file.
+
+Zachary McCullough
+"""
+
+#########
+# Imports
+#########
+
+# Builtins
+
+from array import array
+import mmap
+import struct
+
+# Customs
+
+from battle_random import MASK_64
+import custom_typing as t
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore
+
+
+###########
+# Constants
+###########
+
+MAGIC = b"STSBREC2"
+# magic, number of battles, number of slots, base seed
+HEADER = struct.Struct("<8sQQQ")
+# columns start on cache line boundaries
+ALIGNMENT = 64
+
+# name, array typecode, values per battle (0 means one per slot)
+COLUMNS = (
+    ("winner", "b", 1),  # 1 if the left side won, 0 if not, -1 if not yet run
+    ("turns", "I", 1),  # rounds the battle took
+    ("actions", "I", 1),  # actions taken, summed over creatures
+    ("hp", "i", 0),  # remaining hp of every slot, left creatures first
+)
+NOT_RUN = -1
+
+
+#########
+# Classes
+#########
+
+
+class BattleRecords:
+    def __init__(self, path: str) -> None:
+        """Opens an existing records file, see create.
+
+        Args:
+            path (str): The records file.
+
+        Raises:
+            ValueError: If the file is not a records file.
+        """
+        self.path = path
+        with open(path, "rb") as file:
+            magic, num_battles, num_slots, seed = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a battle records file.")
+        self.num_battles = num_battles
+        self.num_slots = num_slots
+        self.seed = seed
+        # name -> (byte offset, typecode, values per battle)
+        self.layout: t.Dict[str, t.Tuple[int, str, int]] = {}
+        offset = ALIGNMENT
+        for name, typecode, width in COLUMNS:
+            width = width or num_slots
+            self.layout[name] = (offset, typecode, width)
+            size = num_battles * width * array(typecode).itemsize
+            offset += -(-size // ALIGNMENT) * ALIGNMENT
+        self.size = offset
+
+    @classmethod
+    def create(
+        cls, path: str, num_battles: int, num_slots: int, seed: int
+    ) -> "BattleRecords":
+        """Preallocates a records file for battles 0 to num_battles - 1 of a
+        run, every battle marked as not yet run.
+
+        Args:
+            path (str): Where to write the file. Overwritten if it exists.
+            num_battles (int): Number of battles in the run.
+            num_slots (int): Number of creatures in each battle.
+            seed (int): The base seed of the run.
+
+        Returns:
+            BattleRecords: The opened file.
+        """
+        with open(path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, num_battles, num_slots, seed & MASK_64))
+        records = cls(path)
+        with open(path, "r+b") as file:
+            file.truncate(records.size)
+            offset = records.layout["winner"][0]
+            file.seek(offset)
+            file.write(array("b", [NOT_RUN]).tobytes() * num_battles)
+        return records
+
+    def __reduce__(self) -> t.Tuple[t.Any, ...]:
+        # Workers reopen the file by path rather than receiving its contents
+        return type(self), (self.path,)
+
+    def writer(self, first_battle: int) -> "RecordWriter":
+        """Starts collecting the rows of battles first_battle onwards, to be
+        written in one go by RecordWriter.flush.
+        """
+        return RecordWriter(self, first_battle)
+
+    def write_columns(
+        self, first_battle: int, num_battles: int, columns: t.Dict[str, array]
+    ) -> None:
+        """Writes the rows of consecutive battles into the mapped file.
+
+        Args:
+            first_battle (int): The battle of the first row.
+            num_battles (int): Number of rows.
+            columns (t.Dict[str, array]): The values of every column, rows
+                one after another.
+
+        Raises:
+            ValueError: If the rows are past the end of the file, or a column
+                has the wrong typecode or number of values.
+        """
+        if first_battle < 0 or first_battle + num_battles > self.num_battles:
+            raise ValueError(
+                f"Battles {first_battle} to {first_battle + num_battles - 1} "
+                f"are outside the {self.num_battles} battles of {self.path}."
+            )
+        with open(self.path, "r+b") as file, mmap.mmap(file.fileno(), 0) as mapped:
+            for name, values in columns.items():
+                offset, typecode, width = self.layout[name]
+                if values.typecode != typecode or len(values) != num_battles * width:
+                    raise ValueError(
+                        f"Column {name} takes {num_battles * width} values of "
+                        f"typecode {typecode}, got {len(values)} of {values.typecode}."
+                    )
+                itemsize = values.itemsize
+                start = offset + first_battle * width * itemsize
+                mapped[start : start + len(values) * itemsize] = values.tobytes()
+
+    def load(self) -> t.Dict[str, t.Any]:
+        """Maps every column as a read only NumPy array, without copying.
+
+        Raises:
+            ImportError: If NumPy is not installed.
+
+        Returns:
+            t.Dict[str, t.Any]: Column name -> array with one row per battle.
+                "hp" has one column per slot.
+        """
+        if np is None:
+            raise ImportError("Loading battle records requires numpy.")
+        columns = {}
+        for name, (offset, typecode, width) in self.layout.items():
+            shape = (self.num_battles, width) if name == "hp" else (self.num_battles,)
+            columns[name] = np.memmap(
+                self.path,
+                dtype=np.dtype(typecode),
+                mode="r",
+                offset=offset,
+                shape=shape,
+            )
+        return columns
+
+
+class RecordWriter:
+    __slots__ = ("columns", "first_battle", "num_battles", "records")
+
+    def __init__(self, records: BattleRecords, first_battle: int) -> None:
+        """Buffers the rows of a chunk of consecutive battles, see
+        BattleRecords.writer.
+
+        Args:
+            records (BattleRecords): The file to write to.
+            first_battle (int): The battle of the first row.
+        """
+        self.records = records
+        self.first_battle = first_battle
+        self.num_battles = 0
+        self.columns = {name: array(typecode) for name, typecode, _ in COLUMNS}
+
+    def add(
+        self,
+        battle: int,
+        left_won: bool,
+        turns: int,
+        actions: int,
+        creatures: t.List[t.Any],
+    ) -> None:
+        """Adds the row of the next battle.
+
+        Args:
+            battle (int): The index of the battle, the one after the last row
+                added.
+            left_won (bool): Whether the left side won.
+            turns (int): Rounds the battle took.
+            actions (int): Actions taken over every creature.
+            creatures (t.List[t.Any]): The creatures at the end of the battle,
+                left creatures first.
+
+        Raises:
+            ValueError: If battle does not follow the last row added.
+        """
+        if battle != self.first_battle + self.num_battles:
+            raise ValueError(
+                f"Expected battle {self.first_battle + self.num_battles}, "
+                f"got {battle}."
+            )
+        columns = self.columns
+        columns["winner"].append(int(bool(left_won)))
+        columns["turns"].append(turns)
+        columns["actions"].append(actions)
+        columns["hp"].extend([creature.hp for creature in creatures])
+        self.num_battles += 1
+
+    def flush(self) -> None:
+        """Writes the buffered rows to the file and starts the next chunk
+        where they ended."""
+        if self.num_battles:
+            self.records.write_columns(
+                self.first_battle, self.num_battles, self.columns
+            )
+        self.first_battle += self.num_battles
+        self.num_battles = 0
+        self.columns = {name: array(typecode) for name, typecode, _ in COLUMNS}
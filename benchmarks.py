@@ -0,0 +1,232 @@
+"""
+benchmarks.py
+Benchmarks of the combat engine: microbenchmarks of the hot methods, timed per
+call, and macrobenchmarks of battles per second for teams of Jaw Worms against
+a Heart on a range of core counts. Results are written as JSON and can be
+compared against a stored baseline, e.g.
+
+    python benchmarks.py --output baseline.json
+    (make a change)
+    python benchmarks.py --baseline baseline.json
+
+exits with status 1 if any benchmark got slower than the tolerance allows.
+
+Zachary McCullough
+"""
+
+#########
+# Imports
+#########
+
+# Builtins
+
+import argparse
+import copy
+import datetime
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import timeit
+
+# Customs
+
+from attack import Attack
+from game_config import settings
+from game_status import state
+from heart import Heart
+from jaw_worm import JawWorm
+from simulator import Simulator
+import custom_typing as t
+
+###########
+# Constants
+###########
+
+# Battles per macrobenchmark, per team size, at --scale 1
+MACRO_BATTLES = {1: 20_000, 6: 2_000, 50: 200}
+NS_PER_CALL = "ns/call"
+BATTLES_PER_SECOND = "battles/s"
+
+
+###########
+# Functions
+###########
+
+
+def time_per_call(
+    func: t.Callable[[], t.Any], seconds: float = 0.2, repeat: int = 3
+) -> float:
+    """Times func, keeping the best of repeat runs of about seconds each.
+
+    Args:
+        func (t.Callable[[], t.Any]): What to time.
+        seconds (float, optional): Duration of each run. Defaults to 0.2.
+        repeat (int, optional): Number of runs. Defaults to 3.
+
+    Returns:
+        float: Nanoseconds per call.
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= seconds / 10:
+            break
+        number *= 10
+    number = max(1, int(number * seconds / elapsed))
+    best = min(timer.repeat(repeat, number))
+    return best / number * 1e9
+
+
+def micro_benchmarks(seconds: float = 0.2) -> t.Dict[str, t.Dict[str, t.Any]]:
+    """Times the methods every creature turn goes through.
+
+    Args:
+        seconds (float, optional): Duration of each timing run.
+            Defaults to 0.2.
+
+    Returns:
+        t.Dict[str, t.Dict[str, t.Any]]: Benchmark name -> {"unit", "value"}.
+    """
+    # hp high enough to take hits for the whole benchmark
+    target = JawWorm(hp=10**15)
+    hit = Attack(damage=11)
+
+    worm = JawWorm()
+    worm.remember_action("chomp")
+    heart = Heart()
+    heart.turns_taken = 2
+    heart.remember_action("debilitate")
+
+    battle = Simulator([JawWorm() for _ in range(6)], [Heart()])
+
+    benchmarks = {
+        "take_hit": lambda: target.take_hit(hit),
+        "take_damage": lambda: target.take_damage(11),
+        "jaw_worm_pick_action": worm.pick_action,
+        "heart_pick_action": heart.pick_action,
+        "attack": lambda: Attack(damage=11, hits=2, creature=worm),
+        "deepcopy_simulator": lambda: copy.deepcopy(battle),
+    }
+    return {
+        f"micro.{name}": {
+            "unit": NS_PER_CALL,
+            "value": time_per_call(func, seconds),
+        }
+        for name, func in benchmarks.items()
+    }
+
+
+def macro_benchmarks(
+    team_sizes: t.List[int], cores: t.List[int], scale: float = 1.0
+) -> t.Dict[str, t.Dict[str, t.Any]]:
+    """Measures battles per second of Simulator.simulate, including the
+    process pool's startup with more than one core.
+
+    Args:
+        team_sizes (t.List[int]): Numbers of Jaw Worms to pit against a Heart.
+        cores (t.List[int]): Core counts to run each team size on.
+        scale (float, optional): Multiplies the number of battles run.
+            Defaults to 1.0.
+
+    Returns:
+        t.Dict[str, t.Dict[str, t.Any]]: Benchmark name -> {"unit", "value"}.
+    """
+    results = {}
+    for size in team_sizes:
+        num_battles = max(1, int(MACRO_BATTLES.get(size, 200) * scale))
+        for num_cores in cores:
+            simulator = Simulator([JawWorm() for _ in range(size)], [Heart()])
+            start = time.perf_counter()
+            simulator.simulate(num_battles=num_battles, num_cores=num_cores, seed=0)
+            elapsed = time.perf_counter() - start
+            results[f"macro.worms_{size}.cores_{num_cores}"] = {
+                "unit": BATTLES_PER_SECOND,
+                "value": num_battles / elapsed,
+            }
+    return results
+
+
+def compare(
+    results: t.Dict[str, t.Any], baseline: t.Dict[str, t.Any], tolerance: float = 0.1
+) -> t.List[t.Tuple[str, float, bool]]:
+    """Compares the benchmarks present in both results.
+
+    Args:
+        results (t.Dict[str, t.Any]): The "benchmarks" of a run.
+        baseline (t.Dict[str, t.Any]): The "benchmarks" to compare against.
+        tolerance (float, optional): Slowdown allowed before a benchmark
+            counts as a regression, 0.1 being 10%. Defaults to 0.1.
+
+    Returns:
+        t.List[t.Tuple[str, float, bool]]: (name, speedup over the baseline,
+            whether it regressed) per benchmark, speedups above 1 being faster.
+    """
+    rows = []
+    for name in sorted(results.keys() & baseline.keys()):
+        new, old = results[name]["value"], baseline[name]["value"]
+        if results[name]["unit"] == NS_PER_CALL:
+            speedup = old / new
+        else:
+            speedup = new / old
+        rows.append((name, speedup, speedup < 1 - tolerance))
+    return rows
+
+
+def main(argv: None | t.List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", help="Where to write the results as JSON.")
+    parser.add_argument("--baseline", help="Results JSON to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--team-sizes", type=int, nargs="+", default=[1, 6, 50])
+    parser.add_argument("--cores", type=int, nargs="+", default=None)
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seconds", type=float, default=0.2)
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--skip-macro", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.CRITICAL)
+    settings.ascension = 20
+    state.act = 3
+    cores = args.cores or sorted(set([1, os.cpu_count() or 1]))
+
+    benchmarks: t.Dict[str, t.Dict[str, t.Any]] = {}
+    if not args.skip_micro:
+        benchmarks.update(micro_benchmarks(args.seconds))
+    if not args.skip_macro:
+        benchmarks.update(macro_benchmarks(args.team_sizes, cores, args.scale))
+    results = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "benchmarks": benchmarks,
+    }
+
+    for name, benchmark in benchmarks.items():
+        print(f"{name:<40} {benchmark['value']:>14.1f} {benchmark['unit']}")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline is None:
+        return 0
+    with open(args.baseline) as file:
+        baseline = json.load(file)["benchmarks"]
+    regressed = False
+    print(f"\nCompared to {args.baseline}:")
+    for name, speedup, is_regression in compare(benchmarks, baseline, args.tolerance):
+        regressed |= is_regression
+        flag = "  REGRESSION" if is_regression else ""
+        print(f"{name:<40} {speedup:>8.2f}x{flag}")
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
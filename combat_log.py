@@ -0,0 +1,212 @@
+"""
+combat_log.py
+Contains CombatRecorder, which records what happens in battles as fixed size
+binary records, and the decoder that turns those records back into a human
+readable combat log. Recording only costs anything while a recorder is
+installed with Simulator.use_recorder.
+
+Zachary McCullough
+"""
+
+#########
+# Imports
+#########
+
+# Builtins
+
+import struct
+
+# Customs
+
+import custom_typing as t
+
+###########
+# Constants
+###########
+
+# turn, event, actor slot, target slot, code, value, blocked, hp after
+RECORD = struct.Struct("<HBBBBiii")
+
+# Events. Slots number the left creatures first, then the right ones.
+BATTLE_START = 0  # value: battle index
+ACTION = 1  # code: index of the action in the actor's spec.move_names
+HIT = 2  # value: hp lost by target, blocked: block lost by target
+RETALIATION = 3  # thorns and the like, actor is the creature that was hit
+STATUS = 4  # code: index in STATUS_NAMES, value: amount, or -1 if valueless
+BEAT_OF_DEATH = 5  # target takes beat of death damage, as in HIT
+BATTLE_END = 6  # code: 1 if the left side won
+
+NO_SLOT = 255
+
+# The codes of STATUS records. Modifier ids depend on the order a process met
+# the names in, these do not, so saved logs render anywhere. Only ever append.
+STATUS_NAMES = (
+    "frail",
+    "regeneration",
+    "vulnerable",
+    "weak",
+    "artifact",
+    "beat_of_death",
+    "buffer",
+    "dexterity",
+    "strength",
+)
+STATUS_CODES = {name: code for code, name in enumerate(STATUS_NAMES)}
+
+
+#########
+# Classes
+#########
+
+
+class CombatRecorder:
+    __slots__ = ("buffer", "slots")
+
+    def __init__(self) -> None:
+        """Collects the records of every battle run while it is installed. The
+        records live in buffer, a bytearray that can be written to a file as
+        is.
+        """
+        self.buffer = bytearray()
+        self.slots: t.Dict[int, int] = {}
+
+    def attach(self, creatures: t.List[t.Any]) -> None:
+        """Numbers the creatures of the battles to record, left side first.
+
+        Args:
+            creatures (t.List[t.Any]): Left creatures followed by right ones.
+        """
+        self.slots = {id(creature): slot for slot, creature in enumerate(creatures)}
+
+    def slot(self, creature: t.Any) -> int:
+        return self.slots.get(id(creature), NO_SLOT)
+
+    def record(
+        self,
+        event: int,
+        turn: int = 0,
+        actor: int = NO_SLOT,
+        target: int = NO_SLOT,
+        code: int = 0,
+        value: int = 0,
+        blocked: int = 0,
+        hp: int = 0,
+    ) -> None:
+        self.buffer += RECORD.pack(
+            turn & 0xFFFF, event, actor, target, code, value, blocked, hp
+        )
+
+    def action(self, turn: int, creature: t.Any, action: str) -> None:
+        self.record(
+            ACTION,
+            turn,
+            self.slot(creature),
+            code=creature.spec.move_names.index(action),
+            hp=creature.hp,
+        )
+
+    def damage(
+        self,
+        event: int,
+        turn: int,
+        actor: t.Any,
+        target: t.Any,
+        hp_before: int,
+        block_before: int,
+    ) -> None:
+        self.record(
+            event,
+            turn,
+            self.slot(actor),
+            self.slot(target),
+            value=hp_before - target.hp,
+            blocked=block_before - target.block,
+            hp=target.hp,
+        )
+
+    def status(
+        self, turn: int, actor: t.Any, target: t.Any, status: str, value: t.Any
+    ) -> None:
+        code = STATUS_CODES.get(status)
+        if code is None:
+            raise ValueError(f"{status} has no code in STATUS_NAMES to log it by.")
+        self.record(
+            STATUS,
+            turn,
+            self.slot(actor),
+            self.slot(target),
+            code=code,
+            value=value if isinstance(value, int) else -1,
+        )
+
+
+###########
+# Functions
+###########
+
+
+def decode(
+    buffer: bytes | bytearray,
+) -> t.Iterator[t.Tuple[int, int, int, int, int, int, int, int]]:
+    """Yields every record of a log.
+
+    Args:
+        buffer (bytes | bytearray): The records, e.g. CombatRecorder.buffer.
+
+    Yields:
+        t.Tuple[int, int, int, int, int, int, int, int]: (turn, event, actor,
+            target, code, value, blocked, hp after)
+    """
+    return RECORD.iter_unpack(buffer)  # type: ignore
+
+
+def render(
+    buffer: bytes | bytearray, creatures: t.List[t.Any], battle: None | int = None
+) -> str:
+    """Renders a log as text, one line per record.
+
+    Args:
+        buffer (bytes | bytearray): The records, e.g. CombatRecorder.buffer.
+        creatures (t.List[t.Any]): The creatures the log was recorded with,
+            left side first, for their names and actions.
+        battle (None | int, optional): Only render this battle index.
+            Defaults to None, all battles.
+
+    Returns:
+        str: The readable combat log.
+    """
+    names = [f"{creature.name} {slot}" for slot, creature in enumerate(creatures)]
+    names += [""] * (NO_SLOT + 1 - len(names))
+    lines: t.List[str] = []
+    current_battle = None
+    for turn, event, actor, target, code, value, blocked, hp in decode(buffer):
+        if event == BATTLE_START:
+            current_battle = value
+        if battle is not None and current_battle != battle:
+            continue
+        prefix = f"Turn {turn}: "
+        if event == BATTLE_START:
+            lines.append(f"Battle {value}")
+        elif event == ACTION:
+            action = creatures[actor].spec.move_names[code]
+            lines.append(f"{prefix}{names[actor]} ({hp} hp) uses {action}")
+        elif event in (HIT, RETALIATION):
+            verb = "hits" if event == HIT else "retaliates against"
+            lines.append(
+                f"{prefix}{names[actor]} {verb} {names[target]} for {value} "
+                f"damage ({blocked} blocked), {hp} hp left"
+            )
+        elif event == STATUS:
+            amount = "" if value == -1 else f" {value}"
+            lines.append(
+                f"{prefix}{names[actor]} applies{amount} {STATUS_NAMES[code]} "
+                f"to {names[target]}"
+            )
+        elif event == BEAT_OF_DEATH:
+            lines.append(
+                f"{prefix}{names[target]} takes {value} beat of death damage "
+                f"({blocked} blocked), {hp} hp left"
+            )
+        elif event == BATTLE_END:
+            lines.append(f"{prefix}{'left' if code else 'right'} side won")
+    return "\n".join(lines)
@@ -1,7 +1,9 @@
 """
 creature.py
 Contains the creature class which is the core class to be inherited by specific
-creatures, e.g. the Heart and Jaw Worm.
+creatures, e.g. the Heart and Jaw Worm. What a creature does is described by
+its spec, see creature_spec, and every move of the spec is also a method of the
+creature, e.g. JawWorm.chomp.
 """
 
 #########
@@ -15,10 +17,26 @@ import logging
 import math
 
 # Customs
+from attack import Attack
+from battle_random import GLOBAL_RANDOM
+from creature_spec import CreatureSpec
 import custom_typing as t
 import game_constants
+from game_config import settings
 
-from modifier_dict import Statuses, Permanents
+from modifier_dict import Statuses, Permanents, modifier_bit, modifier_id
+
+# Presence bits of the modifiers checked every hit and every turn
+BARRICADE = modifier_bit("barricade")
+BLUR = modifier_bit("blur")
+BUFFER = modifier_bit("buffer")
+FLAME_BARRIER = modifier_bit("flame_barrier")
+INTANGIBLE = modifier_bit("intangible")
+INVINCIBLE = modifier_bit("invincible")
+REGENERATION = modifier_bit("regeneration")
+THORNS = modifier_bit("thorns")
+VULNERABLE = modifier_bit("vulnerable")
+POISON_ID = modifier_id("poison")
 
 
 #########
@@ -26,66 +44,117 @@ from modifier_dict import Statuses, Permanents
 #########
 
 
+class ModifierAttribute:
+    __slots__ = ("bit", "idx", "is_status", "name")
+
+    def __init__(self, name: str, is_status: bool) -> None:
+        """A descriptor exposing one status or permanent as an attribute of a
+        creature, e.g. creature.strength reads creature.permanents["strength"].
+
+        Args:
+            name (str): The modifier's name, from game_constants.
+            is_status (bool): True for a status, False for a permanent.
+        """
+        self.name = name
+        self.is_status = is_status
+        self.idx = modifier_id(name)
+        self.bit = 1 << self.idx
+
+    def __get__(self, creature: "Creature | None", owner: t.Any = None) -> t.Any:
+        if creature is None:
+            return self
+        modifiers = creature.statuses if self.is_status else creature.permanents
+        if modifiers.mask & self.bit:
+            return modifiers.vector[self.idx]
+        return modifiers.default_val
+
+    def __set__(self, creature: "Creature", value: t.Any) -> None:
+        if self.is_status:
+            creature.statuses.set_id(self.idx, value)
+        else:
+            creature.permanents.set_id(self.idx, value)
+
+
+def _move_method(action: str) -> t.Callable[..., Attack]:
+    def move(self: "Creature", **kw: t.Any) -> Attack:
+        return self.perform(action)
+
+    move.__name__ = move.__qualname__ = action
+    move.__doc__ = f"Performs {action}, see Creature.perform."
+    return move
+
+
 class Creature:
+    __slots__ = (
+        "alive",
+        "cur_block",
+        "current_turn_taken_damage",
+        "intent_state",
+        "max_hp",
+        "permanents",
+        "prev_actions",
+        "raw_hp",
+        "rng",
+        "statuses",
+        "turns_taken",
+    )
+
+    # What the creature does, shared by every instance. Subclasses set it.
+    spec: None | CreatureSpec = None
+
+    # How many of the latest prev_actions pick_action looks at, None for all.
+    # Older ones can be dropped without changing how the creature behaves.
+    action_memory: None | int = None
+
+    def __init_subclass__(cls, **kwargs: t.Any) -> None:
+        """Gives subclasses with a spec a method per move, and the action
+        memory of their intent rules."""
+        super().__init_subclass__(**kwargs)
+        spec = cls.spec
+        if spec is None:
+            return
+        if "action_memory" not in vars(cls):
+            cls.action_memory = spec.intents.action_memory
+        for action in spec.move_names:
+            if action in vars(cls):
+                continue
+            if hasattr(cls, action):
+                raise ValueError(
+                    f"The move {action} of {cls.__name__} shadows an attribute."
+                )
+            setattr(cls, action, _move_method(action))
+
     def __init__(
         self,
         hp: int | None = None,
         cur_block: int | None = None,
         statuses: dict[str, t.Any] = {},
         permanents: dict[str, t.Any] = {},
-        action_dict: dict[str, t.Callable[[], "Attack"]] = {},
     ) -> None:
+        compiled = None if self.spec is None else self.spec.current()
+        if compiled is not None:
+            if hp is None:
+                hp = compiled.hp
+            permanents = {**compiled.permanents, **permanents}
         self.raw_hp, self.cur_block = hp, cur_block
         self.max_hp = hp
         self.statuses = Statuses(statuses)
         self.permanents = Permanents(permanents)
-        self.action_dict = action_dict
         self.turns_taken = 0
         self.alive = True if hp is not None and hp > 0 else False
 
         self.current_turn_taken_damage = 0
 
         self.prev_actions: list[t.Any] = []
+        # the latest moves the intent rules look at, see CreatureSpec.next_state
+        self.intent_state = 0
 
-    def __getattr__(self, attr: str) -> t.Any:  # type: ignore
-        """Modified getattr
-
-        Args:
-            attr (str): _description_
+        # where pick_action draws from, see Simulator.use_rng
+        self.rng: t.Any = GLOBAL_RANDOM
 
-        Returns:
-            t.Any: _description_
-        """
-        try:
-            return getattr(super, attr)
-        except AttributeError:
-            # Creatively check if they exist, and if they should exist,
-            # define them and return. This works because everything in the game
-            # should be in game_constants.
-
-            # priority is in subclass, then creature, then permanents,
-            # then statuses, so in case of name conflict that's how it's resolved
-            # (but ideally should never happen!)
-            # if attr in self.permanents:
-            #     print('245')
-            #     return self.permanents[attr]
-            if attr in game_constants.ALL_PERMANENTS:
-                # self.permanents.data[attr] = None
-                return self.permanents[attr]
-            elif attr in game_constants.ALL_STATUSES:
-                return self.statuses[attr]
-            raise
-
-    def __setattr__(self, __name: str, __value: t.Any) -> None:
-        if __name in game_constants.ALL_PERMANENTS:
-            self.permanents[__name] = __value
-            return
-        elif __name in game_constants.ALL_STATUSES:
-            self.statuses[__name] = __value
-            return
-        else:
-            super().__setattr__(__name, __value)
-            return
+        if compiled is not None:
+            for action in compiled.spawn_moves:
+                self.perform(action)
 
     def __contains__(self, item: t.Any) -> bool:
         return item in self.permanents or item in self.statuses
@@ -119,7 +188,7 @@ class Creature:
 
     @hp.setter
     def hp(self, other: int) -> None:
-        if "buffer" in self.permanents:
+        if self.permanents.mask & BUFFER:
             self.buffer -= 1
             return
         self.raw_hp = other
@@ -135,24 +204,132 @@ class Creature:
     def block(self, other: int) -> None:
         self.cur_block = other
 
-    @staticmethod
-    def adjust_possible_actions(
-        action_list: t.List[str],
-        actions_to_remove: t.List[str],
-        weights: None | t.List[float] = None,
-    ) -> None:
-        if len(actions_to_remove) > 0:
-            for action in actions_to_remove:
-                action_idx = action_list.index(action)
-                action_list.pop(action_idx)
-                if weights is not None:
-                    weights.pop(action_idx)
-                    # redo probabilities
-            if weights is not None:
-                weights = [x / sum(weights) for x in weights]
+    def _missing_spec(self) -> t.NoReturn:
+        raise NotImplementedError(
+            f"{type(self).__name__} has no spec to act from, subclasses set one."
+        )
 
     def pick_action(self) -> str:
-        return next(iter(self.action_dict))
+        """Picks this turn's action by the intent rules of the spec, see
+        creature_spec.IntentSpec. Draws from rng at most once.
+
+        Raises:
+            NotImplementedError: If the creature has no spec.
+
+        Returns:
+            str: Chosen action string.
+        """
+        spec = self.spec
+        if spec is None:
+            self._missing_spec()
+        return spec.current().pick_action(self.turns_taken, self.intent_state, self.rng)
+
+    def intent_weights(self) -> t.Tuple[t.List[str], t.List[float]]:
+        """The actions pick_action chooses between this turn and their relative
+        weights, without drawing from rng.
+
+        Raises:
+            NotImplementedError: If the creature has no spec.
+
+        Returns:
+            t.Tuple[t.List[str], t.List[float]]: (actions, weights)
+        """
+        spec = self.spec
+        if spec is None:
+            self._missing_spec()
+        return spec.current().intent_weights(self.turns_taken, self.intent_state)
+
+    def perform(self, action: str) -> Attack:
+        """Performs a move from the spec's move table for the current
+        ascension, without counting it as a turn.
+
+        Args:
+            action (str): The name of the move.
+
+        Raises:
+            NotImplementedError: If the creature has no spec.
+
+        Returns:
+            Attack: The resulting attack.
+        """
+        spec = self.spec
+        if spec is None:
+            self._missing_spec()
+        (
+            damage,
+            hits,
+            block,
+            strength,
+            statuses,
+            multi_target,
+            effect,
+        ) = spec.current().moves[action]
+        if block:
+            self.block += block
+        if strength:
+            self.strength += strength
+        if effect is not None:
+            getattr(self, effect)()
+        return Attack(
+            damage=None if damage is None else damage + self.strength,
+            hits=hits,
+            statuses=None if statuses is None else dict(statuses),
+            multi_target=multi_target,
+            creature=self,
+        )
+
+    def snapshot(self, canonical: bool = False) -> t.Tuple[t.Any, ...]:
+        """Captures the mutable battle state of the creature as a flat tuple.
+        Cheap to take, and meant to be handed back to reset later on.
+
+        Args:
+            canonical (bool, optional): Keep only the action_memory latest
+                prev_actions, so states that behave the same compare equal.
+                Defaults to False.
+
+        Returns:
+            t.Tuple[t.Any, ...]: The flat state of the creature.
+        """
+        prev_actions = self.prev_actions
+        if canonical and self.action_memory is not None:
+            prev_actions = prev_actions[
+                max(0, len(prev_actions) - self.action_memory) :
+            ]
+        return (
+            self.raw_hp,
+            self.cur_block,
+            self.max_hp,
+            self.alive,
+            self.turns_taken,
+            self.current_turn_taken_damage,
+            self.statuses.snapshot(),
+            self.permanents.snapshot(),
+            tuple(prev_actions),
+            self.intent_state,
+        )
+
+    def reset(self, snapshot: t.Tuple[t.Any, ...]) -> None:
+        """Restores the creature in place to a state captured by snapshot.
+        No new containers are allocated, the existing ones are refilled.
+
+        Args:
+            snapshot (t.Tuple[t.Any, ...]): A state returned by snapshot.
+        """
+        (
+            self.raw_hp,
+            self.cur_block,
+            self.max_hp,
+            self.alive,
+            self.turns_taken,
+            self.current_turn_taken_damage,
+            statuses,
+            permanents,
+            prev_actions,
+            self.intent_state,
+        ) = snapshot
+        self.statuses.reset(statuses)
+        self.permanents.reset(permanents)
+        self.prev_actions[:] = prev_actions
 
     def take_hit(self, attack: "Attack") -> int:
         """_summary_
@@ -164,17 +341,19 @@ class Creature:
             int: _description_
         """
         damage_to_apply = attack.damage
-        if "vulnerable" in self.statuses:
+        status_mask = self.statuses.mask
+        if status_mask & VULNERABLE:
             damage_to_apply = math.floor(damage_to_apply * 1.5)
 
-        if "intangible" in self.statuses:
+        if status_mask & INTANGIBLE:
             damage_to_apply = min(damage_to_apply, 1)
 
         outgoing_damage = 0
         self.take_damage(damage_to_apply)
-        if "thorns" in self.permanents:
+        permanent_mask = self.permanents.mask
+        if permanent_mask & THORNS:
             outgoing_damage += self.permanents.thorns
-        if "flame_barrier" in self.permanents:
+        if permanent_mask & FLAME_BARRIER:
             outgoing_damage += self.permanents.flame_barrier
 
         return outgoing_damage
@@ -183,7 +362,7 @@ class Creature:
         if damage > self.block:
             damage = damage - self.block
             if (
-                "invincible" in self.permanents
+                self.permanents.mask & INVINCIBLE
                 and self.current_turn_taken_damage + damage > self.permanents.invincible
             ):
                 damage = self.permanents.invincible - self.current_turn_taken_damage
@@ -191,13 +370,16 @@ class Creature:
             self.hp -= damage
         else:
             self.block -= damage
-        logging.debug(f"{self} took {damage} damage. HP={self.hp}, Block={self.block}.")
+        if settings.trace:
+            logging.debug(
+                f"{self} took {damage} damage. HP={self.hp}, Block={self.block}."
+            )
 
     def start_turn_resolution(self) -> bool:
         # on first turn don't resolve start of turn effects
         if self.turns_taken == 0:
             return self.alive
-        if "blur" not in self.statuses and "barricade" not in self.permanents:
+        if not self.statuses.mask & BLUR and not self.permanents.mask & BARRICADE:
             self.cur_block = 0
 
         return self.alive
@@ -212,29 +394,61 @@ class Creature:
         Returns:
             bool: True if the creature is still alive, False otherwise.
         """
-        if "regeneration" in self.statuses:
+        if self.statuses.mask & REGENERATION:
             self.hp = min(self.hp + self.statuses.regeneration, self.max_hp)
 
         self.turns_taken += 1
 
-        # make copy of statuses and then iterate over them
+        # ids() reads the mask up front, so statuses can change while iterating
         # -1 deletes keys that hit 0.
-        for status in list(self.statuses.keys()):
-            value = self.statuses[status]
-            if status == "poison":
+        statuses = self.statuses
+        for idx in statuses.ids():
+            value = statuses.vector[idx]
+            if idx == POISON_ID:
                 self.hp -= value
             if isinstance(value, int):
-                self.statuses[status] -= 1
+                statuses.set_id(idx, value - 1)
         return self.alive
 
-    def take_action(self) -> "Attack":
-        action = self.pick_action()
-        logging.info(f"{self} took action {action}.")
-        attack = self.action_dict[action]()
+    def take_action(self, action: None | str = None) -> Attack:
+        """Picks and performs this turn's action.
+
+        Args:
+            action (None | str, optional): The action to perform instead of
+                calling pick_action. Defaults to None.
+
+        Returns:
+            Attack: The resulting attack.
+        """
+        if action is None:
+            action = self.pick_action()
+        if settings.trace:
+            logging.info(f"{self} took action {action}.")
+        attack = self.perform(action)
         self.turns_taken += 1
-        self.prev_actions.append(action)
+        self.remember_action(action)
         return attack
 
+    def remember_action(self, action: str) -> None:
+        """Adds action to prev_actions and moves the intent state on, as
+        take_action does after performing it.
+
+        Args:
+            action (str): The name of the move.
+
+        Raises:
+            NotImplementedError: If the creature has no spec.
+        """
+        spec = self.spec
+        if spec is None:
+            self._missing_spec()
+        self.prev_actions.append(action)
+        self.intent_state = spec.next_state(self.intent_state, action)
+
 
-if t.TYPE_CHECKING:
-    from attack import Attack
+# Every status and permanent in game_constants is reachable as an attribute, with
+# permanents taking priority in case of a name conflict (ideally never!).
+for _name in game_constants.ALL_STATUSES:
+    setattr(Creature, _name, ModifierAttribute(_name, True))
+for _name in game_constants.ALL_PERMANENTS:
+    setattr(Creature, _name, ModifierAttribute(_name, False))
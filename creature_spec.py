@@ -0,0 +1,360 @@
+"""
+creature_spec.py
+Contains the declarative description of a creature: its moves, what each move
+does per ascension band, the hp and permanents it starts with, the moves it
+makes on spawning and the rules picking its intent. A CreatureSpec is compiled
+once per (ascension, act) into a CompiledSpec of flat move tables shared by
+every instance, so performing a move never branches on the ascension.
+
+The moves the intent rules look back on are kept by each creature as a small
+integer, its intent state, see CreatureSpec.next_state. It indexes the alias
+tables of the weighted pick directly.
+
+Banded values are either a plain value or a dict {lowest level: value}, e.g.
+{0: 11, 2: 12} is 11 below ascension 2 and 12 from then on.
+
+Zachary McCullough
+"""
+
+#########
+# Imports
+#########
+
+# Customs
+
+from game_config import settings
+from game_status import state
+import custom_typing as t
+import utils
+
+# One per move, the fields of a MoveSpec for a given ascension and act
+CompiledMove = t.Tuple[
+    None | int, int, int, int, None | t.Dict[str, int], bool, None | str
+]
+# actions, weights, alias probabilities, aliases, see utils.alias_table
+IntentTable = t.Tuple[
+    t.Tuple[str, ...], t.Tuple[float, ...], t.List[float], t.List[int]
+]
+
+
+###########
+# Functions
+###########
+
+
+def at_level(value: t.Any, level: int) -> t.Any:
+    """Resolves a banded value.
+
+    Args:
+        value (t.Any): A value, or a dict {lowest level: value}.
+        level (int): The ascension or act to resolve it for.
+
+    Raises:
+        ValueError: If no band starts at or below level.
+
+    Returns:
+        t.Any: The value of the highest band starting at or below level.
+    """
+    if not isinstance(value, dict):
+        return value
+    lowest = [start for start in value if start <= level]
+    if not lowest:
+        raise ValueError(f"No band of {value} covers level {level}.")
+    return value[max(lowest)]
+
+
+#########
+# Classes
+#########
+
+
+class MoveSpec:
+    __slots__ = (
+        "block",
+        "damage",
+        "effect",
+        "hits",
+        "multi_target",
+        "name",
+        "statuses",
+        "strength",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        damage: t.Any = None,
+        hits: t.Any = 1,
+        block: t.Any = 0,
+        strength: t.Any = 0,
+        statuses: None | t.Dict[str, int] = None,
+        multi_target: bool = False,
+        effect: None | str = None,
+    ) -> None:
+        """What a move does. Every number may be banded by ascension, the
+        statuses may not.
+
+        Args:
+            name (str): The name of the move, e.g. "chomp".
+            damage (t.Any, optional): Damage per hit before strength, None for
+                a move that does not attack. Defaults to None.
+            hits (t.Any, optional): Number of hits. Defaults to 1.
+            block (t.Any, optional): Block the creature gains. Defaults to 0.
+            strength (t.Any, optional): Strength the creature gains, before
+                its damage is worked out. Defaults to 0.
+            statuses (None | t.Dict[str, int], optional): Statuses applied to
+                the targets, e.g. {"weak": 2}. Defaults to None.
+            multi_target (bool, optional): Whether the move targets every
+                enemy. Defaults to False.
+            effect (None | str, optional): Name of a method of the creature
+                to call after the block and strength are gained, for what data
+                cannot describe. Defaults to None.
+        """
+        self.name = name
+        self.damage = damage
+        self.hits = hits
+        self.block = block
+        self.strength = strength
+        self.statuses = statuses
+        self.multi_target = multi_target
+        self.effect = effect
+
+    def compile(self, ascension: int) -> CompiledMove:
+        """(damage, hits, block, strength, statuses, multi_target, effect) at
+        ascension."""
+        damage = at_level(self.damage, ascension)
+        return (
+            damage,
+            # an attack without damage does not hit
+            at_level(self.hits, ascension) if damage is not None else 0,
+            at_level(self.block, ascension),
+            at_level(self.strength, ascension),
+            self.statuses,
+            self.multi_target,
+            self.effect,
+        )
+
+
+class IntentSpec:
+    __slots__ = ("every", "first", "max_in_a_row", "weights")
+
+    def __init__(
+        self,
+        weights: t.Dict[str, float],
+        first: None | str = None,
+        every: None | t.Tuple[int, str] = None,
+        max_in_a_row: None | t.Dict[str, int] = None,
+    ) -> None:
+        """The rules picking a creature's intent, checked in order:
+            1. On its first turn the creature uses first.
+            2. If turns_taken is a multiple of every[0], from every[0] on,
+                it uses every[1].
+            3. Otherwise it picks from weights, leaving out any move it
+                already used max_in_a_row times in a row.
+
+        Args:
+            weights (t.Dict[str, float]): Relative weight of each move.
+            first (None | str, optional): The opening move. Defaults to None.
+            every (None | t.Tuple[int, str], optional): (period, move) of a
+                move used on a fixed schedule. Defaults to None.
+            max_in_a_row (None | t.Dict[str, int], optional): How many times
+                in a row a move may be used. Defaults to no limit.
+        """
+        self.weights = weights
+        self.first = first
+        self.every = every
+        self.max_in_a_row = max_in_a_row or {}
+
+    @property
+    def action_memory(self) -> int:
+        """How many of the latest actions the rules look at."""
+        return max(self.max_in_a_row.values(), default=1)
+
+    def table(self, history: t.Tuple[str, ...]) -> IntentTable:
+        """The intent table of the weighted pick after the actions history.
+
+        Raises:
+            ValueError: If the rules leave no move.
+        """
+        allowed = [
+            (action, weight)
+            for action, weight in self.weights.items()
+            if not self._exhausted(action, history)
+        ]
+        if not allowed:
+            raise ValueError(f"No move is allowed after {history}.")
+        actions, weights = zip(*allowed)
+        return (actions, weights, *utils.alias_table(weights))  # type: ignore
+
+    def _exhausted(self, action: str, history: t.Tuple[str, ...]) -> bool:
+        limit = self.max_in_a_row.get(action)
+        if limit is None or len(history) < limit:
+            return False
+        return all(previous == action for previous in history[-limit:])
+
+
+class CreatureSpec:
+    __slots__ = (
+        "compiled",
+        "hp",
+        "intents",
+        "move_ids",
+        "moves",
+        "num_states",
+        "permanents",
+        "spawn_moves",
+    )
+
+    def __init__(
+        self,
+        hp: t.Any,
+        moves: t.Sequence[MoveSpec],
+        intents: IntentSpec,
+        permanents: None | t.Dict[str, t.Any] = None,
+        spawn_moves: t.Any = (),
+    ) -> None:
+        """Everything a creature does, as data.
+
+        Args:
+            hp (t.Any): Starting hp, banded by ascension.
+            moves (t.Sequence[MoveSpec]): The creature's moves. Their order
+                numbers them in combat logs.
+            intents (IntentSpec): The rules picking the next move.
+            permanents (None | t.Dict[str, t.Any], optional): Permanents the
+                creature starts with, each banded by ascension. Defaults to
+                None.
+            spawn_moves (t.Any, optional): Moves performed on spawning,
+                banded by act. Defaults to ().
+        """
+        self.hp = hp
+        self.moves = tuple(moves)
+        self.intents = intents
+        self.permanents = permanents or {}
+        self.spawn_moves = spawn_moves
+        # move name -> its digit in intent states, 0 standing for no move
+        self.move_ids = {move.name: idx + 1 for idx, move in enumerate(self.moves)}
+        self.num_states = (len(self.moves) + 1) ** intents.action_memory
+        # (ascension, act) -> CompiledSpec
+        self.compiled: t.Dict[t.Tuple[int, int], CompiledSpec] = {}
+
+    @property
+    def move_names(self) -> t.Tuple[str, ...]:
+        return tuple(move.name for move in self.moves)
+
+    def next_state(self, state: int, action: str) -> int:
+        """The intent state after action. A state holds the move ids of the
+        latest action_memory moves as digits in base len(moves) + 1, the
+        latest one lowest, so a creature that has not moved yet is in state 0.
+        """
+        return (state * (len(self.moves) + 1) + self.move_ids[action]) % self.num_states
+
+    def state_of(self, actions: t.Sequence[str]) -> int:
+        """The intent state after actions, oldest first."""
+        state = 0
+        for action in actions:
+            state = self.next_state(state, action)
+        return state
+
+    def history(self, state: int) -> t.Tuple[str, ...]:
+        """The moves an intent state stands for, oldest first."""
+        base = len(self.moves) + 1
+        history = []
+        while state:
+            state, move_id = divmod(state, base)
+            if move_id:
+                history.append(self.moves[move_id - 1].name)
+        return tuple(reversed(history))
+
+    def current(self) -> "CompiledSpec":
+        """The spec compiled for the current ascension and act."""
+        key = (settings.ascension, state.act)
+        compiled = self.compiled.get(key)
+        if compiled is None:
+            compiled = self.compiled[key] = CompiledSpec(self, *key)
+        return compiled
+
+
+class CompiledSpec:
+    __slots__ = (
+        "first",
+        "histories",
+        "hp",
+        "intent_tables",
+        "intents",
+        "moves",
+        "period",
+        "permanents",
+        "scheduled",
+        "spawn_moves",
+    )
+
+    def __init__(self, spec: CreatureSpec, ascension: int, act: int) -> None:
+        """The flat tables of spec at ascension and act, see
+        CreatureSpec.current.
+        """
+        self.hp: int = at_level(spec.hp, ascension)
+        self.permanents = {
+            name: at_level(value, ascension) for name, value in spec.permanents.items()
+        }
+        self.spawn_moves: t.Tuple[str, ...] = tuple(at_level(spec.spawn_moves, act))
+        # move name -> CompiledMove
+        self.moves = {move.name: move.compile(ascension) for move in spec.moves}
+        self.intents = spec.intents
+        self.first = spec.intents.first
+        # a period of 0 schedules nothing
+        self.period, self.scheduled = spec.intents.every or (0, None)
+        # intent state -> the moves it stands for
+        self.histories = [spec.history(state) for state in range(spec.num_states)]
+        # intent state -> IntentTable, filled in as states come up
+        self.intent_tables: t.List[None | IntentTable] = [None] * spec.num_states
+
+    def forced_action(self, turns_taken: int) -> None | str:
+        """The move rules 1 and 2 of IntentSpec force, if any."""
+        if turns_taken == 0 and self.first is not None:
+            return self.first
+        period = self.period
+        if period and turns_taken >= period and turns_taken % period == 0:
+            return self.scheduled
+        return None
+
+    def intent_table(self, intent_state: int) -> IntentTable:
+        """The intent table of the weighted pick in intent_state, see
+        CreatureSpec.next_state.
+        """
+        table = self.intent_tables[intent_state]
+        if table is None:
+            table = self.intents.table(self.histories[intent_state])
+            self.intent_tables[intent_state] = table
+        return table
+
+    def pick_action(self, turns_taken: int, intent_state: int, rng: t.Any) -> str:
+        """Picks the next move with one draw from rng, or none if only one
+        move is allowed.
+        """
+        # forced_action and intent_table inlined, this runs every turn
+        if turns_taken == 0 and self.first is not None:
+            return self.first
+        period = self.period
+        if period and turns_taken >= period and turns_taken % period == 0:
+            return self.scheduled
+        table = self.intent_tables[intent_state]
+        if table is None:
+            table = self.intent_table(intent_state)
+        actions, _, probabilities, aliases = table
+        if len(actions) == 1:
+            return actions[0]
+        u = rng.random() * len(actions)
+        column = int(u)
+        if u - column < probabilities[column]:
+            return actions[column]
+        return actions[aliases[column]]
+
+    def intent_weights(
+        self, turns_taken: int, intent_state: int
+    ) -> t.Tuple[t.List[str], t.List[float]]:
+        """The moves pick_action chooses between and their weights."""
+        action = self.forced_action(turns_taken)
+        if action is not None:
+            return [action], [1.0]
+        actions, weights, _, _ = self.intent_table(intent_state)
+        return list(actions), list(weights)
@@ -30,7 +30,6 @@ CreatureModifiers = Literal[
     "vulnerable",
     "weak",
 ]
-ResultDict = Dict[str, Dict[str, Dict[str, int]]]
 Seed = None | int | float | str | bytes | bytearray
 
 
@@ -0,0 +1,156 @@
+"""
+exact_solver.py
+Computes the exact outcome distribution of a matchup instead of sampling it.
+A battle is a finite Markov chain: the only randomness is each creature's
+intent (Creature.intent_weights) and the target of single target attacks, so
+every reachable battle state can be enumerated turn by turn with its
+probability. States reached along different paths are merged by
+Simulator.state_key, which keeps small matchups to a few thousand states.
+
+Zachary McCullough
+"""
+
+#########
+# Imports
+#########
+
+# Builtins
+
+from collections import defaultdict
+
+# Customs
+
+from simulator import Simulator
+import custom_typing as t
+
+HpDistribution = t.Dict[str, t.List[t.Dict[int, float]]]
+# (left won, hp of each left creature, hp of each right creature, rounds
+# left, counting the one the battle ends in)
+Outcome = t.Tuple[bool, t.Tuple[int, ...], t.Tuple[int, ...], int]
+
+
+###########
+# Functions
+###########
+
+
+def outcome_distribution(
+    simulator: Simulator, max_turns: int = 1_000, max_states: None | int = None
+) -> None | t.Tuple[t.Dict[Outcome, float], float]:
+    """Enumerates every way the battle can play out from the simulator's
+    current state, which must be the start of a round, one creature turn at a
+    time in the same order as Simulator.one_battle.
+
+    Args:
+        simulator (Simulator): The matchup. Its teams are left as they were.
+        max_turns (int, optional): Battles still going after this many turns
+            are given up on, their probability is returned as unresolved.
+            Defaults to 1_000.
+        max_states (None | int, optional): Give up once this many states have
+            been expanded. Defaults to None, no limit.
+
+    Returns:
+        None | t.Tuple[t.Dict[Outcome, float], float]: ({outcome: probability},
+            probability of unresolved battles), or None if max_states ran out.
+    """
+    turn_order = [(creature, True) for creature in simulator.left_creatures] + [
+        (creature, False) for creature in simulator.right_creatures
+    ]
+    outcomes: t.Dict[Outcome, float] = defaultdict(float)
+    num_expanded = 0
+
+    template = simulator.snapshot()
+    start_turn = simulator.current_turn
+    states: t.Dict[t.Any, float] = {simulator.state_key(): 1.0}
+    try:
+        for _ in range(max_turns):
+            for creature, is_left in turn_order:
+                next_states: t.Dict[t.Any, float] = defaultdict(float)
+                for state, probability in states.items():
+                    simulator.reset(state)
+                    if not creature.alive:
+                        next_states[state] += probability
+                        continue
+                    num_expanded += 1
+                    if max_states is not None and num_expanded > max_states:
+                        return None
+                    actions, weights = creature.intent_weights()
+                    total_weight = sum(weights)
+                    enemies = (
+                        simulator.right_creatures
+                        if is_left
+                        else simulator.left_creatures
+                    )
+                    num_targets = max(1, sum(enemy.alive for enemy in enemies))
+                    for action, weight in zip(actions, weights):
+                        branch_probability = (
+                            probability * weight / total_weight / num_targets
+                        )
+                        for target in range(num_targets):
+                            simulator.reset(state)
+                            simulator.resolve_one_creature_turn(
+                                creature, is_left, action=action, target=target
+                            )
+                            keep_simulating, left_won = simulator._keep_simulating()
+                            if keep_simulating:
+                                next_states[simulator.state_key()] += branch_probability
+                            else:
+                                outcome = (
+                                    bool(left_won),
+                                    tuple(c.hp for c in simulator.left_creatures),
+                                    tuple(c.hp for c in simulator.right_creatures),
+                                    simulator.current_turn + 1 - start_turn,
+                                )
+                                outcomes[outcome] += branch_probability
+                states = next_states
+            if not states:
+                break
+            # end of the round, as in one_battle
+            next_states = defaultdict(float)
+            for state, probability in states.items():
+                simulator.reset(state)
+                simulator.current_turn += 1
+                next_states[simulator.state_key()] += probability
+            states = next_states
+    finally:
+        simulator.reset(template)
+    return dict(outcomes), sum(states.values())
+
+
+def solve(
+    simulator: Simulator, max_turns: int = 1_000
+) -> t.Tuple[float, HpDistribution, float]:
+    """Computes the exact outcome of a battle between the simulator's teams,
+    see outcome_distribution.
+
+    Args:
+        simulator (Simulator): The matchup. Its teams are left as they were.
+        max_turns (int, optional): Battles still going after this many turns
+            are given up on, their probability is returned as unresolved.
+            Defaults to 1_000.
+
+    Returns:
+        t.Tuple[float, HpDistribution, float]: (left win probability,
+            {"left": [...], "right": [...]} with one {hp: probability} per
+            creature, hp 0 meaning dead, probability of unresolved battles)
+    """
+    outcomes, unresolved = outcome_distribution(simulator, max_turns)  # type: ignore
+    left_win_probability = 0.0
+    hp_distributions: HpDistribution = {
+        "left": [defaultdict(float) for _ in simulator.left_creatures],
+        "right": [defaultdict(float) for _ in simulator.right_creatures],
+    }
+    for (left_won, left_hps, right_hps, _), probability in outcomes.items():
+        if left_won:
+            left_win_probability += probability
+        for side, hps in (("left", left_hps), ("right", right_hps)):
+            for distribution, hp in zip(hp_distributions[side], hps):
+                distribution[hp] += probability
+    return (
+        left_win_probability,
+        {
+            side: [dict(distribution) for distribution in distributions]
+            for side, distributions in hp_distributions.items()
+        },
+        unresolved,
+    )
@@ -22,9 +22,23 @@ class Settings:
     def __init__(self) -> None:
         self.ascension = 20
         self.simulator_log_dir = "./simulator"
+        # Per hit and per action debug trace. Off by default, as formatting it
+        # costs more than resolving the battle itself.
+        self.trace = False
         if not os.path.exists(self.simulator_log_dir):
             os.makedirs(self.simulator_log_dir)
 
+    def enable_trace(self, enabled: bool = True) -> None:
+        """Turns the combat debug trace on or off. While off, the combat hot
+        loop does no formatting, repr or logger lookups at all.
+
+        Args:
+            enabled (bool, optional): Whether to trace. Defaults to True.
+        """
+        self.trace = enabled
+        if enabled:
+            logging.getLogger().setLevel(logging.DEBUG)
+
 
 settings = Settings()
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=logging.INFO)
@@ -10,14 +10,46 @@ Zachary McCullough
 
 # Builtins
 
-import random
 import typing as t
 
 # Customs
 
-from attack import Attack
 from creature import Creature
-from game_config import settings
+from creature_spec import CreatureSpec, IntentSpec, MoveSpec
+
+###########
+# Constants
+###########
+
+# Intent rules:
+#     1. First turn is always debilitate.
+#     2. When turns_taken is a multiple of 3 it buffs, see Heart.escalate.
+#     3. Otherwise it alternates echo and blood shots, picking which comes
+#        first 50/50.
+SPEC = CreatureSpec(
+    hp={0: 750, 9: 800},
+    moves=(
+        MoveSpec(
+            "debilitate",
+            statuses={"weak": 2, "vulnerable": 2, "frail": 2},
+            multi_target=True,
+        ),
+        MoveSpec("blood_shots", damage=2, hits={0: 12, 4: 15}),
+        MoveSpec("echo", damage={0: 40, 4: 45}),
+        MoveSpec("buff", strength=2, effect="escalate"),
+    ),
+    intents=IntentSpec(
+        # blood shots first, so a draw below 0.5 picks it
+        weights={"blood_shots": 0.5, "echo": 0.5},
+        first="debilitate",
+        every=(3, "buff"),
+        max_in_a_row={"blood_shots": 1, "echo": 1},
+    ),
+    permanents={
+        "beat_of_death": {0: 1, 19: 2},
+        "invincible": {0: 300, 19: 200},
+    },
+)
 
 
 #########
@@ -26,69 +58,30 @@ from game_config import settings
 
 
 class Heart(Creature):
-    def __init__(self, hp: int = 800, block: int = 0):
-        action_dict: dict[str, t.Callable[[], Attack]] = {
-            "debilitate": self.debilitate,
-            "blood_shots": self.blood_shots,
-            "echo": self.echo,
-            "buff": self.buff,
-        }
-
-        if settings.ascension < 9:
-            hp = 750
-
-        super().__init__(hp=hp, cur_block=block, action_dict=action_dict)
+    __slots__ = ("__num_times_buffed",)
+    spec = SPEC
 
+    def __init__(self, hp: int | None = None, block: int = 0):
         self.__num_times_buffed = 0
-        if settings.ascension < 19:
-            self.permanents["beat_of_death"] = 1
-            self.permanents["invincible"] = 300
-        else:
-            self.permanents["beat_of_death"] = 2
-            self.permanents["invincible"] = 200
-
-    def pick_action(self) -> str:
-        action = ""
-        if self.turns_taken == 0:
-            action = "debilitate"
-        elif (self.turns_taken) % 3 == 0 and self.turns_taken >= 3:
-            action = "buff"
-        elif self.prev_actions[-1] == "blood_shots":
-            action = "echo"
-        elif self.prev_actions[-1] == "echo":
-            action = "blood_shots"
-        else:
-            # 50/50
-            action = "echo" if random.random() >= 0.5 else "blood_shots"
-        return action
-
-    def debilitate(self, **kw: dict[str, t.Any]) -> Attack:
-        # if "enemies" in kw:
-        #     for enemy in kw["enemies"]:
-        #         safe_add(enemy, "statuses", {})
-        #         for status in ("weak", "vulnerable", "frail"):
-        #             if isinstance(enemy, Creature):
-        #                 enemy.statuses[status] += 2
-        return Attack(
-            statuses={"weak": 2, "vulnerable": 2, "frail": 2},
-            multi_target=True,
-            creature=self,
-        )
+        super().__init__(hp=hp, cur_block=block)
+
+    @property
+    def times_buffed(self) -> int:
+        return self.__num_times_buffed
 
-    def blood_shots(self, **kw: dict[str, t.Any]) -> Attack:
-        if settings.ascension < 4:
-            return Attack(damage=2 + self.strength, hits=12, creature=self)
-        return Attack(damage=2 + self.strength, hits=15, creature=self)
+    def snapshot(self, canonical: bool = False) -> t.Tuple[t.Any, ...]:
+        return (super().snapshot(canonical), self.__num_times_buffed)
 
-    def echo(self, **kw: dict[str, t.Any]) -> Attack:
-        if settings.ascension < 4:
-            return Attack(damage=40 + self.strength, creature=self)
-        return Attack(damage=45 + self.strength, creature=self)
+    def reset(self, snapshot: t.Tuple[t.Any, ...]) -> None:
+        base_snapshot, self.__num_times_buffed = snapshot
+        super().reset(base_snapshot)
 
-    def buff(self, **kw: dict[str, t.Any]) -> Attack:
+    def escalate(self) -> None:
+        """The part of buff beyond its 2 strength: it clears strength down and
+        grows stronger with every buff.
+        """
         if "strength_down" in self.statuses:
             del self.statuses["strength_down"]
-        self.strength += 2
 
         if self.__num_times_buffed == 0:
             self.permanents["artifact"] = 2
@@ -102,4 +95,3 @@ class Heart(Creature):
             self.strength += 50
 
         self.__num_times_buffed += 1
-        return Attack(creature=self)
@@ -1,59 +1,184 @@
-from collections import UserDict
+from collections.abc import MutableMapping
 import custom_typing as t
+import game_constants
 
+###########
+# Modifier ids
+###########
+
+# Every modifier name gets a fixed index for the life of the process. Names from
+# game_constants are registered up front, anything else on first use.
+MODIFIER_IDS: t.Dict[str, int] = {}
+MODIFIER_NAMES: t.List[str] = []
+
+
+def modifier_id(name: str) -> int:
+    """Returns the fixed index of a modifier, registering it if it is new.
+
+    Args:
+        name (str): The modifier's name, e.g. "vulnerable".
+
+    Returns:
+        int: The index of the modifier in every ModifierDict vector.
+    """
+    idx = MODIFIER_IDS.get(name)
+    if idx is None:
+        idx = MODIFIER_IDS[name] = len(MODIFIER_NAMES)
+        MODIFIER_NAMES.append(name)
+    return idx
+
+
+def modifier_bit(name: str) -> int:
+    """Returns the presence bit of a modifier, for testing against a mask."""
+    return 1 << modifier_id(name)
+
+
+for _name in sorted(game_constants.ALL_STATUSES | game_constants.ALL_PERMANENTS):
+    modifier_id(_name)
+
+
+def _rebuild(
+    cls: t.Type["ModifierDict"], items: t.List[t.Tuple[str, t.Any]], default_val: t.Any
+) -> "ModifierDict":
+    """Unpickles a ModifierDict, putting every item back by name since ids
+    differ between processes.
+    """
+    modifiers = cls.__new__(cls)
+    modifiers.vector = [None] * len(MODIFIER_NAMES)
+    modifiers.mask = 0
+    modifiers.default_val = default_val
+    for name, item in items:
+        modifiers.put(modifier_id(name), item)
+    return modifiers
+
+
+#########
+# Classes
+#########
+
+
+class ModifierDict(MutableMapping[str, t.Any]):
+    """A mapping of modifier name to value, stored as a vector indexed by
+    modifier id plus a bitmask of which modifiers are present. Missing keys read
+    as default_val without being inserted.
+    """
+
+    __slots__ = ("default_val", "mask", "vector")
 
-class ModifierDict(UserDict[str, t.Any]):
     def __init__(self, initial_dict: dict[str, t.Any], /, default_val: t.Any = None):
-        super().__init__()
-        self.update(initial_dict)
+        self.vector: t.List[t.Any] = [None] * len(MODIFIER_NAMES)
+        self.mask = 0
         self.default_val = default_val
+        self.update(initial_dict)
 
         # defaults
         for key in ("strength", "dexterity"):
-            if key not in self.data:
-                self.data[key] = 0
+            if key not in self:
+                self.put(modifier_id(key), 0)
 
     def __getattr__(self, attr: str) -> t.Any:
-        if attr == "data":
-            return super().__getattribute__(attr)
-        try:
-            return self.data[attr]
-        except KeyError:
-            raise AttributeError
-
-    def __setattr__(self, __name: str, __value: t.Any) -> None:
-        if __name in ("data", "default_val"):
-            return super().__setattr__(__name, __value)
-        return super().__setattr__(__name, __value)
+        idx = MODIFIER_IDS.get(attr)
+        if idx is None or not self.mask >> idx & 1:
+            raise AttributeError(attr)
+        return self.vector[idx]
 
     def __getitem__(self, key: str) -> t.Any:
-        if key not in self.data:
-            self.data[key] = self.default_val
-        return super().__getitem__(key)
+        idx = MODIFIER_IDS.get(key)
+        if idx is None or not self.mask >> idx & 1:
+            return self.default_val
+        return self.vector[idx]
+
+    def __setitem__(self, key: str, item: t.Any) -> None:
+        self.set_id(modifier_id(key), item)
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self.discard(MODIFIER_IDS[key])
+
+    def __contains__(self, key: object) -> bool:
+        idx = MODIFIER_IDS.get(key)  # type: ignore
+        return idx is not None and bool(self.mask >> idx & 1)
+
+    def __iter__(self) -> t.Iterator[str]:
+        for idx in self.ids():
+            yield MODIFIER_NAMES[idx]
+
+    def __len__(self) -> int:
+        return self.mask.bit_count()
+
+    def __repr__(self) -> str:
+        return repr({MODIFIER_NAMES[idx]: self.vector[idx] for idx in self.ids()})
+
+    def __reduce__(self) -> t.Tuple[t.Any, ...]:
+        # by name, ids are handed out in the order each process meets names
+        return _rebuild, (type(self), list(self.items()), self.default_val)
+
+    def ids(self) -> t.Iterator[int]:
+        """Yields the id of every present modifier, in id order. The mask is
+        read once up front, so the dict may be changed while iterating.
+        """
+        mask = self.mask
+        while mask:
+            lowest = mask & -mask
+            mask ^= lowest
+            yield lowest.bit_length() - 1
+
+    def put(self, idx: int, item: t.Any) -> None:
+        """Stores a value by modifier id and marks it present."""
+        if idx >= len(self.vector):
+            self.vector.extend([None] * (idx + 1 - len(self.vector)))
+        self.vector[idx] = item
+        self.mask |= 1 << idx
+
+    def discard(self, idx: int) -> None:
+        """Removes a modifier by id, if present."""
+        if self.mask >> idx & 1:
+            self.mask ^= 1 << idx
+            self.vector[idx] = None
+
+    # Setting a modifier by id, subclasses may add rules on top of put
+    set_id = put
+
+    def snapshot(self) -> t.Tuple[int, t.Tuple[t.Any, ...]]:
+        """Returns (mask, values) where values is the vector trimmed to the
+        highest present modifier, so equal contents give equal snapshots.
+        """
+        return self.mask, tuple(self.vector[: self.mask.bit_length()])
+
+    def reset(self, snapshot: t.Tuple[int, t.Tuple[t.Any, ...]]) -> None:
+        """Restores the contents captured by snapshot, reusing the vector."""
+        self.mask, values = snapshot
+        num_values = len(values)
+        self.vector[:num_values] = values
+        for idx in range(num_values, len(self.vector)):
+            self.vector[idx] = None
 
 
 class Statuses(ModifierDict):
+    __slots__ = ()
+
     def __init__(self, initial_dict: dict[str, t.Any], /, default_val: t.Any = None):
         super().__init__(
             initial_dict, default_val=0 if default_val is None else default_val
         )
 
-    def __setitem__(self, key: str, item: t.Any) -> None:
-        super().__setitem__(key, item)
-        if isinstance(item, int) and self.data[key] <= 0:
-            del self.data[key]
+    def set_id(self, idx: int, item: t.Any) -> None:
+        if isinstance(item, int) and item <= 0:
+            self.discard(idx)
+        else:
+            self.put(idx, item)
 
     def turn_start(self) -> None:
-        for kv_tup in list(self.data.items()):
-            if kv_tup[1] is None:
+        for idx in self.ids():
+            value = self.vector[idx]
+            if value is None:
                 continue
-            new_val = kv_tup[1] - 1
-            if new_val <= 0:
-                del self.data[kv_tup[0]]
-            else:
-                self.data[kv_tup[0]] = new_val
+            self.set_id(idx, value - 1)
 
 
 class Permanents(ModifierDict):
+    __slots__ = ()
+
     def __init__(self, initial_dict: dict[str, t.Any], /) -> None:
         super().__init__(initial_dict, default_val=None)
@@ -0,0 +1,136 @@
+"""
+phase_timer.py
+Contains PhaseTimer, which splits the time of creature turns into the phases
+of Simulator.resolve_one_creature_turn and one_battle. Only every
+sample_every-th creature turn is timed, so the clock is read a few times per
+sampled turn and not at all otherwise. Install one with Simulator.use_timer,
+and the timings of every worker come back merged in SimulationResult.timings.
+
+Zachary McCullough
+"""
+
+#########
+# Imports
+#########
+
+# Builtins
+
+from time import perf_counter
+
+###########
+# Constants
+###########
+
+# Phases, in the order they happen in a creature turn
+START_TURN = "start_turn"
+BEAT_OF_DEATH_SCAN = "beat_of_death_scan"
+ACTION_SELECTION = "action_selection"
+ATTACK_CONSTRUCTION = "attack_construction"
+TARGETING = "targeting"
+HIT_RESOLUTION = "hit_resolution"
+STATUS_APPLICATION = "status_application"
+BEAT_OF_DEATH = "beat_of_death"
+END_TURN = "end_turn"
+KEEP_SIMULATING = "keep_simulating"
+PHASES = (
+    START_TURN,
+    BEAT_OF_DEATH_SCAN,
+    ACTION_SELECTION,
+    ATTACK_CONSTRUCTION,
+    TARGETING,
+    HIT_RESOLUTION,
+    STATUS_APPLICATION,
+    BEAT_OF_DEATH,
+    END_TURN,
+    KEEP_SIMULATING,
+)
+
+
+#########
+# Classes
+#########
+
+
+class PhaseTimer:
+    __slots__ = (
+        "calls",
+        "last",
+        "sample_every",
+        "sampled",
+        "sampling",
+        "seconds",
+        "turns",
+    )
+
+    def __init__(self, sample_every: int = 16) -> None:
+        """Per phase time and call counts of the sampled creature turns.
+
+        Args:
+            sample_every (int, optional): Time one creature turn out of this
+                many. Defaults to 16.
+        """
+        self.sample_every = max(1, sample_every)
+        # creature turns started, and how many of them were timed
+        self.turns = 0
+        self.sampled = 0
+        self.sampling = False
+        self.last = 0.0
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.calls = dict.fromkeys(PHASES, 0)
+
+    def __repr__(self) -> str:
+        return (
+            f"PhaseTimer(sample_every={self.sample_every}, turns={self.turns}, "
+            f"sampled_seconds={sum(self.seconds.values()):.6f})"
+        )
+
+    def start(self) -> bool:
+        """Starts a creature turn.
+
+        Returns:
+            bool: Whether the turn is sampled. Only then should lap be called.
+        """
+        self.turns += 1
+        self.sampling = self.turns % self.sample_every == 0
+        if self.sampling:
+            self.sampled += 1
+            self.last = perf_counter()
+        return self.sampling
+
+    def lap(self, phase: str) -> None:
+        """Charges the time since the turn started or the last lap to phase."""
+        now = perf_counter()
+        self.seconds[phase] += now - self.last
+        self.calls[phase] += 1
+        self.last = now
+
+    def merge(self, other: "PhaseTimer") -> "PhaseTimer":
+        """Adds the timings of other, e.g. those of a worker.
+
+        Returns:
+            PhaseTimer: This timer.
+        """
+        self.turns += other.turns
+        self.sampled += other.sampled
+        for phase in PHASES:
+            self.seconds[phase] += other.seconds[phase]
+            self.calls[phase] += other.calls[phase]
+        return self
+
+    def report(self) -> str:
+        """Per phase sampled calls, mean time per call and share of the
+        sampled time, in the order the phases happen.
+        """
+        total = sum(self.seconds.values())
+        lines = [
+            f"Phase timings, {self.sampled} of {self.turns} creature turns sampled:"
+        ]
+        for phase in PHASES:
+            calls = self.calls[phase]
+            seconds = self.seconds[phase]
+            mean = seconds / calls * 1e9 if calls else 0.0
+            share = seconds / total if total else 0.0
+            lines.append(
+                f"{phase:<20} {calls:>10} calls {mean:>10.0f} ns/call {share:>7.1%}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,178 @@
+"""
+search_predicates.py
+Contains the predicates Simulator.simulation_search looks for. A predicate is
+checked after every round of a battle, and besides whether it is met it says
+when it can no longer be met, so the search abandons a battle the moment it
+cannot match instead of playing it out. Predicates combine with & (all of),
+| (any of) and ~ (not), e.g.
+
+    RightWins() | (DiesByTurn(1, 10) & Survives(0))
+
+Creatures are numbered by slot, the left creatures first, then the right ones.
+
+Zachary McCullough
+"""
+
+#########
+# Imports
+#########
+
+# Customs
+
+import custom_typing as t
+
+# True once met, False once impossible, None while undecided
+Verdict = None | bool
+
+
+#########
+# Classes
+#########
+
+
+class Predicate:
+    def verdict(self, simulator: t.Any, left_won: None | bool) -> Verdict:
+        """Decides the predicate for the battle so far.
+
+        Args:
+            simulator (t.Any): The Simulator running the battle, at the start
+                of a round or at the end of the battle.
+            left_won (None | bool): Who won, or None while the battle goes on.
+
+        Returns:
+            Verdict: True if met, False if it can no longer be met, None if
+                the rest of the battle decides. At the end of the battle, only
+                True or False.
+        """
+        raise NotImplementedError
+
+    def __and__(self, other: "Predicate") -> "Predicate":
+        return AllOf(self, other)
+
+    def __or__(self, other: "Predicate") -> "Predicate":
+        return AnyOf(self, other)
+
+    def __invert__(self) -> "Predicate":
+        return Not(self)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{value!r}" for value in vars(self).values())
+        return f"{type(self).__name__}({fields})"
+
+    @staticmethod
+    def _creature(simulator: t.Any, slot: int) -> t.Any:
+        return (simulator.left_creatures + simulator.right_creatures)[slot]
+
+
+class LeftWins(Predicate):
+    """The left side wins."""
+
+    def verdict(self, simulator: t.Any, left_won: None | bool) -> Verdict:
+        return left_won
+
+
+class RightWins(Predicate):
+    """The right side wins."""
+
+    def verdict(self, simulator: t.Any, left_won: None | bool) -> Verdict:
+        return None if left_won is None else not left_won
+
+
+class LeftWinsWithHp(Predicate):
+    def __init__(self, min_hp: int) -> None:
+        """The left side wins with more than min_hp hp left between them.
+        Impossible as soon as they are down to min_hp, as none of the
+        supported creatures heal.
+        """
+        self.min_hp = min_hp
+
+    def verdict(self, simulator: t.Any, left_won: None | bool) -> Verdict:
+        hp = sum(creature.hp for creature in simulator.left_creatures)
+        if hp <= self.min_hp:
+            return False
+        return left_won
+
+
+class Survives(Predicate):
+    def __init__(self, slot: int) -> None:
+        """The creature in slot is alive at the end of the battle."""
+        self.slot = slot
+
+    def verdict(self, simulator: t.Any, left_won: None | bool) -> Verdict:
+        if not self._creature(simulator, self.slot).alive:
+            return False
+        return None if left_won is None else True
+
+
+class DiesByTurn(Predicate):
+    def __init__(self, slot: int, turn: int) -> None:
+        """The creature in slot dies before round turn starts, rounds
+        counting from 0 as Simulator.current_turn does."""
+        self.slot = slot
+        self.turn = turn
+
+    def verdict(self, simulator: t.Any, left_won: None | bool) -> Verdict:
+        if not self._creature(simulator, self.slot).alive:
+            # mid battle it died in the round before current_turn, and so
+            # does it at the end of the battle, as one_battle counts the final
+            # round too
+            return simulator.current_turn <= self.turn
+        if left_won is not None or simulator.current_turn >= self.turn:
+            return False
+        return None
+
+
+class BuffedTimes(Predicate):
+    def __init__(self, slot: int, times: int) -> None:
+        """The Heart in slot buffs at least times times, e.g. 3 for it to
+        reach its 3rd buff."""
+        self.slot = slot
+        self.times = times
+
+    def verdict(self, simulator: t.Any, left_won: None | bool) -> Verdict:
+        if self._creature(simulator, self.slot).times_buffed >= self.times:
+            return True
+        return None if left_won is None else False
+
+
+class AllOf(Predicate):
+    def __init__(self, *predicates: Predicate) -> None:
+        """Every one of predicates. Impossible once any of them is."""
+        self.predicates = predicates
+
+    def verdict(self, simulator: t.Any, left_won: None | bool) -> Verdict:
+        met = True
+        for predicate in self.predicates:
+            verdict = predicate.verdict(simulator, left_won)
+            if verdict is False:
+                return False
+            if verdict is None:
+                met = False
+        return True if met else None
+
+
+class AnyOf(Predicate):
+    def __init__(self, *predicates: Predicate) -> None:
+        """At least one of predicates. Impossible once all of them are."""
+        self.predicates = predicates
+
+    def verdict(self, simulator: t.Any, left_won: None | bool) -> Verdict:
+        impossible = True
+        for predicate in self.predicates:
+            verdict = predicate.verdict(simulator, left_won)
+            if verdict:
+                return True
+            if verdict is None:
+                impossible = False
+        return False if impossible else None
+
+
+class Not(Predicate):
+    def __init__(self, predicate: Predicate) -> None:
+        """The opposite of predicate: met once it is impossible and the other
+        way around."""
+        self.predicate = predicate
+
+    def verdict(self, simulator: t.Any, left_won: None | bool) -> Verdict:
+        verdict = self.predicate.verdict(simulator, left_won)
+        return None if verdict is None else not verdict
@@ -0,0 +1,339 @@
+"""
+simulation_result.py
+Contains SimulationResult, the running totals of a set of battles between two
+teams. It is updated in place after every battle, and results of separate
+workers or chunks merge by adding their totals.
+
+Zachary McCullough
+"""
+
+#########
+# Imports
+#########
+
+# Customs
+
+from phase_timer import PhaseTimer
+import custom_typing as t
+import utils
+
+
+###########
+# Constants
+###########
+
+# Battles lasting longer land in the last bin of the turn histogram
+MAX_TURNS = 255
+
+
+#########
+# Classes
+#########
+
+
+class Histogram:
+    __slots__ = ("counts",)
+
+    def __init__(self, max_value: int) -> None:
+        """Counts of the integer values 0 to max_value, one bin each. Larger
+        values are counted in the last bin. Since every bin is a single value,
+        quantiles read off it are exact.
+
+        Args:
+            max_value (int): The largest value with a bin of its own.
+        """
+        self.counts = [0] * (max(max_value, 0) + 1)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Histogram):
+            return NotImplemented
+        return self.counts == other.counts
+
+    def __repr__(self) -> str:
+        return f"Histogram(total={self.total}, max_value={len(self.counts) - 1})"
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts)
+
+    def add(self, value: int, count: int = 1) -> None:
+        counts = self.counts
+        counts[max(0, min(value, len(counts) - 1))] += count
+
+    def add_counts(self, counts: t.Iterable[int]) -> None:
+        """Adds bin counts elementwise, e.g. those of a numpy bincount."""
+        own_counts = self.counts
+        for value, count in enumerate(counts):
+            own_counts[value] += int(count)
+
+    def merge(self, other: "Histogram") -> None:
+        if len(other.counts) != len(self.counts):
+            raise ValueError("Cannot merge histograms with different bins.")
+        self.add_counts(other.counts)
+
+    def quantile(self, fraction: float) -> int:
+        """The smallest value at least fraction of the counts are at or below,
+        e.g. 0.5 for the median.
+
+        Args:
+            fraction (float): Between 0 and 1.
+
+        Raises:
+            ValueError: If the histogram is empty.
+
+        Returns:
+            int: The quantile.
+        """
+        total = self.total
+        if total == 0:
+            raise ValueError("The histogram is empty.")
+        needed = fraction * total
+        seen = 0
+        for value, count in enumerate(self.counts):
+            seen += count
+            if seen >= needed and seen > 0:
+                return value
+        return len(self.counts) - 1
+
+    def fraction_between(self, low: int, high: int) -> float:
+        """The fraction of counts with low <= value < high."""
+        total = self.total
+        if total == 0:
+            return 0.0
+        return sum(self.counts[max(low, 0) : max(high, 0)]) / total
+
+
+class SimulationResult:
+    __slots__ = (
+        "cache_hits",
+        "cache_misses",
+        "damage_histograms",
+        "hp_histograms",
+        "hp_totals",
+        "left_names",
+        "left_wins",
+        "num_battles",
+        "right_names",
+        "start_hps",
+        "survived",
+        "timings",
+        "turn_histogram",
+        "turns_total",
+    )
+
+    def __init__(
+        self,
+        left_names: t.List[str],
+        right_names: t.List[str],
+        start_hps: t.List[int],
+    ) -> None:
+        """Empty totals for battles between two teams. Creatures are numbered
+        by slot, the left creatures first, then the right ones.
+
+        Args:
+            left_names (t.List[str]): Names of the left creatures, in order.
+            right_names (t.List[str]): Names of the right creatures, in order.
+            start_hps (t.List[int]): The hp every slot starts battles with.
+        """
+        self.left_names = list(left_names)
+        self.right_names = list(right_names)
+        self.start_hps = list(start_hps)
+        num_left = len(self.left_names)
+        num_slots = num_left + len(self.right_names)
+        if len(self.start_hps) != num_slots:
+            raise ValueError("start_hps needs one hp per creature.")
+        self.num_battles = 0
+        self.left_wins = 0
+        # rounds played, summed over battles
+        self.turns_total = 0
+        # per slot: battles survived and remaining hp summed over battles
+        self.survived = [0] * num_slots
+        self.hp_totals = [0] * num_slots
+        # distributions: remaining hp per slot, battle length in rounds, and
+        # damage dealt by the left and the right side, as hp the other side lost
+        self.hp_histograms = [Histogram(hp) for hp in self.start_hps]
+        self.turn_histogram = Histogram(MAX_TURNS)
+        self.damage_histograms = [
+            Histogram(sum(self.start_hps[num_left:])),
+            Histogram(sum(self.start_hps[:num_left])),
+        ]
+        # a PhaseTimer, if the battles were timed, see Simulator.use_timer
+        self.timings: None | PhaseTimer = None
+        # transposition cache lookups, summed over every process that ran
+        # battles, see Simulator.use_cache
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @classmethod
+    def for_teams(
+        cls, left_creatures: t.List[t.Any], right_creatures: t.List[t.Any]
+    ) -> "SimulationResult":
+        """Empty totals for battles between the given teams, as they are now."""
+        return cls(
+            [creature.name for creature in left_creatures],
+            [creature.name for creature in right_creatures],
+            [creature.hp for creature in left_creatures + right_creatures],
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, SimulationResult):
+            return NotImplemented
+        # timings and cache lookups differ from run to run, equal results
+        # have equal battles
+        return all(
+            getattr(self, name) == getattr(other, name)
+            for name in self.__slots__
+            if name not in ("cache_hits", "cache_misses", "timings")
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"SimulationResult(num_battles={self.num_battles}, "
+            f"left_wins={self.left_wins}, survived={self.survived}, "
+            f"hp_totals={self.hp_totals}, turns_total={self.turns_total})"
+        )
+
+    def __str__(self) -> str:
+        lines = [
+            f"Left win rate: {self.left_win_rate:.4f} over {self.num_battles} "
+            f"battles, {self.mean_turns:.2f} turns on average"
+        ]
+        if self.num_battles:
+            lines[0] += f", median {self.turn_histogram.quantile(0.5)}"
+        for slot, (side, name) in enumerate(self.slot_names()):
+            lines.append(
+                f"{side} {name} {slot}: survived {self.survival_rate(slot):.4f}, "
+                f"{self.mean_hp(slot):.2f} hp on average"
+            )
+        if self.timings is not None:
+            lines.append(self.timings.report())
+        return "\n".join(lines)
+
+    def slot_names(self) -> t.List[t.Tuple[str, str]]:
+        """Returns (side, name) of every slot."""
+        return [("left", name) for name in self.left_names] + [
+            ("right", name) for name in self.right_names
+        ]
+
+    def add_battle(self, left_won: bool, creatures: t.List[t.Any], turns: int) -> None:
+        """Adds one finished battle.
+
+        Args:
+            left_won (bool): Whether the left side won.
+            creatures (t.List[t.Any]): The creatures at the end of the battle,
+                left creatures first.
+            turns (int): Rounds the battle took.
+        """
+        self.num_battles += 1
+        if left_won:
+            self.left_wins += 1
+        self.turns_total += turns
+        self.turn_histogram.add(turns)
+        survived = self.survived
+        hp_totals = self.hp_totals
+        hp_histograms = self.hp_histograms
+        num_left = len(self.left_names)
+        left_hp = 0
+        right_hp = 0
+        for slot, creature in enumerate(creatures):
+            hp = creature.hp
+            hp_histograms[slot].add(hp)
+            if slot < num_left:
+                left_hp += hp
+            else:
+                right_hp += hp
+            if hp > 0:
+                survived[slot] += 1
+                hp_totals[slot] += hp
+        # each side's damage histogram tops out at the other side's start hp
+        left_damage, right_damage = self.damage_histograms
+        left_damage.add(len(left_damage.counts) - 1 - right_hp)
+        right_damage.add(len(right_damage.counts) - 1 - left_hp)
+
+    def add_totals(
+        self,
+        num_battles: int,
+        left_wins: int,
+        survived: t.Iterable[int],
+        hp_totals: t.Iterable[int],
+        turns_total: int,
+    ) -> None:
+        """Adds the totals of many battles at once, e.g. a batch of BatchEngine.
+        Their distributions are added to the histograms separately.
+
+        Args:
+            num_battles (int): Number of battles.
+            left_wins (int): Number of wins by the left side.
+            survived (t.Iterable[int]): Battles survived, per slot.
+            hp_totals (t.Iterable[int]): Remaining hp summed, per slot.
+            turns_total (int): Rounds played, summed over battles.
+        """
+        self.num_battles += num_battles
+        self.left_wins += left_wins
+        self.turns_total += turns_total
+        for slot, (alive, hp) in enumerate(zip(survived, hp_totals)):
+            self.survived[slot] += int(alive)
+            self.hp_totals[slot] += int(hp)
+
+    def merge(self, other: "SimulationResult") -> "SimulationResult":
+        """Adds other's battles to this result. Merging is associative and
+        commutative, so chunks can be merged in any order.
+
+        Args:
+            other (SimulationResult): Totals of the same teams.
+
+        Raises:
+            ValueError: If other is for different teams.
+
+        Returns:
+            SimulationResult: This result.
+        """
+        if (
+            other.left_names != self.left_names
+            or other.right_names != self.right_names
+            or other.start_hps != self.start_hps
+        ):
+            raise ValueError("Cannot merge results of different teams.")
+        self.add_totals(
+            other.num_battles,
+            other.left_wins,
+            other.survived,
+            other.hp_totals,
+            other.turns_total,
+        )
+        for histogram, other_histogram in zip(
+            self.hp_histograms + self.damage_histograms + [self.turn_histogram],
+            other.hp_histograms + other.damage_histograms + [other.turn_histogram],
+        ):
+            histogram.merge(other_histogram)
+        self.cache_hits += other.cache_hits
+        self.cache_misses += other.cache_misses
+        if other.timings is not None:
+            if self.timings is None:
+                self.timings = PhaseTimer(other.timings.sample_every)
+            self.timings.merge(other.timings)
+        return self
+
+    @property
+    def left_win_rate(self) -> float:
+        return self.left_wins / self.num_battles if self.num_battles else 0.0
+
+    @property
+    def cache_hit_rate(self) -> float:
+        lookups = self.cache_hits + self.cache_misses
+        return self.cache_hits / lookups if lookups else 0.0
+
+    @property
+    def mean_turns(self) -> float:
+        return self.turns_total / self.num_battles if self.num_battles else 0.0
+
+    def survival_rate(self, slot: int) -> float:
+        return self.survived[slot] / self.num_battles if self.num_battles else 0.0
+
+    def mean_hp(self, slot: int) -> float:
+        """Remaining hp of a slot averaged over all battles, dead counting as 0."""
+        return self.hp_totals[slot] / self.num_battles if self.num_battles else 0.0
+
+    def confidence_interval(self, confidence: float = 0.95) -> t.Tuple[float, float]:
+        """The Wilson interval of the left win rate, see utils.wilson_interval."""
+        return utils.wilson_interval(self.left_wins, self.num_battles, confidence)
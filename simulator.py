@@ -2,7 +2,7 @@
 simulator.py
 Contains a class Simulator to provide the simulator code. This allows for a
 consumer to create a simulation between the supported creatures, run in single
-or multiprocessing, and get printed to console results.
+or multiprocessing, and get the results back as a SimulationResult.
 
 Zachary McCullough
 """
@@ -13,17 +13,43 @@ Zachary McCullough
 
 # Builtins
 
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
 
 import copy
+import functools
 import logging
-import random
+import os
+import pickle
 import time
 
 # Customs
 
+from batch_engine import BatchEngine
+from battle_random import BLOCK_BATTLES, BattleRandom, GLOBAL_RANDOM
+from battle_records import BattleRecords
+from combat_log import CombatRecorder
 from creature import Creature
+from game_config import settings
+from game_status import state
+from modifier_dict import modifier_bit
+from phase_timer import PhaseTimer
+from search_predicates import LeftWins, Predicate, RightWins
+from simulation_result import SimulationResult
+import combat_log
 import custom_typing as t
+import phase_timer
+import utils
+
+BEAT_OF_DEATH = modifier_bit("beat_of_death")
+
+# Chunks start small to measure battle duration quickly, then are sized to take
+# about CHUNK_SECONDS each in a worker.
+FIRST_CHUNK_SIZE = 16
+CHUNK_SECONDS = 0.25
+PROGRESS_SECONDS = 5.0
+CHECKPOINT_SECONDS = 60.0
+# 4 processes unless the machine has fewer cores
+DEFAULT_NUM_CORES = max(1, min(4, os.cpu_count() or 1))
 
 
 #########
@@ -44,6 +70,152 @@ class Simulator:
         self.left_creatures = left_creatures
         self.right_creatures = right_creatures
         self.current_turn = 0
+        # creature turns that got to take an action, counted per battle by
+        # simulate
+        self.actions_taken = 0
+        # a TranspositionCache, see use_cache
+        self.cache: t.Any = None
+        # a CombatRecorder, see use_recorder
+        self.recorder: t.Any = None
+        # a BattleRecords every battle's outcome is written to, see simulate
+        self.records: None | BattleRecords = None
+        # a PhaseTimer, see use_timer
+        self.timer: None | PhaseTimer = None
+        self.use_rng(GLOBAL_RANDOM)
+
+    def use_rng(self, rng: t.Any) -> None:
+        """Makes the simulator and every creature draw from rng, e.g. a
+        BattleRandom. By default they draw from the random module.
+
+        Args:
+            rng (t.Any): Anything with the random and choices methods of
+                random.Random.
+        """
+        self.rng = rng
+        for creature in self.left_creatures + self.right_creatures:
+            creature.rng = rng
+
+    def use_cache(self, cache: t.Any) -> None:
+        """Makes one_battle look up every round in cache, a TranspositionCache,
+        and draw the ending of the battle from it on a hit. The winner, the
+        remaining hp and the number of rounds keep the same distribution, but
+        which battle gets which outcome depends on what was cached first, so
+        runs are no longer identical across num_cores. Block, statuses and
+        turns_taken are left where the cache was hit. Each worker process
+        fills one cache of its own, kept across the chunks it runs, and the
+        lookups of every process add up in SimulationResult.cache_hits and
+        cache_misses.
+
+        Args:
+            cache (t.Any): A TranspositionCache, or None to stop using one.
+        """
+        self.cache = cache
+
+    def use_recorder(self, recorder: None | CombatRecorder) -> None:
+        """Records every battle run in this process into recorder, see
+        combat_log. Battles run in worker processes are not recorded, so
+        record with num_cores=1, or use record.
+
+        Args:
+            recorder (None | CombatRecorder): Where to record, or None to stop.
+        """
+        self.recorder = recorder
+        if recorder is not None:
+            recorder.attach(self.left_creatures + self.right_creatures)
+
+    def use_timer(self, timer: None | PhaseTimer) -> None:
+        """Times the phases of sampled creature turns, see phase_timer. Every
+        chunk of battles is timed by a fresh PhaseTimer sampling like timer,
+        which comes back in the chunk's SimulationResult.timings, so simulate
+        returns the timings of all workers merged.
+
+        Args:
+            timer (None | PhaseTimer): The sampling to use, or None to stop.
+        """
+        self.timer = timer
+
+    def record(self, battle: int, seed: int = 0) -> CombatRecorder:
+        """Runs battle index battle of a run with the given base seed, e.g. one
+        returned by simulation_search, recording it. Use
+        combat_log.render(recorder.buffer, creatures) to read it.
+
+        Args:
+            battle (int): The index of the battle within the run.
+            seed (int, optional): The base seed of the run. Defaults to 0.
+
+        Returns:
+            CombatRecorder: The recorder holding the battle's records.
+        """
+        previous_recorder = self.recorder
+        recorder = CombatRecorder()
+        self.use_recorder(recorder)
+        try:
+            self._simulate_mp(seed, battle, 1)
+        finally:
+            self.use_recorder(previous_recorder)
+        return recorder
+
+    def replay(
+        self, battle: int, until_turn: None | int = None, seed: int = 0
+    ) -> "Simulator":
+        """Reconstructs a battle, e.g. one found by simulation_search, on a copy
+        of this simulator. The copy can be inspected, or branched from with
+        snapshot and one_battle, and its rng carries on where the battle is.
+        The copy has no cache or recorder.
+
+        Args:
+            battle (int): The battle's index within the run, as returned by
+                simulation_search. It draws from the stream (seed, battle).
+            until_turn (None | int, optional): Stop at the start of this turn
+                if the battle is still going. Defaults to None, play it out.
+            seed (int, optional): The base seed of the run. Defaults to 0.
+
+        Returns:
+            Simulator: A copy of this simulator in the state of the battle.
+        """
+        # keep the cache and recorder out of the copy
+        replayed = copy.deepcopy(self, {id(self.cache): None, id(self.recorder): None})
+        replayed.use_rng(BattleRandom(seed, battle))
+        replayed.one_battle(until_turn)
+        return replayed
+
+    def snapshot(self, canonical: bool = False) -> t.Tuple[t.Any, ...]:
+        """Captures the state of both teams as a flat template, so that battles
+        can be rerun from it with reset instead of deep copying the simulator.
+
+        Args:
+            canonical (bool, optional): Drop action history no creature looks
+                at anymore, see Creature.snapshot. Defaults to False.
+
+        Returns:
+            t.Tuple[t.Any, ...]: (current_turn, left snapshots, right snapshots)
+        """
+        return (
+            self.current_turn,
+            tuple(creature.snapshot(canonical) for creature in self.left_creatures),
+            tuple(creature.snapshot(canonical) for creature in self.right_creatures),
+        )
+
+    def state_key(self) -> t.Tuple[t.Any, ...]:
+        """A hashable key of the battle state. Two states with the same key play
+        out the same from here on, whatever led to them.
+
+        Returns:
+            t.Tuple[t.Any, ...]: The canonical snapshot of the battle.
+        """
+        return self.snapshot(canonical=True)
+
+    def reset(self, snapshot: t.Tuple[t.Any, ...]) -> None:
+        """Restores both teams in place to a template captured by snapshot.
+
+        Args:
+            snapshot (t.Tuple[t.Any, ...]): A template returned by snapshot.
+        """
+        self.current_turn, left_snapshots, right_snapshots = snapshot
+        for creature, creature_snapshot in zip(self.left_creatures, left_snapshots):
+            creature.reset(creature_snapshot)
+        for creature, creature_snapshot in zip(self.right_creatures, right_snapshots):
+            creature.reset(creature_snapshot)
 
     def __get_beat_of_death(self) -> t.Tuple[int, int]:
         """Gets the beat of death damage for each side.
@@ -53,50 +225,104 @@ class Simulator:
         """
         left_beat_total = 0
         for creature in self.left_creatures:
-            if "beat_of_death" in creature.permanents:
+            if creature.permanents.mask & BEAT_OF_DEATH:
                 left_beat_total += creature.permanents["beat_of_death"]
         right_beat_total = 0
         for creature in self.right_creatures:
-            if "beat_of_death" in creature.permanents:
+            if creature.permanents.mask & BEAT_OF_DEATH:
                 right_beat_total += creature.permanents["beat_of_death"]
         return left_beat_total, right_beat_total
 
-    def resolve_one_creature_turn(self, creature: Creature, is_left: bool) -> None:
+    def resolve_one_creature_turn(
+        self,
+        creature: Creature,
+        is_left: bool,
+        action: None | str = None,
+        target: None | int = None,
+    ) -> None:
         """Resolves one creature's turn.
 
         Args:
             creature (Creature): The creature to resolve
             is_left (bool): If they go first or not
+            action (None | str, optional): Forces the creature's action instead
+                of letting it pick one. Defaults to None.
+            target (None | int, optional): Forces the target of a single target
+                attack, as an index into the living enemies, instead of drawing
+                one. Defaults to None.
         """
+        timer = self.timer
+        if timer is not None and not timer.start():
+            timer = None
         if not creature.start_turn_resolution():
             return  # creature died
+        if timer is not None:
+            timer.lap(phase_timer.START_TURN)
 
         left_beat, right_beat = self.__get_beat_of_death()
+        if timer is not None:
+            timer.lap(phase_timer.BEAT_OF_DEATH_SCAN)
+            if action is None:
+                # draws exactly what take_action would
+                action = creature.pick_action()
+            timer.lap(phase_timer.ACTION_SELECTION)
 
-        attack = creature.take_action()
+        attack = creature.take_action(action)
+        self.actions_taken += 1
+        if timer is not None:
+            timer.lap(phase_timer.ATTACK_CONSTRUCTION)
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.action(self.current_turn, creature, creature.prev_actions[-1])
 
         enemy_creatures = self.right_creatures if is_left else self.left_creatures
-        logging.debug(
-            f"Acting Creature: {creature}. Enemy creatures: {enemy_creatures}"
-        )
+        if settings.trace:
+            logging.debug(
+                f"Acting Creature: {creature}. Enemy creatures: {enemy_creatures}"
+            )
         targets = [enemy for enemy in enemy_creatures if enemy.alive]
 
         if len(targets) == 0:
-            logging.info("No targets for attack")
+            if settings.trace:
+                logging.info("No targets for attack")
             return
         if not attack.multi_target:
-            targets = random.choices(targets, k=1)
+            if target is None:
+                # what choices(targets, k=1) draws, without its overhead
+                targets = [targets[int(self.rng.random() * len(targets))]]
+            else:
+                targets = [targets[target]]
+        if timer is not None:
+            timer.lap(phase_timer.TARGETING)
 
         for target in targets:
             # for each hit in the attack
             for _ in range(attack.hits):
+                if recorder is not None:
+                    hp, block = target.hp, target.block
                 # handle thorns/retaliation damage
                 receiving_damage = target.take_hit(attack)
+                if recorder is not None:
+                    recorder.damage(
+                        combat_log.HIT, self.current_turn, creature, target, hp, block
+                    )
+                    hp, block = creature.hp, creature.block
                 if receiving_damage > 0:
                     creature.take_damage(receiving_damage)
+                    if recorder is not None:
+                        recorder.damage(
+                            combat_log.RETALIATION,
+                            self.current_turn,
+                            target,
+                            creature,
+                            hp,
+                            block,
+                        )
                 # interrupt attacks if target dies mid combo
                 if not target.alive:
                     break
+            if timer is not None:
+                timer.lap(phase_timer.HIT_RESOLUTION)
 
             # apply statuses
             if attack.statuses:
@@ -106,13 +332,33 @@ class Simulator:
                         target.statuses[status] += attack.statuses[status]
                     else:
                         target.statuses[status] = None
+                    if recorder is not None:
+                        recorder.status(
+                            self.current_turn, creature, target, status, value
+                        )
+                if timer is not None:
+                    timer.lap(phase_timer.STATUS_APPLICATION)
 
-        if is_left and right_beat > 0:
-            creature.take_damage(right_beat)
-        elif not is_left and left_beat > 0:
+        if (right_beat if is_left else left_beat) > 0:
+            if recorder is not None:
+                hp, block = creature.hp, creature.block
+            # the right side takes right_beat too, kept as is for now
             creature.take_damage(right_beat)
+            if recorder is not None:
+                recorder.damage(
+                    combat_log.BEAT_OF_DEATH,
+                    self.current_turn,
+                    creature,
+                    creature,
+                    hp,
+                    block,
+                )
+            if timer is not None:
+                timer.lap(phase_timer.BEAT_OF_DEATH)
 
         creature.end_turn_resolution()
+        if timer is not None:
+            timer.lap(phase_timer.END_TURN)
 
     def _keep_simulating(self) -> t.Tuple[bool, bool | None]:
         """Checks if the simulation should continue. If not, returns the winner.
@@ -160,19 +406,47 @@ class Simulator:
         state_dict["right_creatures"] = get_side_state(self.right_creatures)
         return state_dict
 
-    def one_battle(self) -> bool:
+    def one_battle(self, until_turn: None | int = None) -> bool:
         """Simulates one battle between the two teams.
+
+        Args:
+            until_turn (None | int, optional): Stop at the start of this turn
+                if the battle is still going. Calling one_battle again carries
+                on from there. Defaults to None, play the battle out.
+
         Returns:
-            bool: True if left team won, False if right team won.
+            bool: True if left team won, False if right team won. None if
+                stopped at until_turn.
         """
         left_won = True
         keep_simulating = True
+        timer = self.timer
         while keep_simulating:
+            if until_turn is not None and self.current_turn >= until_turn:
+                return None  # type: ignore
+            if self.cache is not None:
+                entry = self.cache.lookup(self)
+                if entry is not None:
+                    left_won, left_hps, right_hps, rounds = self.cache.draw(
+                        entry, self.rng
+                    )
+                    # only hp, alive and the turn are brought to the end of the
+                    # battle, block, statuses and turns_taken stay as they are
+                    self.current_turn += rounds
+                    for creature, hp in zip(
+                        self.left_creatures + self.right_creatures,
+                        left_hps + right_hps,
+                    ):
+                        creature.raw_hp = hp
+                        creature.alive = hp > 0
+                    break
             # left team turn
             for creature in self.left_creatures:
                 if creature.alive:
                     self.resolve_one_creature_turn(creature, True)
                 keep_simulating, left_won = self._keep_simulating()
+                if timer is not None and timer.sampling:
+                    timer.lap(phase_timer.KEEP_SIMULATING)
                 if not keep_simulating:
                     break
             # right team turn
@@ -180,252 +454,608 @@ class Simulator:
                 if creature.alive:
                     self.resolve_one_creature_turn(creature, False)
                 keep_simulating, left_won = self._keep_simulating()
+                if timer is not None and timer.sampling:
+                    timer.lap(phase_timer.KEEP_SIMULATING)
                 if not keep_simulating:
                     break
             self.current_turn += 1
-        output = f"{0} side won with the following creatures: {1}"
-        side_won = "left" if left_won else "right"
-        winning_creatures = self.left_creatures if left_won else self.right_creatures
-        creatures = "\n".join(
-            str(creature) for creature in winning_creatures if creature.alive
-        )
-        logging.info(output.format(side_won, creatures))
+        if settings.trace:
+            output = "{0} side won with the following creatures: {1}"
+            side_won = "left" if left_won else "right"
+            winning_creatures = (
+                self.left_creatures if left_won else self.right_creatures
+            )
+            creatures = "\n".join(
+                str(creature) for creature in winning_creatures if creature.alive
+            )
+            logging.info(output.format(side_won, creatures))
+        if self.recorder is not None:
+            self.recorder.record(
+                combat_log.BATTLE_END, self.current_turn, code=int(bool(left_won))
+            )
         return left_won  # type: ignore
 
     def _simulate_mp(
-        self,
-        seed: None | int | float | str | bytes | bytearray = None,
-        num_iters: int = 1,
-    ) -> t.Tuple[int, t.ResultDict]:
-        """A helper method to simulate single threaded the battles. Used for
-        multiprocessing or single process.
+        self, seed: int, first_battle: int = 0, num_battles: int = 1
+    ) -> SimulationResult:
+        """A helper method to simulate single threaded a range of battles. Used
+        for multiprocessing or single process. Battle i draws from its own
+        stream (seed, i), so its outcome does not depend on how the battles
+        are split up.
 
         Args:
-            seed (None | int | float | str | bytes | bytearray, optional): The
-                random seed to use, if None doens't pass any argument.
-                Defaults to None.
-            num_iters (int, optional): Number of iterations to run. Defaults to 1.
+            seed (int): The base seed of the run.
+            first_battle (int, optional): Index of the first battle to run.
+                Defaults to 0.
+            num_battles (int, optional): Number of battles to run. Defaults to 1.
 
         Returns:
-            t.Tuple[int, t.ResultDict]: (number of wins by left side,
-                results dictionary)
+            SimulationResult: The totals of the battles.
         """
-        if seed is None:
-            random.seed()
+        result = SimulationResult.for_teams(self.left_creatures, self.right_creatures)
+        creatures = self.left_creatures + self.right_creatures
+        # the draws of the battles are pre-generated a block at a time
+        battle_rng = BattleRandom(
+            seed, first_battle, block_battles=min(BLOCK_BATTLES, num_battles)
+        )
+        previous_rng = self.rng
+        self.use_rng(battle_rng)
+        # Capture the starting teams once and restore them in place per battle
+        template = self.snapshot()
+        writer = None if self.records is None else self.records.writer(first_battle)
+        previous_timer = self.timer
+        if previous_timer is not None:
+            self.timer = result.timings = PhaseTimer(previous_timer.sample_every)
+        cache = self.cache
+        if cache is not None:
+            hits, misses = cache.hits, cache.misses
+        try:
+            for battle in range(first_battle, first_battle + num_battles):
+                self.reset(template)
+                self.actions_taken = 0
+                battle_rng.reset(seed, battle)
+                if self.recorder is not None:
+                    self.recorder.record(combat_log.BATTLE_START, value=battle)
+                left_won = self.one_battle()
+                result.add_battle(left_won, creatures, self.current_turn)
+                if writer is not None:
+                    writer.add(
+                        battle,
+                        left_won,
+                        self.current_turn,
+                        self.actions_taken,
+                        creatures,
+                    )
+            if writer is not None:
+                writer.flush()
+            if cache is not None:
+                result.cache_hits = cache.hits - hits
+                result.cache_misses = cache.misses - misses
+        finally:
+            self.reset(template)
+            self.use_rng(previous_rng)
+            self.timer = previous_timer
+        return result
+
+    def _simulate_chunk(
+        self, seed: int, first_battle: int, num_battles: int
+    ) -> t.Tuple[int, SimulationResult, float]:
+        """Runs one chunk of battles in a worker, timing it.
+
+        Returns:
+            t.Tuple[int, SimulationResult, float]: (first battle, totals of the
+                chunk, seconds taken)
+        """
+        start = time.perf_counter()
+        result = self._simulate_mp(seed, first_battle, num_battles)
+        return first_battle, result, time.perf_counter() - start
+
+    def _simulate_chunks(
+        self,
+        seed: int,
+        num_battles: int,
+        num_cores: int,
+        completed: None | t.List[t.Tuple[int, int]] = None,
+    ) -> t.Generator[t.Tuple[int, SimulationResult], None | int, None]:
+        """Runs battles 0 to num_battles - 1 in chunks with _simulate_chunk,
+        see _run_chunks.
+
+        Yields:
+            t.Tuple[int, SimulationResult]: (first battle, totals of the chunk)
+        """
+        return self._run_chunks(
+            self._simulate_chunk, seed, num_battles, num_cores, completed
+        )
+
+    def _run_chunks(
+        self,
+        task: t.Callable[[int, int, int], t.Tuple[int, t.Any, float]],
+        seed: int,
+        num_battles: None | int,
+        num_cores: int,
+        completed: None | t.List[t.Tuple[int, int]] = None,
+    ) -> t.Generator[t.Tuple[int, t.Any], None | int, None]:
+        """Runs battles 0 to num_battles - 1 as many small chunks, yielding each
+        chunk's results as it completes. With more than one core, idle workers
+        pull the next chunk from the pool's queue, so cores that draw long
+        battles simply take fewer chunks. Chunk size adapts to the measured
+        battle duration and shrinks near the end, to even out the tail.
+        Closing the generator early cancels the queued chunks, and sending it
+        a battle index stops it from running or yielding chunks that start
+        at or after that battle.
+
+        Args:
+            task (t.Callable[[int, int, int], t.Tuple[int, t.Any, float]]): Runs
+                a chunk: (seed, first battle, number of battles) -> (first
+                battle, result, seconds taken), e.g. _simulate_chunk.
+            seed (int): The base seed of the run.
+            num_battles (None | int): Exactly how many battles to run, or None
+                to keep going until the generator is closed.
+            num_cores (int): Number of processes to run chunks on. With 1, the
+                chunks run in this process.
+            completed (None | t.List[t.Tuple[int, int]], optional): Ranges of
+                battles, as (first battle, number of battles), that already ran
+                and are skipped. Defaults to None.
+
+        Yields:
+            t.Tuple[int, t.Any]: (first battle, result of the chunk)
+        """
+        chunk_size = FIRST_CHUNK_SIZE
+        # the ranges still to hand out, as (first battle, number of battles),
+        # the last one open ended (None) when num_battles is
+        missing: t.List[t.Tuple[int, None | int]]
+        if num_battles is None:
+            missing = [(0, None)]
         else:
-            random.seed(seed)
-        results: t.Dict[str, t.Dict[str, t.Dict[str, int]]] = {"left": {}, "right": {}}
+            missing = list(self._missing_ranges(completed or [], num_battles))
+        cap = None
 
-        num_left_wins = 0
-        # Do the simulation
-        for _ in range(num_iters):
-            new_sim = copy.deepcopy(self)
-            result = new_sim.one_battle()
-            result_state = new_sim.get_state()
-            self.merge_results(results, result_state)
-            num_left_wins += 1 if result else 0
-        return num_left_wins, results
+        def remaining() -> None | int:
+            if missing and missing[-1][1] is None:
+                return None
+            return sum(count for _, count in missing)  # type: ignore
+
+        def next_chunk() -> t.Tuple[int, int]:
+            first, count = missing[0]
+            taken = chunk_size if count is None else min(chunk_size, count)
+            if taken == count:
+                missing.pop(0)
+            else:
+                missing[0] = (first + taken, None if count is None else count - taken)
+            return first, taken
+
+        def lower_cap(new_cap: None | int) -> bool:
+            """Drops the battles from new_cap on, returns whether cap moved."""
+            nonlocal cap, missing
+            if new_cap is None or (cap is not None and new_cap >= cap):
+                return False
+            cap = new_cap
+            missing = [
+                (first, cap - first if count is None else min(count, cap - first))
+                for first, count in missing
+                if first < cap
+            ]
+            return True
+
+        if num_cores <= 1:
+            while missing:
+                first, count = next_chunk()
+                chunk = task(seed, first, count)
+                chunk_size = self._next_chunk_size(
+                    chunk_size, count, chunk[2], remaining(), 1
+                )
+                lower_cap((yield chunk[:2]))
+            return
+
+        executor = ProcessPoolExecutor(max_workers=num_cores)
+        # future -> (first battle, number of battles)
+        pending: t.Dict[Future[t.Any], t.Tuple[int, int]] = {}
+        try:
+            while missing or pending:
+                # keep every worker busy with a chunk queued up behind it
+                while missing and len(pending) < 2 * num_cores:
+                    first, count = next_chunk()
+                    pending[executor.submit(task, seed, first, count)] = (first, count)
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    first, count = pending.pop(future)
+                    if cap is not None and first >= cap:
+                        continue
+                    chunk = future.result()
+                    chunk_size = self._next_chunk_size(
+                        chunk_size, count, chunk[2], remaining(), num_cores
+                    )
+                    if lower_cap((yield chunk[:2])):
+                        for queued, (first, _) in list(pending.items()):
+                            if first >= cap and queued.cancel():  # type: ignore
+                                del pending[queued]
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
 
     @staticmethod
-    def merge_results(
-        results: t.ResultDict,
-        result_state: t.Dict[str, t.Dict[str, t.List[str | t.Tuple[str, int]]]],
-    ) -> None:
-        """Merges the results of a battle into the results dictionary. Example:
-        results = {'left': {'creature1': {'total_hp': 100, 'count': 1}},
-                    'right': {'creature2': {'total_hp': 100, 'count': 1}}}
+    def _missing_ranges(
+        completed: t.List[t.Tuple[int, int]], num_battles: int
+    ) -> t.List[t.Tuple[int, int]]:
+        """The ranges of battles 0 to num_battles - 1 not covered by completed.
 
         Args:
-            results (t.Dict[str, t.Dict[str, t.Dict[str, int]]]): The core
-                results dicitonary to merge data into
-            result_state (t.Dict[str,t.Dict[str, t.List[str  |  t.Tuple[str, int]]]]):
-                The results of a single battle
+            completed (t.List[t.Tuple[int, int]]): Ranges that ran, as
+                (first battle, number of battles), in any order.
+            num_battles (int): Number of battles in the run.
+
+        Returns:
+            t.List[t.Tuple[int, int]]: The gaps, as (first battle, number of
+                battles), in order.
         """
-        for side in result_state:
-            result_name = side.split("_")[0]  # get left or right
-            for alive_or_dead in result_state[side]:
-                for creature in result_state[side][alive_or_dead]:
-                    name = creature[0]
-                    if alive_or_dead == "dead":
-                        name = creature
-                    if name not in results[result_name]:
-                        results[result_name][name] = {  # type: ignore
-                            "total_hp": creature[1] if alive_or_dead == "alive" else 0,
-                            "count": 1,
-                        }
-                    else:
-                        name = creature[0]
-                        if alive_or_dead != "alive":
-                            name = creature
-                        hp = creature[1] if alive_or_dead == "alive" else 0
-                        results[result_name][name]["total_hp"] += hp  # type: ignore
-                        results[result_name][name]["count"] += 1  # type: ignore
+        missing = []
+        next_battle = 0
+        for first, count in sorted(completed):
+            if first > next_battle:
+                missing.append((next_battle, min(first, num_battles) - next_battle))
+            next_battle = max(next_battle, first + count)
+            if next_battle >= num_battles:
+                break
+        if next_battle < num_battles:
+            missing.append((next_battle, num_battles - next_battle))
+        return [(first, count) for first, count in missing if count > 0]
+
+    def _checkpoint_run(
+        self, seed: int, num_battles: int, engine: str
+    ) -> t.Dict[str, t.Any]:
+        """What a checkpoint must match to be resumed: the run's seed, size and
+        engine, the teams as they start and the ascension and act.
+        """
+        empty = SimulationResult.for_teams(self.left_creatures, self.right_creatures)
+        return {
+            "seed": seed,
+            "num_battles": num_battles,
+            "engine": engine,
+            "left_names": empty.left_names,
+            "right_names": empty.right_names,
+            "start_hps": empty.start_hps,
+            "ascension": settings.ascension,
+            "act": state.act,
+        }
 
     @staticmethod
-    def update_results(base_dict: t.ResultDict, additional_dict: t.ResultDict) -> None:
-        """Updates the base_dict with the values from additional_dict
+    def _save_checkpoint(
+        path: str,
+        run: t.Dict[str, t.Any],
+        result: SimulationResult,
+        completed: t.List[t.Tuple[int, int]],
+    ) -> None:
+        """Writes the state of a run, see _checkpoint_run, to path, replacing
+        the previous checkpoint only once the new one is complete, so an
+        interrupted write never loses it.
+        """
+        checkpoint = {**run, "result": result, "completed": sorted(completed)}
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "wb") as file:
+            pickle.dump(checkpoint, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, path)
+
+    @staticmethod
+    def _next_chunk_size(
+        chunk_size: int,
+        num_battles: int,
+        seconds: float,
+        remaining_battles: None | int,
+        num_cores: int,
+    ) -> int:
+        """Picks the size of the next chunk from how long the last one took.
 
         Args:
-            base_dict (t.ResultDict): The base dictionary to update
-            additional_dict (t.ResultDict): The dictionary to update base_dict with
+            chunk_size (int): The current chunk size.
+            num_battles (int): Battles in the chunk that just completed.
+            seconds (float): How long that chunk took.
+            remaining_battles (None | int): Battles not yet handed out, None
+                if there is no end.
+            num_cores (int): Number of workers sharing the remaining battles.
+
+        Returns:
+            int: The next chunk size.
         """
-        for side in additional_dict:
-            for creature in additional_dict[side]:
-                if creature not in base_dict[side]:
-                    base_dict[side][creature] = additional_dict[side][creature]
-                else:
-                    base_dict[side][creature]["total_hp"] += additional_dict[side][
-                        creature
-                    ]["total_hp"]
-                    base_dict[side][creature]["count"] += additional_dict[side][
-                        creature
-                    ]["count"]
-        del additional_dict
+        if seconds > 0:
+            # move halfway to the size that would take CHUNK_SECONDS
+            target_size = CHUNK_SECONDS * num_battles / seconds
+            chunk_size = int((chunk_size + target_size) / 2)
+        if remaining_battles is None:
+            return max(1, chunk_size)
+        # leave a few chunks per core for the end, so no core finishes long last
+        return max(1, min(chunk_size, remaining_battles // (4 * num_cores)))
 
     def simulate(
-        self, num_battles: int = 100_000, num_cores: int = 4, seed: None | int = None
-    ) -> None:
+        self,
+        num_battles: int = 100_000,
+        num_cores: int = DEFAULT_NUM_CORES,
+        seed: None | int = None,
+        engine: str = "python",
+        target_ci_width: None | float = None,
+        confidence: float = 0.95,
+        max_battles: None | int = None,
+        records_path: None | str = None,
+        checkpoint_path: None | str = None,
+        resume: bool = False,
+    ) -> SimulationResult:
         """Simulates a number of battles between the two teams.
 
         Args:
             num_battles (int): Number of battles to simulate.
+            num_cores (int): Number of processes to spread the battles over.
+                Defaults to DEFAULT_NUM_CORES, 4 or os.cpu_count() if lower.
+            seed (None | int): The base seed. Battle i always draws from the
+                stream (seed, i), so results are identical for any num_cores.
+                If None, a seed is taken from the clock.
+            engine (str): "python" to resolve battles one at a time, or "numpy"
+                to run them in lockstep batches with BatchEngine, which only
+                supports Jaw Worms and Hearts and runs in this process. Both
+                engines give the same result for the same seed.
+            target_ci_width (None | float): If set, stop as soon as the Wilson
+                interval of the left win rate is at most this wide, cancelling
+                outstanding work, e.g. 0.01 for +-0.5%.
+            confidence (float): Confidence level of the interval.
+            max_battles (None | int): Cap on battles when target_ci_width is
+                set. Defaults to num_battles.
+            records_path (None | str): If set, every battle's outcome is
+                written by the worker that ran it to a BattleRecords file at
+                this path, row i holding battle i. Battles skipped by an early
+                stop keep winner -1. Only for the python engine without a
+                transposition cache, whose hits skip the actions the records
+                count.
+            checkpoint_path (None | str): If set, the merged totals and the
+                ranges of battles completed so far are saved to this path every
+                CHECKPOINT_SECONDS and at the end. Only for the python engine.
+            resume (bool): Continue the run saved at checkpoint_path, if there
+                is one, only running the battles it is missing. The result is
+                identical to that of an uninterrupted run. If seed is None, the
+                checkpoint's seed is used.
+
+        Raises:
+            ValueError: If the options do not fit the engine, or the
+                checkpoint is of a different run: another seed, number of
+                battles, engine, team, ascension or act.
 
         Returns:
-            t.Tuple[int, int]: (left_wins, right_wins)
+            SimulationResult: The totals of every battle simulated.
         """
-        results: t.ResultDict = {"left": {}, "right": {}}
-        num_left_wins = 0
-        if num_cores > 1:
-            with ProcessPoolExecutor(max_workers=num_cores) as executor:
-                running_tasks = [
-                    executor.submit(
-                        self._simulate_mp,
-                        time.time_ns() if seed is not None else seed,
-                        num_battles // num_cores,
-                    )
-                    for _ in range(num_cores)
-                ]
-                for i, task in enumerate(running_tasks):
-                    left_wins, result_dict = task.result()
-                    num_left_wins += left_wins
-                    self.update_results(results, result_dict)
-                    logging.info(
-                        f"Simulated {i*num_cores} battles. Left win rate: "
-                        f"{num_left_wins / ((i+1) * num_battles // num_cores)}"
-                    )
-        else:
-            for i in range(num_battles):
-                left_won, result_state = self._simulate_mp(
-                    seed=i if seed is not None else seed
+        if engine not in ("python", "numpy"):
+            raise ValueError(f"Unknown engine {engine}. Options: python, numpy")
+        if engine != "python" and (records_path or checkpoint_path):
+            raise ValueError(
+                "Battle records and checkpoints are only written by the python engine."
+            )
+        if records_path and self.cache is not None:
+            raise ValueError(
+                "Battle records count every action, which cache hits skip."
+            )
+        if target_ci_width is not None and max_battles is not None:
+            num_battles = max_battles
+        checkpoint = None
+        if resume and checkpoint_path and os.path.exists(checkpoint_path):
+            with open(checkpoint_path, "rb") as file:
+                checkpoint = pickle.load(file)
+            if seed is None:
+                seed = checkpoint["seed"]
+        if seed is None:
+            seed = time.time_ns()
+        run = self._checkpoint_run(seed, num_battles, engine)
+        if checkpoint is not None:
+            mismatched = [
+                f"{key} {checkpoint.get(key)} instead of {value}"
+                for key, value in run.items()
+                if checkpoint.get(key) != value
+            ]
+            if mismatched:
+                raise ValueError(
+                    f"{checkpoint_path} is of another run, with "
+                    f"{', '.join(mismatched)}."
                 )
-                num_left_wins += left_won
-                self.update_results(results, result_state)
-                if i % 1000 == 0 and i != 0:
-                    logging.info(
-                        f"Simulated {i} battles. Left win rate: {num_left_wins / i}"
+        interval = (0.0, 1.0)
+
+        def precise_enough(left_wins: int, battles: int) -> bool:
+            nonlocal interval
+            if target_ci_width is None:
+                return False
+            interval = utils.wilson_interval(left_wins, battles, confidence)
+            return interval[1] - interval[0] <= target_ci_width
+
+        if engine == "numpy":
+            batch_engine = BatchEngine(self.left_creatures, self.right_creatures)
+            result = batch_engine.run(num_battles, seed=seed, stop=precise_enough)
+        else:
+            result = SimulationResult.for_teams(
+                self.left_creatures, self.right_creatures
+            )
+            completed: t.List[t.Tuple[int, int]] = []
+            if checkpoint is not None:
+                completed = checkpoint["completed"]
+                result.merge(checkpoint["result"])
+            if records_path is not None:
+                if checkpoint is not None and os.path.exists(records_path):
+                    self.records = BattleRecords(records_path)
+                else:
+                    self.records = BattleRecords.create(
+                        records_path,
+                        num_battles,
+                        len(self.left_creatures) + len(self.right_creatures),
+                        seed,
                     )
-        print(f"Left win rate: {num_left_wins / num_battles}")
-        print(results)
+            last_progress = last_checkpoint = time.perf_counter()
+            chunks = self._simulate_chunks(seed, num_battles, num_cores, completed)
+            try:
+                for first_battle, chunk_result in chunks:
+                    result.merge(chunk_result)
+                    completed.append((first_battle, chunk_result.num_battles))
+                    if (
+                        checkpoint_path is not None
+                        and time.perf_counter() - last_checkpoint >= CHECKPOINT_SECONDS
+                    ):
+                        self._save_checkpoint(checkpoint_path, run, result, completed)
+                        last_checkpoint = time.perf_counter()
+                    if precise_enough(result.left_wins, result.num_battles):
+                        break
+                    if time.perf_counter() - last_progress >= PROGRESS_SECONDS:
+                        last_progress = time.perf_counter()
+                        logging.info(
+                            f"Simulated {result.num_battles} battles. "
+                            f"Left win rate: {result.left_win_rate}"
+                        )
+            finally:
+                # cancels any chunks still queued
+                chunks.close()
+                self.records = None
+            if checkpoint_path is not None:
+                self._save_checkpoint(checkpoint_path, run, result, completed)
+            if result.timings is not None:
+                logging.info(result.timings.report())
+            if self.cache is not None:
+                logging.info(
+                    f"Transposition cache hit rate: {result.cache_hit_rate:.2%} "
+                    f"over {result.cache_hits + result.cache_misses} lookups"
+                )
+        if target_ci_width is not None:
+            logging.info(
+                f"{confidence:.0%} confidence interval: [{interval[0]:.4f}, "
+                f"{interval[1]:.4f}] after {result.num_battles} battles"
+            )
+        return result
 
     def _simulate_search_mp(
-        self, num_battles: int, base_seed: int, args: t.Dict[str, t.Any]
-    ) -> t.Any:
-        """_summary_
+        self, seed: int, first_battle: int, num_battles: int, predicate: Predicate
+    ) -> None | int:
+        """Runs a range of battles, looking for one meeting the search criteria.
+        Battles are played a round at a time, and abandoned as soon as the
+        predicate is met or can no longer be met.
 
         Args:
-            base_seed (int): Seeds are iterated upon by adding 1 each iter, this is the first seed.
+            seed (int): The base seed of the search.
+            first_battle (int): Index of the first battle to run, battle i
+                draws from the stream (seed, i).
+            num_battles (int): Number of battles to run.
+            predicate (Predicate): What to search for, see search_predicates.
 
         Returns:
-            t.Any: _description_
+            None | int: The index of the first matching battle, or None.
         """
-
-        one_side_search = None
-        if "a_left_win" in args and "a_right_win" in args:
-            if bool(args["a_left_win"]) ^ bool(args["a_right_win"]):
-                one_side_search = bool(args["a_left_win"])
-            else:
-                raise ValueError(
-                    f"Cannot search for both/neither a left win and a right win."
-                    f'Got a_left_win: {args["a_left_win"]}, a_right_win: {args["a_right_win"]}'
-                )
-        elif "a_left_win" not in args and "a_right_win" not in args:
-            raise ValueError(
-                "Must provide a search criteria. Options: a_left_win, a_right_win"
-            )
-        else:
-            one_side_search = (
-                bool(args["a_left_win"]) if "a_left_win" in args else False
-            )
-
-        # In future expand this to check for more conditions
-        if one_side_search is None:  # type: ignore
-            raise ValueError(
-                "Must provide a search criteria. Options: a_left_win, a_right_win"
-            )
-
-        cur_seed = base_seed
+        # the draws of the battles are pre-generated a block at a time
+        battle_rng = BattleRandom(
+            seed, first_battle, block_battles=min(BLOCK_BATTLES, num_battles)
+        )
+        previous_rng = self.rng
+        self.use_rng(battle_rng)
+        # predicates look at how battles play out, which a cache hit skips
+        previous_cache = self.cache
+        self.cache = None
+        template = self.snapshot()
         # Do the simulation
-        for _ in range(num_battles):
-            new_sim = copy.deepcopy(self)
-            random.seed(cur_seed)
-            result = new_sim.one_battle()
-            # we got a left win and want a left win, or we got a right win and want a right win
-            if result == one_side_search:
-                return cur_seed
-            cur_seed += 1
+        try:
+            for battle in range(first_battle, first_battle + num_battles):
+                self.reset(template)
+                battle_rng.reset(seed, battle)
+                verdict = predicate.verdict(self, None)
+                while verdict is None:
+                    left_won = self.one_battle(until_turn=self.current_turn + 1)
+                    verdict = predicate.verdict(self, left_won)
+                if verdict:
+                    return battle
+        finally:
+            self.reset(template)
+            self.use_rng(previous_rng)
+            self.cache = previous_cache
         return None
 
+    def _search_chunk(
+        self, seed: int, first_battle: int, num_battles: int, predicate: Predicate
+    ) -> t.Tuple[int, None | int, float]:
+        """Searches one chunk of battles in a worker, timing it.
+
+        Returns:
+            t.Tuple[int, None | int, float]: (first battle, index of the first
+                matching battle or None, seconds taken)
+        """
+        start = time.perf_counter()
+        found = self._simulate_search_mp(seed, first_battle, num_battles, predicate)
+        return first_battle, found, time.perf_counter() - start
+
     def simulation_search(self, /, **kwargs: t.Any) -> t.Any:
-        """Performs a search over the simulation space.
+        """Performs a search over the simulation space. Battles are handed out
+        in chunks, as in simulate, and the search returns as soon as a match
+        is found, cancelling the queued chunks.
 
         Args:
             **kwargs (t.Dict[str, t.Any]): The search criteria. Options:
-                'a_left_win': Returns (true, seed) if a left win is found.
-                    Return's the seed used for random for this. Cannot be used with 'a_right_win'.
-                'a_right_win': Returns (true, seed) if a right win is found.
-                    Return's the seed used for random for this. Cannot be used with 'a_left_win'.
+                'predicate': Returns the index of a battle meeting the
+                    search_predicates.Predicate, e.g. DiesByTurn(2, 10) & LeftWins().
+                    Cannot be used with 'a_left_win' or 'a_right_win'.
+                'a_left_win': Returns the battle index if a left win is found.
+                    BattleRandom(seed, index) replays it. Cannot be used with 'a_right_win'.
+                'a_right_win': Returns the battle index if a right win is found.
+                    BattleRandom(seed, index) replays it. Cannot be used with 'a_left_win'.
+                'seed': The base seed of the search. Defaults to 0.
                 'max_battles': The maximum number of battles to run. Defaults to 1_000.
                     Set to -1 for infinite.
-                'num_cores': The number of cores to use. Defaults to 4.
-                    Set to 1 for single threaded. If logging is desired, MUST be set to 1.
+                'num_cores': The number of cores to use. Defaults to
+                    DEFAULT_NUM_CORES, 4 or os.cpu_count() if lower.
+                    Set to 1 to search in this process. If logging is desired, MUST be set to 1.
+                'lowest': If True, return the lowest matching battle index
+                    rather than the first one found, which with several cores
+                    may not be the lowest. Defaults to False.
 
         Returns:
-            t.Any: The relevant value of the search criteria.
+            t.Any: The relevant value of the search criteria, None if nothing
+                matched within max_battles.
         """
+        max_battles = t.cast(int, kwargs.get("max_battles", 1_000))
+        num_cores = t.cast(int, kwargs.get("num_cores", DEFAULT_NUM_CORES))
+        seed = t.cast(int, kwargs.get("seed", 0))
+        lowest = bool(kwargs.get("lowest", False))
 
-        max_battles = 1_000
-        num_cores = 4
-        search_for_win = None
+        logging.debug(f"Search criteria: {kwargs}")
 
-        print(f"kwargs: {kwargs}")
-
-        if "num_cores" in kwargs:
-            num_cores = t.cast(int, kwargs["num_cores"])
-        if "max_battles" in kwargs:
-            max_battles = t.cast(int, kwargs["max_battles"])
-        if "a_left_win" in kwargs:
-            search_for_win = True
+        predicate: None | Predicate = kwargs.get("predicate")
+        if predicate is not None and (
+            "a_left_win" in kwargs or "a_right_win" in kwargs
+        ):
+            raise ValueError("Cannot combine a predicate with a_left_win/a_right_win.")
+        if predicate is not None:
+            if not isinstance(predicate, Predicate):
+                raise ValueError(f"{predicate} is not a search_predicates.Predicate.")
+        elif "a_left_win" in kwargs and "a_right_win" in kwargs:
+            if bool(kwargs["a_left_win"]) ^ bool(kwargs["a_right_win"]):
+                predicate = LeftWins() if kwargs["a_left_win"] else RightWins()
+            else:
+                raise ValueError(
+                    f"Cannot search for both/neither a left win and a right win."
+                    f'Got a_left_win: {kwargs["a_left_win"]}, a_right_win: {kwargs["a_right_win"]}'
+                )
+        elif "a_left_win" in kwargs:
+            predicate = LeftWins() if kwargs["a_left_win"] else RightWins()
         elif "a_right_win" in kwargs:
-            search_for_win = False
-
-        # In future we'll accept more options. For now if search_for_win is None,
-        # we don't have a valid search criteria.
-        if search_for_win is None:
+            predicate = RightWins()
+        else:
             raise ValueError("No valid search criteria provided.")
 
-        # this should work?
-        if True:  # num_cores > 1:
-            with ProcessPoolExecutor(max_workers=num_cores) as executor:
-                running_tasks = [
-                    executor.submit(
-                        self._simulate_search_mp,
-                        seed * max_battles // num_cores,
-                        max_battles // num_cores,
-                        kwargs,
-                    )
-                    for seed in range(num_cores)
-                ]
-                for _, task in enumerate(running_tasks):
-                    winning_seed = task.result()
-                    if winning_seed is not None:
-                        return winning_seed
+        chunks = self._run_chunks(
+            functools.partial(self._search_chunk, predicate=predicate),
+            seed,
+            None if max_battles == -1 else max_battles,
+            num_cores,
+        )
+        best = None
+        try:
+            chunk = next(chunks, None)
+            while chunk is not None:
+                found = chunk[1]
+                if found is not None:
+                    if not lowest:
+                        return found
+                    best = found if best is None else min(best, found)
+                # only chunks before the best match so far can still matter
+                chunk = chunks.send(best)
+        except StopIteration:
+            pass
+        finally:
+            chunks.close()
+        return best
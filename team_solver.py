@@ -0,0 +1,171 @@
+"""
+team_solver.py
+Answers questions of the form "how many Jaw Worms does it take to kill a
+Heart": finds the smallest team of one creature that beats an opposing team
+at least a target fraction of the time. Each candidate team size is decided by
+a sequential probability ratio test, so it only costs as many battles as it
+takes to tell whether its win rate is above or below the target.
+
+Zachary McCullough
+"""
+
+#########
+# Imports
+#########
+
+# Builtins
+
+import logging
+import math
+import time
+
+# Customs
+
+from creature import Creature
+from simulator import Simulator
+import custom_typing as t
+
+
+###########
+# Functions
+###########
+
+
+def sprt(
+    simulator: Simulator,
+    target_win_rate: float,
+    tolerance: float = 0.05,
+    error_rate: float = 0.05,
+    max_battles: int = 100_000,
+    num_cores: int = 1,
+    seed: int = 0,
+) -> t.Tuple[bool, int, int]:
+    """Decides whether the left side wins at least target_win_rate of the
+    time with Wald's sequential probability ratio test, testing a win rate of
+    target_win_rate - tolerance against target_win_rate + tolerance. Win rates
+    within tolerance of the target may be decided either way.
+
+    Battles are streamed in chunks from Simulator._simulate_chunks, and the
+    test stops at the first chunk that crosses a decision boundary.
+
+    Args:
+        simulator (Simulator): The matchup, left side is the side tested.
+        target_win_rate (float): The win rate to decide against.
+        tolerance (float, optional): Half width of the indifference region.
+            Defaults to 0.05.
+        error_rate (float, optional): Chance of a wrong decision when the
+            win rate is outside the indifference region. Defaults to 0.05.
+        max_battles (int, optional): Cap on battles. If no boundary is
+            crossed by then, the decision is made on the observed win rate.
+            Defaults to 100_000.
+        num_cores (int, optional): Number of processes to use. Defaults to 1.
+        seed (int, optional): The base seed of the battles. Defaults to 0.
+
+    Returns:
+        t.Tuple[bool, int, int]: (whether the win rate is at least the
+            target, number of wins by left side, number of battles run)
+    """
+    low = max(target_win_rate - tolerance, 1e-9)
+    high = min(target_win_rate + tolerance, 1 - 1e-9)
+    # log likelihood ratio of high over low, per win and per loss
+    win_step = math.log(high / low)
+    loss_step = math.log((1 - high) / (1 - low))
+    accept_high = math.log((1 - error_rate) / error_rate)
+    accept_low = -accept_high
+
+    num_left_wins = 0
+    num_battles = 0
+    log_ratio = 0.0
+    chunks = simulator._simulate_chunks(seed, max_battles, num_cores)
+    try:
+        for _, result in chunks:
+            left_wins = result.left_wins
+            num_left_wins += left_wins
+            num_battles += result.num_battles
+            log_ratio += (
+                left_wins * win_step + (result.num_battles - left_wins) * loss_step
+            )
+            if log_ratio >= accept_high:
+                return True, num_left_wins, num_battles
+            if log_ratio <= accept_low:
+                return False, num_left_wins, num_battles
+    finally:
+        chunks.close()
+    return num_left_wins >= target_win_rate * num_battles, num_left_wins, num_battles
+
+
+def min_team_size(
+    creature_factory: t.Callable[[], Creature],
+    opponents: t.List[Creature],
+    target_win_rate: float = 0.5,
+    max_size: int = 64,
+    tolerance: float = 0.05,
+    error_rate: float = 0.05,
+    max_battles: int = 100_000,
+    num_cores: int = 1,
+    seed: None | int = None,
+) -> None | int:
+    """Finds the smallest number of creature_factory() creatures that, going
+    first, beat opponents at least target_win_rate of the time. Team sizes are
+    bracketed by doubling, then narrowed down by binary search, assuming a
+    bigger team never does worse. Every size is tested on the same battle
+    streams, so neighbouring sizes are compared on the same luck.
+
+    Args:
+        creature_factory (t.Callable[[], Creature]): Makes one team member,
+            e.g. JawWorm or lambda: JawWorm(hp=40).
+        opponents (t.List[Creature]): The team to beat, going second.
+        target_win_rate (float, optional): The win rate to reach.
+            Defaults to 0.5.
+        max_size (int, optional): The largest team size to try. Defaults to 64.
+        tolerance (float, optional): See sprt. Defaults to 0.05.
+        error_rate (float, optional): See sprt. Defaults to 0.05.
+        max_battles (int, optional): Cap on battles per team size.
+            Defaults to 100_000.
+        num_cores (int, optional): Number of processes to use. Defaults to 1.
+        seed (None | int, optional): The base seed. If None, a seed is taken
+            from the clock. Defaults to None.
+
+    Returns:
+        None | int: The smallest team size reaching the target, or None if
+            max_size does not.
+    """
+    if seed is None:
+        seed = time.time_ns()
+    decisions: t.Dict[int, bool] = {}
+
+    def reaches_target(size: int) -> bool:
+        if size not in decisions:
+            team = [creature_factory() for _ in range(size)]
+            simulator = Simulator(team, opponents)
+            decisions[size], wins, battles = sprt(
+                simulator,
+                target_win_rate,
+                tolerance=tolerance,
+                error_rate=error_rate,
+                max_battles=max_battles,
+                num_cores=num_cores,
+                seed=seed,  # type: ignore
+            )
+            logging.info(
+                f"Team of {size}: {wins}/{battles} wins, "
+                f"{'reaches' if decisions[size] else 'misses'} {target_win_rate}"
+            )
+        return decisions[size]
+
+    # bracket: too_small misses the target, big_enough reaches it
+    too_small = 0
+    big_enough = 1
+    while not reaches_target(big_enough):
+        if big_enough == max_size:
+            return None
+        too_small = big_enough
+        big_enough = min(2 * big_enough, max_size)
+
+    while big_enough - too_small > 1:
+        size = (too_small + big_enough) // 2
+        if reaches_target(size):
+            big_enough = size
+        else:
+            too_small = size
+    return big_enough
@@ -0,0 +1,180 @@
+"""
+transposition_cache.py
+Contains TranspositionCache, a bounded cache from mid-battle states to the
+exact distribution of how the battle ends from there. Many Monte Carlo battles
+pass through the same state, and with a cache installed Simulator.one_battle
+draws the ending of such a battle straight from the cached distribution
+instead of playing it out. A cache sent to a worker process resolves to one
+cache per process, so every chunk a worker runs shares what earlier chunks
+cached.
+
+Zachary McCullough
+"""
+
+#########
+# Imports
+#########
+
+# Builtins
+
+from bisect import bisect_right
+from collections import OrderedDict
+from itertools import accumulate
+import uuid
+import weakref
+
+# Customs
+
+from simulator import Simulator
+import custom_typing as t
+import exact_solver
+
+# (cumulative probabilities, outcomes), or () for a state too big to solve
+CacheEntry = t.Tuple[t.Any, ...]
+
+# token -> the cache standing in for it in this process, see __reduce__. The
+# caches made here are held until the process exits, as a worker's copy of a
+# simulator is dropped after every chunk. Those made by the caller are not.
+_PROCESS_CACHES: t.Dict[str, "TranspositionCache"] = {}
+_OWN_CACHES: "weakref.WeakValueDictionary[str, TranspositionCache]" = (
+    weakref.WeakValueDictionary()
+)
+
+
+###########
+# Functions
+###########
+
+
+def _process_cache(token: str, *args: t.Any) -> "TranspositionCache":
+    """The cache of this process for token, made empty the first time."""
+    # not "or", an empty cache is falsy
+    cache = _OWN_CACHES.get(token)
+    if cache is None:
+        cache = _PROCESS_CACHES.get(token)
+    if cache is None:
+        cache = _PROCESS_CACHES[token] = TranspositionCache(*args, token=token)
+    return cache
+
+
+#########
+# Classes
+#########
+
+
+class TranspositionCache:
+    def __init__(
+        self,
+        max_entries: int = 100_000,
+        max_states: int = 2_000,
+        min_visits: int = 2,
+        solve_share: float = 0.1,
+        token: None | str = None,
+    ) -> None:
+        """A least recently used cache of state_key -> ending distribution.
+
+        Args:
+            max_entries (int, optional): Entries kept before the least recently
+                used is dropped. Defaults to 100_000.
+            max_states (int, optional): Budget of the exact solve of a state,
+                states needing more are remembered as unsolvable.
+                Defaults to 2_000.
+            min_visits (int, optional): A state is only solved once it has been
+                reached this many times, so one off states cost nothing.
+                Defaults to 2.
+            solve_share (float, optional): States the solver may expand per
+                lookup, on average. Bounds the time lost to failed solves in
+                matchups too big to solve. Defaults to 0.1.
+            token (None | str, optional): Identifies the cache across
+                processes, see __reduce__. Defaults to a new one.
+        """
+        self.max_entries = max_entries
+        self.max_states = max_states
+        self.min_visits = min_visits
+        self.solve_share = solve_share
+        # states the solver may still expand, grows by solve_share per lookup
+        self.solve_credit = float(max_states)
+        # state_key -> CacheEntry, or the visit count while not yet solved
+        self.entries: OrderedDict[t.Any, CacheEntry | int] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.token = token or uuid.uuid4().hex
+        if token is None:
+            _OWN_CACHES[self.token] = self
+
+    def __reduce__(self) -> t.Tuple[t.Any, ...]:
+        # Pickles as a reference, so a simulator handed to a worker process
+        # does not ship every entry along. Each worker process fills one cache
+        # of its own, kept across the chunks it runs, and in this process the
+        # reference resolves back to this cache.
+        return _process_cache, (
+            self.token,
+            self.max_entries,
+            self.max_states,
+            self.min_visits,
+            self.solve_share,
+        )
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def lookup(self, simulator: Simulator) -> None | CacheEntry:
+        """Returns the ending distribution of the simulator's current state,
+        solving it if it has been reached often enough.
+
+        Args:
+            simulator (Simulator): A battle at the start of a round.
+
+        Returns:
+            None | CacheEntry: (cumulative probabilities, outcomes), or None if
+                the ending has to be played out.
+        """
+        self.solve_credit += self.solve_share
+        key = simulator.state_key()
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            if not isinstance(entry, int):
+                if entry:
+                    self.hits += 1
+                    return entry
+                self.misses += 1
+                return None
+        self.misses += 1
+
+        visits = 1 if entry is None else entry + 1
+        if visits < self.min_visits or self.solve_credit < self.max_states:
+            self.entries[key] = visits
+        else:
+            self.solve_credit -= self.max_states
+            solved = exact_solver.outcome_distribution(
+                simulator, max_states=self.max_states
+            )
+            if solved is None or solved[1] > 0:
+                self.entries[key] = ()
+            else:
+                outcomes, probabilities = zip(*solved[0].items())
+                self.entries[key] = (tuple(accumulate(probabilities)), outcomes)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return None
+
+    @staticmethod
+    def draw(entry: CacheEntry, rng: t.Any) -> exact_solver.Outcome:
+        """Draws how a battle ends from a cache entry.
+
+        Args:
+            entry (CacheEntry): An entry returned by lookup.
+            rng (t.Any): What to draw from, e.g. a BattleRandom.
+
+        Returns:
+            exact_solver.Outcome: (left won, left hps, right hps, rounds left)
+        """
+        cumulative, outcomes = entry
+        idx = bisect_right(cumulative, rng.random() * cumulative[-1])
+        return outcomes[min(idx, len(outcomes) - 1)]
@@ -12,6 +12,24 @@ import copy
 import modifier_dict
 import typing as t
 import game_config
+import batch_engine
+import battle_random
+import team_solver
+import exact_solver
+import transposition_cache
+import combat_log
+import simulation_result
+import battle_records
+import benchmarks
+import phase_timer
+import search_predicates as sp
+import creature_spec
+import json
+import os
+import pickle
+import tempfile
+import array
+from unittest import mock
 
 
 class TestAbstractStatus(unittest.TestCase):
@@ -45,6 +63,58 @@ class TestAbstractStatus(unittest.TestCase):
         self.abs["newAttr"] = 3
         del self.abs["newAttr"]
         self.assertTrue("newAttr" not in self.abs)
+        with self.assertRaises(KeyError):
+            del self.abs["newAttr"]
+
+    def test_miss_does_not_insert(self):
+        self.assertEqual(self.abs["weak"], -1)
+        self.assertFalse("weak" in self.abs)
+        self.assertEqual(len(self.abs), 3)
+
+    def test_mask(self):
+        frail = modifier_dict.modifier_bit("frail")
+        self.assertTrue(self.abs.mask & frail)
+        self.assertEqual(self.abs.vector[modifier_dict.modifier_id("frail")], 2)
+        del self.abs["frail"]
+        self.assertFalse(self.abs.mask & frail)
+
+    def test_snapshot_reset(self):
+        template = self.abs.snapshot()
+        self.abs["newAttr3"] = 5
+        self.abs["frail"] = 1
+        self.assertNotEqual(self.abs.snapshot(), template)
+        self.abs.reset(template)
+        self.assertEqual(self.abs.snapshot(), template)
+        self.assertEqual(dict(self.abs), {"frail": 2, "strength": 0, "dexterity": 0})
+        # equal contents give equal snapshots, whatever the vector length
+        other = modifier_dict.ModifierDict({"frail": 2}, default_val=-1)
+        self.assertEqual(other.snapshot(), template)
+
+    def test_pickle(self):
+        self.abs["newAttr4"] = 0
+        state = pickle.dumps(self.abs)
+        # another process may have handed out frail's and weak's ids the other
+        # way round
+        frail = modifier_dict.modifier_id("frail")
+        weak = modifier_dict.modifier_id("weak")
+        names = list(modifier_dict.MODIFIER_NAMES)
+        names[frail], names[weak] = "weak", "frail"
+        with mock.patch.dict(
+            modifier_dict.MODIFIER_IDS, {"frail": weak, "weak": frail}
+        ), mock.patch.object(modifier_dict, "MODIFIER_NAMES", names):
+            copied = pickle.loads(state)
+            self.assertEqual(copied.vector[weak], 2)
+            self.assertEqual(copied["frail"], 2)
+            self.assertNotIn("weak", copied)
+        self.assertIs(type(copied), modifier_dict.ModifierDict)
+        self.assertEqual(copied.default_val, -1)
+        copied = pickle.loads(state)
+        self.assertEqual(dict(copied), dict(self.abs))
+        statuses = creature.Statuses({"weak": 1})
+        statuses.put(modifier_dict.modifier_id("frail"), 0)
+        copied = pickle.loads(pickle.dumps(statuses))
+        self.assertIs(type(copied), creature.Statuses)
+        self.assertEqual(dict(copied), dict(statuses))
 
 
 class TestAbstractDerived(unittest.TestCase):
@@ -108,6 +178,36 @@ class TestCreature(unittest.TestCase):
         self.assertTrue(isinstance(copied_creature.permanents, creature.Permanents))  # type: ignore
         self.assertTrue(isinstance(copied_creature.statuses, creature.Statuses))  # type: ignore
 
+    def test_no_spec(self):
+        for act in (
+            self.creature.pick_action,
+            self.creature.intent_weights,
+            lambda: self.creature.take_action("chomp"),
+        ):
+            with self.assertRaises(NotImplementedError):
+                act()
+
+    def test_snapshot_reset(self):
+        template = self.creature.snapshot()
+        statuses, permanents = self.creature.statuses, self.creature.permanents
+        self.creature.take_damage(50)
+        self.creature.statuses["weak"] = 3
+        self.creature.strength += 2
+        self.creature.prev_actions.append("thrash")
+        self.creature.end_turn_resolution()
+
+        self.creature.reset(template)
+        self.assertEqual(self.creature.snapshot(), template)
+        self.assertEqual(self.creature.hp, 100)
+        self.assertEqual(self.creature.block, 10)
+        self.assertEqual(self.creature.strength, 4)
+        self.assertFalse("weak" in self.creature.statuses)
+        self.assertEqual(self.creature.prev_actions, [])
+        self.assertEqual(self.creature.turns_taken, 0)
+        # restored in place, not reallocated
+        self.assertTrue(self.creature.statuses is statuses)
+        self.assertTrue(self.creature.permanents is permanents)
+
     def test_access(self):
         self.assertEqual(100, self.creature.hp)
         self.assertEqual(10, self.creature.block)
@@ -125,6 +225,19 @@ class TestCreature(unittest.TestCase):
         self.creature.permanents["strength"] += 3
         self.assertEqual(10, self.creature.permanents["strength"])
 
+    def test_slots(self):
+        for a_creature in (self.creature, jaw_worm.JawWorm(), heart.Heart()):
+            self.assertFalse(hasattr(a_creature, "__dict__"))
+            with self.assertRaises(AttributeError):
+                a_creature.newAttr  # type: ignore
+            with self.assertRaises(AttributeError):
+                a_creature.newAttr = 3  # type: ignore
+        self.creature.weak = 2
+        self.assertEqual(self.creature.statuses["weak"], 2)
+        self.creature.beat_of_death = 1
+        self.assertEqual(self.creature.permanents["beat_of_death"], 1)
+        self.assertFalse("beat_of_death" in self.creature.statuses)
+
     def test_take_hit(self):
         self.creature.start_turn_resolution()
         self.assertEqual(self.creature.frail, 2)
@@ -258,112 +371,112 @@ class TestHeart(unittest.TestCase):
 
         self.assertEqual(self.h.pick_action(), "debilitate")
         self.h.turns_taken += 1
-        self.h.prev_actions.append("debilitate")
+        self.h.remember_action("debilitate")
 
         self.assertEqual(self.h.pick_action(), "echo")
         self.h.turns_taken += 1
-        self.h.prev_actions.append("echo")
+        self.h.remember_action("echo")
         self.assertEqual(self.h.echo(), 45)
 
         self.assertEqual(self.h.pick_action(), "blood_shots")
         self.h.turns_taken += 1
-        self.h.prev_actions.append("blood_shots")
+        self.h.remember_action("blood_shots")
         self.assertEqual(self.h.blood_shots(), 2 * 15)
 
         self.assertEqual(self.h.pick_action(), "buff")
         self.h.turns_taken += 1
-        self.h.prev_actions.append("buff")
+        self.h.remember_action("buff")
         self.assertEqual(self.h.buff(), 0)
         self.assertEqual(self.h.artifact, 2)
 
         self.assertEqual(self.h.pick_action(), "echo")
         self.h.turns_taken += 1
-        self.h.prev_actions.append("echo")
+        self.h.remember_action("echo")
         self.assertEqual(self.h.echo(), 47)
 
         self.assertEqual(self.h.pick_action(), "blood_shots")
         self.h.turns_taken += 1
-        self.h.prev_actions.append("blood_shots")
+        self.h.remember_action("blood_shots")
         self.assertEqual(self.h.blood_shots(), 4 * 15)
 
         self.assertEqual(self.h.pick_action(), "buff")
         self.h.turns_taken += 1
-        self.h.prev_actions.append("buff")
+        self.h.remember_action("buff")
         self.assertEqual(self.h.buff(), 0)
         self.assertEqual(self.h.beat_of_death, 3)
 
         self.assertEqual(self.h.pick_action(), "blood_shots")
         self.h.turns_taken += 1
-        self.h.prev_actions.append("blood_shots")
+        self.h.remember_action("blood_shots")
         self.assertEqual(self.h.blood_shots(), 6 * 15)
 
         self.assertEqual(self.h.pick_action(), "echo")
         self.h.turns_taken += 1
-        self.h.prev_actions.append("echo")
+        self.h.remember_action("echo")
         self.assertEqual(self.h.echo(), 49)
 
         self.assertEqual(self.h.pick_action(), "buff")
         self.h.turns_taken += 1
-        self.h.prev_actions.append("buff")
+        self.h.remember_action("buff")
         self.assertEqual(self.h.buff(), 0)
         self.assertTrue("painful_stabs" in self.h.permanents)
 
         self.assertEqual(self.h.pick_action(), "blood_shots")
         self.h.turns_taken += 1
-        self.h.prev_actions.append("blood_shots")
+        self.h.remember_action("blood_shots")
         self.assertEqual(self.h.blood_shots(), 8 * 15)
 
         self.assertEqual(self.h.pick_action(), "echo")
         self.h.turns_taken += 1
-        self.h.prev_actions.append("echo")
+        self.h.remember_action("echo")
         self.assertEqual(self.h.echo(), 51)
 
         self.assertEqual(self.h.pick_action(), "buff")
         self.h.turns_taken += 1
-        self.h.prev_actions.append("buff")
+        self.h.remember_action("buff")
         self.assertEqual(self.h.buff(), 0)
         self.assertEqual(self.h.strength, 18)
 
         self.assertEqual(self.h.pick_action(), "echo")
         self.h.turns_taken += 1
-        self.h.prev_actions.append("echo")
+        self.h.remember_action("echo")
         self.assertEqual(self.h.echo(), 45 + 18)
 
         self.assertEqual(self.h.pick_action(), "blood_shots")
         self.h.turns_taken += 1
-        self.h.prev_actions.append("blood_shots")
+        self.h.remember_action("blood_shots")
         self.assertEqual(self.h.blood_shots(), 20 * 15)
 
         self.assertEqual(self.h.pick_action(), "buff")
         self.h.turns_taken += 1
-        self.h.prev_actions.append("buff")
+        self.h.remember_action("buff")
         self.assertEqual(self.h.buff(), 0)
         self.assertEqual(self.h.strength, 70)
 
         self.assertEqual(self.h.pick_action(), "blood_shots")
         self.h.turns_taken += 1
-        self.h.prev_actions.append("blood_shots")
+        self.h.remember_action("blood_shots")
         self.assertEqual(self.h.blood_shots(), 72 * 15)
 
         self.assertEqual(self.h.pick_action(), "echo")
         self.h.turns_taken += 1
-        self.h.prev_actions.append("echo")
+        self.h.remember_action("echo")
         self.assertEqual(self.h.echo(), 45 + 70)
 
         self.assertEqual(self.h.pick_action(), "buff")
         self.h.turns_taken += 1
-        self.h.prev_actions.append("buff")
+        self.h.remember_action("buff")
         self.assertEqual(self.h.buff(), 0)
         self.assertEqual(self.h.strength, 122)
 
         self.assertEqual(self.h.pick_action(), "echo")
         self.h.turns_taken += 1
-        self.h.prev_actions.append("echo")
+        self.h.remember_action("echo")
         self.assertEqual(self.h.echo(), 45 + 122)
 
         self.assertEqual(self.h.pick_action(), "blood_shots")
         self.h.turns_taken += 1
-        self.h.prev_actions.append("blood_shots")
+        self.h.remember_action("blood_shots")
         self.assertEqual(self.h.blood_shots(), 124 * 15)
 
 
@@ -401,38 +514,173 @@ class TestJawWorm(unittest.TestCase):
 
         game_status.state.act = 3
 
+    def test_intent_weights(self):
+        self.assertEqual(self.worm.intent_weights(), (["chomp"], [1.0]))
+        self.worm.turns_taken = 2
+        self.worm.remember_action("chomp")
+        self.assertEqual(
+            self.worm.intent_weights(), (["bellow", "thrash"], [0.45, 0.3])
+        )
+        self.worm.remember_action("thrash")
+        self.worm.remember_action("thrash")
+        self.assertEqual(
+            self.worm.intent_weights(), (["bellow", "chomp"], [0.45, 0.25])
+        )
+        self.worm.remember_action("bellow")
+        self.worm.remember_action("thrash")
+        self.assertEqual(
+            self.worm.intent_weights(),
+            (["bellow", "chomp", "thrash"], [0.45, 0.25, 0.3]),
+        )
+
+    def test_intent_tables(self):
+        # each table reproduces its weights exactly
+        compiled = jaw_worm.JawWorm.spec.current()
+        for history in [("bellow",), ("chomp",), ("thrash",), ("thrash", "thrash")]:
+            actions, weights, probabilities, aliases = compiled.intent_table(
+                jaw_worm.JawWorm.spec.state_of(history)
+            )
+            shares = [0.0] * len(actions)
+            for column, probability in enumerate(probabilities):
+                shares[column] += probability / len(actions)
+                shares[aliases[column]] += (1 - probability) / len(actions)
+            for share, weight in zip(shares, weights):
+                self.assertAlmostEqual(share, weight / sum(weights))
+        self.worm.rng = battle_random.BattleRandom(4)
+        self.worm.turns_taken = 2
+        self.worm.remember_action("thrash")
+        self.worm.remember_action("thrash")
+        picks = [self.worm.pick_action() for _ in range(20_000)]
+        self.assertNotIn("thrash", picks)
+        self.assertAlmostEqual(
+            picks.count("bellow") / len(picks), 0.45 / 0.7, delta=0.02
+        )
+
+    def test_intent_state(self):
+        spec = jaw_worm.JawWorm.spec
+        for _ in range(5):
+            self.worm.take_action("thrash")
+        # the whole history is kept, the state only holds what the rules read
+        self.assertEqual(self.worm.prev_actions, ["thrash"] * 5)
+        self.assertEqual(self.worm.intent_state, spec.state_of(["thrash"] * 2))
+        self.assertEqual(spec.history(self.worm.intent_state), ("thrash", "thrash"))
+        self.worm.take_action("chomp")
+        self.assertEqual(spec.history(self.worm.intent_state), ("thrash", "chomp"))
+        self.assertLess(self.worm.intent_state, spec.num_states)
+        self.assertEqual(spec.history(0), ())
+
     def test_pick_action(self):
-        random.seed(0)
+        random.seed(1035)
         self.assertEqual(self.worm.pick_action(), "chomp")
         self.worm.turns_taken += 1
-        self.worm.prev_actions.append("chomp")
+        self.worm.remember_action("chomp")
         self.assertEqual(self.worm.pick_action(), "thrash")
         self.worm.turns_taken += 1
-        self.worm.prev_actions.append("thrash")
+        self.worm.remember_action("thrash")
         self.assertEqual(self.worm.pick_action(), "thrash")
         self.worm.turns_taken += 1
-        self.worm.prev_actions.append("thrash")
+        self.worm.remember_action("thrash")
         self.assertEqual(self.worm.pick_action(), "bellow")
         self.worm.turns_taken += 1
-        self.worm.prev_actions.append("bellow")
+        self.worm.remember_action("bellow")
         self.assertEqual(self.worm.pick_action(), "chomp")
         self.worm.turns_taken += 1
-        self.worm.prev_actions.append("chomp")
+        self.worm.remember_action("chomp")
         self.assertEqual(self.worm.pick_action(), "bellow")
         self.worm.turns_taken += 1
-        self.worm.prev_actions.append("bellow")
+        self.worm.remember_action("bellow")
         self.assertEqual(self.worm.pick_action(), "chomp")
         self.worm.turns_taken += 1
-        self.worm.prev_actions.append("chomp")
+        self.worm.remember_action("chomp")
         self.assertEqual(self.worm.pick_action(), "thrash")
         self.worm.turns_taken += 1
-        self.worm.prev_actions.append("thrash")
+        self.worm.remember_action("thrash")
         self.assertEqual(self.worm.pick_action(), "bellow")
         self.worm.turns_taken += 1
-        self.worm.prev_actions.append("bellow")
+        self.worm.remember_action("bellow")
+
+
+class TestCreatureSpec(unittest.TestCase):
+    class Cultist(creature.Creature):
+        __slots__ = ()
+        spec = creature_spec.CreatureSpec(
+            hp={0: 48, 7: 50},
+            moves=(
+                creature_spec.MoveSpec("incantation", strength={0: 3, 17: 5}),
+                creature_spec.MoveSpec("dark_strike", damage=6),
+            ),
+            intents=creature_spec.IntentSpec(
+                weights={"dark_strike": 1.0}, first="incantation"
+            ),
+            permanents={"thorns": {0: 0, 20: 1}},
+        )
+
+    def tearDown(self) -> None:
+        game_config.settings.ascension = 20
+        game_status.state.act = 3
+
+    def test_at_level(self) -> None:
+        self.assertEqual(creature_spec.at_level(7, 20), 7)
+        self.assertEqual(creature_spec.at_level({0: 11, 2: 12}, 1), 11)
+        self.assertEqual(creature_spec.at_level({0: 11, 2: 12}, 20), 12)
+        with self.assertRaises(ValueError):
+            creature_spec.at_level({1: 3}, 0)
+
+    def test_data_only_creature(self) -> None:
+        cultist = self.Cultist()
+        self.assertEqual(cultist.hp, 50)
+        self.assertEqual(cultist.permanents["thorns"], 1)
+        self.assertEqual(cultist.action_memory, 1)
+        self.assertEqual(cultist.pick_action(), "incantation")
+        self.assertEqual(cultist.take_action(), 0)
+        self.assertEqual(cultist.strength, 5)
+        self.assertEqual(cultist.intent_weights(), (["dark_strike"], [1.0]))
+        self.assertEqual(cultist.dark_strike(), 11)
+
+        # moves follow the ascension they are performed at
+        game_config.settings.ascension = 0
+        cultist.incantation()
+        self.assertEqual(cultist.strength, 8)
+        self.assertEqual(self.Cultist().hp, 48)
+
+    def test_compiled_once(self) -> None:
+        spec = jaw_worm.JawWorm.spec
+        compiled = spec.current()
+        self.assertIs(spec.current(), compiled)
+        self.assertEqual(compiled.moves["chomp"][0], 12)
+        game_config.settings.ascension = 1
+        self.assertEqual(spec.current().moves["chomp"][0], 11)
+        # the move tables are shared, not built per instance
+        self.assertFalse(hasattr(jaw_worm.JawWorm(), "action_dict"))
+
+    def test_invalid_specs(self) -> None:
+        intents = creature_spec.IntentSpec(
+            weights={"bite": 1.0}, max_in_a_row={"bite": 1}
+        )
+        with self.assertRaises(ValueError):
+            intents.table(("bite",))
+        with self.assertRaises(ValueError):
+
+            class Shadowing(creature.Creature):
+                spec = creature_spec.CreatureSpec(
+                    hp=10,
+                    moves=(creature_spec.MoveSpec("strength", damage=1),),
+                    intents=intents,
+                )
 
 
 class TestUtils(unittest.TestCase):
+    def test_alias_table(self) -> None:
+        from utils import alias_table
+
+        probabilities, aliases = alias_table([1, 3])
+        self.assertEqual(probabilities, [0.5, 1.0])
+        self.assertEqual(aliases, [1, 1])
+        self.assertEqual(alias_table([2.0]), ([1.0], [0]))
+        for weights in ([], [0, 0], [1, -1]):
+            with self.assertRaises(ValueError):
+                alias_table(weights)
+
     def test_random_chooser(self) -> None:
         """
         Tests the RandomChooser class.
@@ -473,10 +721,62 @@ class TestUtils(unittest.TestCase):
                 str(e), "The lists elements and weights must have the same length"
             )
 
-        try:
-            RandomChooser(["a", "b"], [0.1, 0.2])  # type: ignore
-        except ValueError as e:
-            self.assertEqual(str(e), "The weights must sum up to 1")
+        # weights need not sum to 1
+        chooser = RandomChooser(["a", "b"], [0.5, 1.5])
+        self.assertEqual(chooser.weights, [0.25, 0.75])
+        for weights in ([0.0, 0.0], [1.0, -0.5]):
+            with self.assertRaises(ValueError):
+                RandomChooser(["a", "b"], weights)
+
+    def test_random_chooser_draws(self) -> None:
+        from utils import RandomChooser
+
+        rng = battle_random.BattleRandom(7)
+        chooser = RandomChooser(["a", "b", "c", "d"], [1, 2, 0, 7], rng=rng)
+        # elements of weight 0 are never chosen
+        self.assertEqual(chooser.elements, ["a", "b", "d"])
+        samples = chooser.choose_many(20_000, replace=True)
+        self.assertEqual(len(chooser), 3)
+        self.assertAlmostEqual(samples.count("d") / len(samples), 0.7, delta=0.02)
+        self.assertAlmostEqual(samples.count("a") / len(samples), 0.1, delta=0.02)
+
+        # without replacement every element comes out exactly once
+        chosen = chooser.choose_many(3)
+        self.assertEqual(sorted(chosen), ["a", "b", "d"])
+        self.assertEqual(len(chooser), 0)
+        with self.assertRaises(Exception):
+            chooser.sample()
+
+        # sampling after a removal only draws the rest
+        chooser = RandomChooser(["a", "b", "c"], [1, 1, 1], rng=rng)
+        first = chooser.choose()
+        self.assertNotIn(first, chooser.choose_many(100, replace=True))
+        with self.assertRaises(ValueError):
+            chooser.choose_many(3)
+        self.assertEqual(len(chooser), 2)
+
+        # the first pick of many choosers follows the weights
+        firsts = [
+            RandomChooser(range(5), [5, 4, 3, 2, 1], rng=rng).choose()
+            for _ in range(15_000)
+        ]
+        for element in range(5):
+            self.assertAlmostEqual(
+                firsts.count(element) / len(firsts), (5 - element) / 15, delta=0.02
+            )
+
+    def test_wilson_interval(self) -> None:
+        from utils import wilson_interval
+
+        low, high = wilson_interval(50, 100)
+        self.assertAlmostEqual(low, 0.4038, places=4)
+        self.assertAlmostEqual(high, 0.5962, places=4)
+        low, high = wilson_interval(0, 100)
+        self.assertEqual(low, 0)
+        self.assertAlmostEqual(high, 0.0370, places=4)
+        self.assertEqual(wilson_interval(0, 0), (0.0, 1.0))
+        wide = wilson_interval(50, 100, 0.99)
+        self.assertGreater(wide[1] - wide[0], 0.5962 - 0.4038)
 
     def test_safe_add(self):
         from utils import safe_add
@@ -498,7 +798,7 @@ class TestSimulator(unittest.TestCase):
         return super().setUp()
 
     def test_resolve_one_creature_turn(self):
-        random.seed(0)
+        random.seed(145)
         worm = self.s.left_creatures[0]
         heart = self.s.right_creatures[0]
         self.assertFalse("frail" in heart.statuses)
@@ -586,7 +886,7 @@ class TestSimulator(unittest.TestCase):
             [jaw_worm.JawWorm(hp=50), jaw_worm.JawWorm(hp=50)],
             [heart.Heart(hp=50), heart.Heart(hp=50)],
         )
-        random.seed(0)
+        random.seed(493)
         worm_1, worm_2 = new_sim.left_creatures[0], new_sim.left_creatures[1]
         heart_1, heart_2 = new_sim.right_creatures[0], new_sim.right_creatures[1]
 
@@ -717,6 +1017,256 @@ class TestSimulator(unittest.TestCase):
     def test_one_battle(self) -> None:
         self.assertFalse(self.s.one_battle())
 
+    def test_quiet_battle(self) -> None:
+        game_config.settings.enable_trace(False)
+        with mock.patch.object(
+            creature.Creature, "__repr__", side_effect=AssertionError
+        ):
+            with mock.patch("logging.debug") as debug, mock.patch(
+                "logging.info"
+            ) as info:
+                self.s.one_battle()
+        debug.assert_not_called()
+        info.assert_not_called()
+
+    def test_trace_battle(self) -> None:
+        logging.disable(logging.NOTSET)
+        game_config.settings.enable_trace()
+        try:
+            with self.assertLogs(level=logging.DEBUG) as logs:
+                self.s.one_battle()
+        finally:
+            game_config.settings.enable_trace(False)
+        self.assertTrue(any("took action chomp" in line for line in logs.output))
+        self.assertTrue(any("side won" in line for line in logs.output))
+
+    def test_snapshot_reset(self) -> None:
+        template = self.s.snapshot()
+        random.seed(3)
+        first_result = self.s.one_battle()
+        first_state = self.s.get_state()
+        self.assertNotEqual(self.s.snapshot(), template)
+
+        self.s.reset(template)
+        self.assertEqual(self.s.snapshot(), template)
+        random.seed(3)
+        self.assertEqual(self.s.one_battle(), first_result)
+        self.assertEqual(self.s.get_state(), first_state)
+
+    def test_battle_streams_independent_of_split(self) -> None:
+        logging.disable(logging.CRITICAL)
+        whole = self.s._simulate_mp(7, 0, 20)
+        first = self.s._simulate_mp(7, 0, 8)
+        second = self.s._simulate_mp(7, 8, 12)
+        self.assertEqual(whole, first.merge(second))
+        self.assertTrue(self.s.rng is battle_random.GLOBAL_RANDOM)
+
+    def test_simulate_chunks(self) -> None:
+        logging.disable(logging.CRITICAL)
+        expected = self.s._simulate_mp(11, 0, 301)
+        for num_cores in (1, 2):
+            chunks = list(self.s._simulate_chunks(11, 301, num_cores))
+            ranges = sorted((first, result.num_battles) for first, result in chunks)
+            self.assertGreater(len(ranges), 2)
+            # exactly covers battles 0..300, with no overlap
+            next_battle = 0
+            for first, count in ranges:
+                self.assertEqual(first, next_battle)
+                next_battle += count
+            self.assertEqual(next_battle, 301)
+            merged = simulation_result.SimulationResult.for_teams(
+                self.s.left_creatures, self.s.right_creatures
+            )
+            for _, result in chunks:
+                merged.merge(result)
+            self.assertEqual(merged, expected)
+
+    def test_use_timer(self) -> None:
+        logging.disable(logging.CRITICAL)
+        expected = self.s.simulate(num_battles=200, num_cores=1, seed=2)
+        self.assertIsNone(expected.timings)
+        for num_cores, sample_every in ((1, 1), (2, 4)):
+            template = phase_timer.PhaseTimer(sample_every)
+            self.s.use_timer(template)
+            result = self.s.simulate(num_battles=200, num_cores=num_cores, seed=2)
+            self.s.use_timer(None)
+            # each chunk is timed by its own timer
+            self.assertEqual(template.turns, 0)
+            # timing draws the same numbers, so the battles are unchanged
+            self.assertEqual(result, expected)
+            timings = result.timings
+            # every chunk samples its own every sample_every-th turn
+            self.assertLessEqual(timings.sampled, timings.turns // sample_every)
+            self.assertGreater(timings.sampled, 0)
+            self.assertEqual(timings.calls[phase_timer.START_TURN], timings.sampled)
+            self.assertEqual(
+                timings.calls[phase_timer.ACTION_SELECTION], timings.sampled
+            )
+            self.assertGreater(timings.seconds[phase_timer.HIT_RESOLUTION], 0)
+            self.assertIn("hit_resolution", str(result))
+
+    def test_missing_ranges(self) -> None:
+        missing = simulator.Simulator._missing_ranges
+        self.assertEqual(missing([], 10), [(0, 10)])
+        self.assertEqual(missing([(4, 2), (0, 2)], 10), [(2, 2), (6, 4)])
+        self.assertEqual(missing([(0, 5), (3, 7)], 10), [])
+        self.assertEqual(missing([(8, 5)], 10), [(0, 8)])
+
+    def test_checkpoint_resume(self) -> None:
+        logging.disable(logging.CRITICAL)
+        expected = self.s.simulate(num_battles=400, num_cores=1, seed=3)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "run.checkpoint")
+            run_chunk = simulator.Simulator._simulate_chunk
+            calls = 0
+
+            def interrupted_chunk(*args: t.Any) -> t.Any:
+                nonlocal calls
+                calls += 1
+                if calls == 4:
+                    raise KeyboardInterrupt
+                return run_chunk(*args)
+
+            with mock.patch.object(
+                simulator, "CHECKPOINT_SECONDS", 0
+            ), mock.patch.object(
+                simulator.Simulator, "_simulate_chunk", interrupted_chunk
+            ):
+                with self.assertRaises(KeyboardInterrupt):
+                    self.s.simulate(
+                        num_battles=400, num_cores=1, seed=3, checkpoint_path=path
+                    )
+            with open(path, "rb") as file:
+                saved = pickle.load(file)["result"].num_battles
+            self.assertGreater(saved, 0)
+            self.assertLess(saved, 400)
+
+            with self.assertRaises(ValueError):
+                self.s.simulate(
+                    num_battles=400, seed=4, checkpoint_path=path, resume=True
+                )
+            # nor into another matchup, or the same one at another ascension
+            other = simulator.Simulator(
+                [jaw_worm.JawWorm()], copy.deepcopy(self.s.right_creatures)
+            )
+            with self.assertRaises(ValueError):
+                other.simulate(num_battles=400, checkpoint_path=path, resume=True)
+            with mock.patch.object(game_config.settings, "ascension", 19):
+                with self.assertRaisesRegex(ValueError, "ascension 20 instead of 19"):
+                    self.s.simulate(num_battles=400, checkpoint_path=path, resume=True)
+            resumed = self.s.simulate(
+                num_battles=400, num_cores=2, checkpoint_path=path, resume=True
+            )
+            self.assertEqual(resumed, expected)
+            # a finished run resumes to the same result without running battles
+            with mock.patch.object(simulator.Simulator, "_simulate_chunk") as chunk:
+                resumed = self.s.simulate(
+                    num_battles=400, num_cores=1, checkpoint_path=path, resume=True
+                )
+            chunk.assert_not_called()
+            self.assertEqual(resumed, expected)
+
+    def test_next_chunk_size(self) -> None:
+        seconds = simulator.CHUNK_SECONDS / 10
+        self.assertEqual(self.s._next_chunk_size(100, 100, seconds, 10**6, 2), 550)
+        self.assertEqual(self.s._next_chunk_size(100, 100, seconds, 80, 2), 10)
+        self.assertEqual(self.s._next_chunk_size(100, 100, seconds, 0, 2), 1)
+        self.assertEqual(self.s._next_chunk_size(100, 100, seconds, None, 2), 550)
+
+    def test_run_chunks_cap(self) -> None:
+        def task(seed: int, first: int, count: int) -> t.Tuple[int, int, float]:
+            return first, count, 0.0
+
+        chunks = self.s._run_chunks(task, 0, None, 1)
+        first, count = next(chunks)
+        self.assertEqual((first, count), (0, simulator.FIRST_CHUNK_SIZE))
+        # battles from 20 on are dropped, the next chunk stops short of them
+        self.assertEqual(chunks.send(20), (16, 4))
+        with self.assertRaises(StopIteration):
+            next(chunks)
+
+    def test_search_streaming(self) -> None:
+        logging.disable(logging.CRITICAL)
+        worms = simulator.Simulator(
+            [jaw_worm.JawWorm() for _ in range(7)], [heart.Heart()]
+        )
+        single = worms.simulation_search(
+            a_right_win=True, num_cores=1, max_battles=-1, seed=5
+        )
+        self.assertIsNotNone(single)
+        self.assertEqual(
+            worms.simulation_search(
+                a_right_win=True, num_cores=2, max_battles=-1, seed=5, lowest=True
+            ),
+            single,
+        )
+        found = worms.simulation_search(a_right_win=True, num_cores=2, seed=5)
+        self.assertFalse(
+            any(c.alive for c in worms.replay(found, seed=5).left_creatures)
+        )
+        lone_worm = simulator.Simulator([jaw_worm.JawWorm()], [heart.Heart()])
+        self.assertIsNone(
+            lone_worm.simulation_search(a_left_win=True, num_cores=1, max_battles=20)
+        )
+
+    def test_simulate_early_stop(self) -> None:
+        logging.disable(logging.CRITICAL)
+        lopsided = simulator.Simulator([jaw_worm.JawWorm(hp=10)], [heart.Heart()])
+        # fixed chunks of 16 battles, rather than sized by timing
+        with mock.patch.object(
+            simulator.Simulator, "_next_chunk_size", return_value=16
+        ):
+            result = lopsided.simulate(
+                num_cores=1, seed=0, target_ci_width=0.05, max_battles=1_000_000
+            )
+        low, high = result.confidence_interval()
+        self.assertLessEqual(high - low, 0.05)
+        # it stops after the first chunk that makes the interval narrow enough
+        expected = lopsided._simulate_mp(seed=0, num_battles=16)
+        while True:
+            low, high = expected.confidence_interval()
+            if high - low <= 0.05:
+                break
+            expected.merge(
+                lopsided._simulate_mp(
+                    seed=0, first_battle=expected.num_battles, num_battles=16
+                )
+            )
+        self.assertEqual(result, expected)
+        self.assertLess(result.num_battles, 1_000)
+
+    def test_default_num_cores(self) -> None:
+        self.assertGreaterEqual(simulator.DEFAULT_NUM_CORES, 1)
+        self.assertLessEqual(simulator.DEFAULT_NUM_CORES, min(4, os.cpu_count() or 1))
+
+    def test_replay(self) -> None:
+        logging.disable(logging.CRITICAL)
+        template = self.s.snapshot()
+        result = self.s._simulate_mp(seed=3, first_battle=4)
+        left_wins = result.left_wins
+        replayed = self.s.replay(4, seed=3)
+        self.assertEqual(self.s.snapshot(), template)
+        self.assertEqual(replayed._keep_simulating(), (False, bool(left_wins)))
+        self.assertEqual(replayed.right_creatures[0].hp, result.hp_totals[1])
+        self.assertEqual(replayed.current_turn, result.turns_total)
+
+        # stop early, then carry on from there
+        partial = self.s.replay(4, until_turn=2, seed=3)
+        self.assertEqual(partial.current_turn, 2)
+        self.assertTrue(partial._keep_simulating()[0])
+        branch = partial.snapshot()
+        self.assertEqual(partial.one_battle(), bool(left_wins))
+        self.assertEqual(partial.snapshot(), replayed.snapshot())
+        self.assertFalse(partial.left_creatures[0] is self.s.left_creatures[0])
+        partial.reset(branch)
+        self.assertEqual(partial.current_turn, 2)
+
+    def test_simulate_mp_leaves_teams_untouched(self) -> None:
+        logging.disable(logging.CRITICAL)
+        template = self.s.snapshot()
+        self.s._simulate_mp(seed=0, num_battles=5)
+        self.assertEqual(self.s.snapshot(), template)
+
     def test_simulate(self) -> None:
         logging.disable(logging.CRITICAL)
         self.s = simulator.Simulator(
@@ -768,9 +1318,9 @@ class TestSimulator(unittest.TestCase):
         winning_seed = local_s.simulation_search(a_left_win=True)
         if winning_seed is not None:
             print("Winning seed: ", winning_seed)
-            random.seed(winning_seed)
             logging.disable(-1)
-            self.assertTrue(local_s.one_battle())
+            replayed = local_s.replay(winning_seed)
+            self.assertFalse(any(c.alive for c in replayed.right_creatures))
 
     def test_one_right_win(self) -> None:
         local_s = simulator.Simulator(
@@ -790,9 +1340,651 @@ class TestSimulator(unittest.TestCase):
         winning_seed = local_s.simulation_search(a_right_win=True)
         if winning_seed is not None:
             print("Winning seed: ", winning_seed)
-            random.seed(winning_seed)
             logging.disable(-1)
-            self.assertFalse(local_s.one_battle())
+            replayed = local_s.replay(winning_seed)
+            self.assertFalse(any(c.alive for c in replayed.left_creatures))
+
+
+@unittest.skipIf(batch_engine.np is None, "numpy is not installed")
+class TestBatchEngine(unittest.TestCase):
+    def setUp(self) -> None:
+        game_config.settings.ascension = 20
+        game_status.state.act = 3
+        logging.disable(logging.CRITICAL)
+        self.s = simulator.Simulator(
+            [jaw_worm.JawWorm(), jaw_worm.JawWorm()], [heart.Heart(hp=80)]
+        )
+
+    def test_run(self) -> None:
+        engine = batch_engine.BatchEngine(self.s.left_creatures, self.s.right_creatures)
+        result = engine.run(1_000, seed=0, batch_size=300)
+        self.assertTrue(0 < result.left_wins < 1_000)
+        self.assertEqual(result.num_battles, 1_000)
+        self.assertEqual(result.slot_names()[1], ("left", "JawWorm"))
+        # the heart survives exactly the battles the left side loses
+        self.assertEqual(result.survived[2], 1_000 - result.left_wins)
+        self.assertGreater(result.mean_turns, 1)
+        self.assertEqual(engine.run(1_000, seed=0, batch_size=300), result)
+
+    def test_run_stop(self) -> None:
+        engine = batch_engine.BatchEngine(self.s.left_creatures, self.s.right_creatures)
+        calls = []
+
+        def stop(left_wins: int, battles: int) -> bool:
+            calls.append(battles)
+            return battles >= 200
+
+        result = engine.run(1_000, seed=0, batch_size=100, stop=stop)
+        self.assertEqual(calls, [100, 200])
+        self.assertEqual(result.num_battles, 200)
+
+    def test_matches_python_engine(self) -> None:
+        # battle i draws from the stream (seed, i) in both engines
+        python_result = self.s._simulate_mp(seed=3, num_battles=1_000)
+        engine = batch_engine.BatchEngine(self.s.left_creatures, self.s.right_creatures)
+        numpy_result = engine.run(1_000, seed=3, batch_size=300)
+        # histograms included
+        self.assertEqual(numpy_result, python_result)
+        # long enough battles run out of the first block of draws
+        self.s.left_creatures.extend(jaw_worm.JawWorm() for _ in range(3))
+        self.s.right_creatures[0] = heart.Heart()
+        engine = batch_engine.BatchEngine(self.s.left_creatures, self.s.right_creatures)
+        self.assertEqual(
+            engine.run(200, seed=3), self.s._simulate_mp(seed=3, num_battles=200)
+        )
+
+    def test_unsupported(self) -> None:
+        with self.assertRaises(ValueError):
+            batch_engine.BatchEngine([creature.Creature(10)], [heart.Heart()])
+        worm = jaw_worm.JawWorm()
+        worm.permanents["buffer"] = 1
+        with self.assertRaises(ValueError):
+            batch_engine.BatchEngine([worm], [heart.Heart()])
+
+    def test_simulate(self) -> None:
+        self.s.simulate(num_battles=1_000, seed=0, engine="numpy")
+        with self.assertRaises(ValueError):
+            self.s.simulate(num_battles=1_000, engine="fortran")
+
+
+class TestBattleRandom(unittest.TestCase):
+    def test_streams(self) -> None:
+        rng = battle_random.BattleRandom(3, 5)
+        draws = [rng.random() for _ in range(5)]
+        self.assertTrue(all(0 <= draw < 1 for draw in draws))
+        rng.reset(3, 5)
+        self.assertEqual([rng.random() for _ in range(5)], draws)
+        rng.reset(3, 6)
+        self.assertNotEqual([rng.random() for _ in range(5)], draws)
+        rng.reset(4, 5)
+        self.assertNotEqual([rng.random() for _ in range(5)], draws)
+
+    def test_random_api(self) -> None:
+        rng = battle_random.BattleRandom(1)
+        self.assertIn(rng.choices(["a", "b"], [0.5, 0.5], k=1)[0], ["a", "b"])
+        self.assertTrue(0 <= rng.randrange(10) < 10)
+        self.assertTrue(0 <= rng.getrandbits(100) < 2**100)
+        state = rng.getstate()
+        draw = rng.random()
+        rng.setstate(state)
+        self.assertEqual(rng.random(), draw)
+        clone = copy.deepcopy(rng)
+        self.assertEqual(clone.random(), rng.random())
+
+    def test_uniform_block(self) -> None:
+        block = battle_random.uniform_block(9, 40, 3, 20)
+        self.assertEqual(block.shape, (3, 20))
+        for row, battle in enumerate(range(40, 43)):
+            rng = battle_random.BattleRandom(9, battle)
+            self.assertEqual(block[row].tolist(), [rng.random() for _ in range(20)])
+
+    def test_buffered_draws(self) -> None:
+        plain = battle_random.BattleRandom(2**70 + 1, 0)
+        buffered = battle_random.BattleRandom(2**70 + 1, 0, block_battles=3)
+        # across refills, and past the pre-generated draws of a stream
+        for battle in [0, 1, 2, 3, 7, 1]:
+            plain.reset(2**70 + 1, battle)
+            buffered.reset(2**70 + 1, battle)
+            draws = 600 if battle == 3 else 5
+            self.assertEqual(
+                [plain.random() for _ in range(draws)],
+                [buffered.random() for _ in range(draws)],
+            )
+        self.assertEqual(buffered.uniforms.draws, battle_random.MAX_BLOCK_DRAWS)
+        # restoring another stream's state drops the buffer
+        buffered.setstate(battle_random.BattleRandom(5, 5).getstate())
+        self.assertEqual(buffered.random(), battle_random.BattleRandom(5, 5).random())
+
+    def test_global_random(self) -> None:
+        random.seed(2)
+        draw = battle_random.GLOBAL_RANDOM.random()
+        random.seed(2)
+        self.assertEqual(draw, random.random())
+        self.assertTrue(
+            copy.deepcopy(battle_random.GLOBAL_RANDOM) is battle_random.GLOBAL_RANDOM
+        )
+
+
+class TestTeamSolver(unittest.TestCase):
+    def setUp(self) -> None:
+        game_config.settings.ascension = 20
+        game_status.state.act = 3
+        logging.disable(logging.CRITICAL)
+
+    def test_sprt(self) -> None:
+        hopeless = simulator.Simulator([jaw_worm.JawWorm()], [heart.Heart()])
+        reaches, wins, battles = team_solver.sprt(hopeless, 0.5)
+        self.assertFalse(reaches)
+        self.assertEqual(wins, 0)
+        self.assertLess(battles, 100)
+        certain = simulator.Simulator([jaw_worm.JawWorm()], [heart.Heart(hp=1)])
+        self.assertTrue(team_solver.sprt(certain, 0.5)[0])
+        # undecided at max_battles falls back to the observed win rate
+        reaches, _, battles = team_solver.sprt(certain, 0.5, max_battles=3)
+        self.assertTrue(reaches)
+        self.assertEqual(battles, 3)
+
+    def test_min_team_size(self) -> None:
+        def make_worm() -> creature.Creature:
+            return jaw_worm.JawWorm(hp=30)
+
+        opponents = [heart.Heart(hp=100)]
+        size = team_solver.min_team_size(make_worm, opponents, seed=0)
+        self.assertIsNotNone(size)
+        below = simulator.Simulator([make_worm() for _ in range(size - 1)], opponents)
+        self.assertFalse(team_solver.sprt(below, 0.5)[0])
+        at = simulator.Simulator([make_worm() for _ in range(size)], opponents)
+        self.assertTrue(team_solver.sprt(at, 0.5)[0])
+        self.assertIsNone(
+            team_solver.min_team_size(make_worm, [heart.Heart()], max_size=2, seed=0)
+        )
+
+
+class TestExactSolver(unittest.TestCase):
+    def setUp(self) -> None:
+        game_config.settings.ascension = 20
+        game_status.state.act = 3
+        logging.disable(logging.CRITICAL)
+        self.s = simulator.Simulator(
+            [jaw_worm.JawWorm(), jaw_worm.JawWorm()], [heart.Heart(hp=80)]
+        )
+
+    def test_solve(self) -> None:
+        template = self.s.snapshot()
+        left_win_probability, hp_distributions, unresolved = exact_solver.solve(self.s)
+        self.assertEqual(self.s.snapshot(), template)
+        self.assertEqual(unresolved, 0)
+        for distributions in hp_distributions.values():
+            for distribution in distributions:
+                self.assertAlmostEqual(sum(distribution.values()), 1)
+        # the left side wins exactly when the heart ends on 0 hp
+        self.assertAlmostEqual(
+            hp_distributions["right"][0][0], left_win_probability, places=9
+        )
+
+    def test_matches_sampling(self) -> None:
+        num_battles = 5_000
+        left_win_probability, hp_distributions, _ = exact_solver.solve(self.s)
+        result = self.s._simulate_mp(seed=0, num_battles=num_battles)
+        self.assertAlmostEqual(result.left_win_rate, left_win_probability, delta=0.03)
+        expected_hp = sum(
+            hp * probability for hp, probability in hp_distributions["right"][0].items()
+        )
+        self.assertAlmostEqual(result.mean_hp(2), expected_hp, delta=1)
+
+    def test_max_turns(self) -> None:
+        left_win_probability, _, unresolved = exact_solver.solve(self.s, max_turns=1)
+        self.assertEqual(left_win_probability, 0)
+        self.assertAlmostEqual(unresolved, 1)
+
+
+class TestTranspositionCache(unittest.TestCase):
+    def setUp(self) -> None:
+        game_config.settings.ascension = 20
+        game_status.state.act = 3
+        logging.disable(logging.CRITICAL)
+        self.s = simulator.Simulator(
+            [jaw_worm.JawWorm(), jaw_worm.JawWorm()], [heart.Heart(hp=80)]
+        )
+
+    def test_state_key(self) -> None:
+        worm = self.s.left_creatures[0]
+        worm.prev_actions[:] = ["chomp", "bellow", "thrash"]
+        key = self.s.state_key()
+        worm.prev_actions[:] = ["bellow", "chomp", "bellow", "thrash"]
+        self.assertEqual(self.s.state_key(), key)
+        self.assertNotEqual(self.s.snapshot(), key)
+        worm.prev_actions[:] = ["chomp", "thrash"]
+        self.assertNotEqual(self.s.state_key(), key)
+
+    def test_lookup(self) -> None:
+        cache = transposition_cache.TranspositionCache(min_visits=2)
+        self.assertIsNone(cache.lookup(self.s))
+        entry = cache.lookup(self.s)  # solved on the second visit, still a miss
+        self.assertIsNone(entry)
+        entry = cache.lookup(self.s)
+        self.assertIsNotNone(entry)
+        self.assertAlmostEqual(entry[0][-1], 1)  # type: ignore
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        left_won, left_hps, right_hps, rounds = cache.draw(
+            entry, battle_random.BattleRandom(0, 0)  # type: ignore
+        )
+        self.assertEqual(left_won, right_hps == (0,))
+        self.assertGreater(rounds, 0)
+
+    def test_unsolvable(self) -> None:
+        cache = transposition_cache.TranspositionCache(min_visits=1, max_states=10)
+        for _ in range(3):
+            self.assertIsNone(cache.lookup(self.s))
+        self.assertEqual(cache.entries[self.s.state_key()], ())
+        self.assertEqual(cache.hit_rate, 0)
+
+    def test_max_entries(self) -> None:
+        cache = transposition_cache.TranspositionCache(max_entries=2, min_visits=5)
+        for turn in range(4):
+            self.s.current_turn = turn
+            cache.lookup(self.s)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual([key[0] for key in cache.entries], [2, 3])
+
+    def test_pickle(self) -> None:
+        cache = transposition_cache.TranspositionCache(max_entries=7)
+        # resolves to the same cache in this process, empty or not
+        self.assertIs(pickle.loads(pickle.dumps(cache)), cache)
+        cache.lookup(self.s)
+        self.assertIs(pickle.loads(pickle.dumps(cache)), cache)
+        # and to one empty cache per process elsewhere
+        state = pickle.dumps(cache)
+        del cache
+        copied = pickle.loads(state)
+        self.assertEqual(len(copied), 0)
+        self.assertEqual(copied.max_entries, 7)
+        self.assertIs(pickle.loads(state), copied)
+
+    def test_simulate(self) -> None:
+        num_battles = 2_000
+        left_win_probability, _, _ = exact_solver.solve(self.s)
+        cache = transposition_cache.TranspositionCache()
+        self.s.use_cache(cache)
+        result = self.s._simulate_mp(seed=0, num_battles=num_battles)
+        self.assertGreater(cache.hit_rate, 0.9)
+        self.assertEqual(result.cache_hits, cache.hits)
+        self.assertAlmostEqual(result.cache_hit_rate, cache.hit_rate)
+        self.assertAlmostEqual(result.left_win_rate, left_win_probability, delta=0.04)
+        self.assertEqual(result.num_battles, num_battles)
+        # hits jump to the end of the battle, turns included
+        self.s.use_cache(None)
+        uncached = self.s._simulate_mp(seed=0, num_battles=num_battles)
+        self.assertAlmostEqual(result.mean_turns, uncached.mean_turns, delta=0.1)
+        self.assertEqual(
+            result.turn_histogram.quantile(0.5), uncached.turn_histogram.quantile(0.5)
+        )
+
+
+class TestCombatLog(unittest.TestCase):
+    def setUp(self) -> None:
+        game_config.settings.ascension = 20
+        game_status.state.act = 3
+        logging.disable(logging.CRITICAL)
+        self.s = simulator.Simulator(
+            [jaw_worm.JawWorm(), jaw_worm.JawWorm()], [heart.Heart(hp=80)]
+        )
+        self.creatures = self.s.left_creatures + self.s.right_creatures
+
+    def test_record(self) -> None:
+        result = self.s._simulate_mp(seed=5, first_battle=3)
+        recorder = self.s.record(3, seed=5)
+        self.assertIsNone(self.s.recorder)
+        self.assertEqual(len(recorder.buffer) % combat_log.RECORD.size, 0)
+        records = list(combat_log.decode(recorder.buffer))
+        self.assertEqual(records[0][1], combat_log.BATTLE_START)
+        self.assertEqual(records[0][5], 3)
+        self.assertEqual(records[-1][1], combat_log.BATTLE_END)
+        self.assertEqual(records[-1][4], result.left_wins)
+        # every point of damage the heart took was dealt by a hit
+        heart_damage = sum(
+            record[5]
+            for record in records
+            if record[1] == combat_log.HIT and record[3] == 2
+        )
+        self.assertEqual(heart_damage, 80 - result.hp_totals[2])
+
+    def test_record_matches_replay(self) -> None:
+        recorder = self.s.record(3, seed=5)
+        replayed = self.s.replay(3, seed=5)
+        hps = [c.hp for c in self.creatures]
+        for record in combat_log.decode(recorder.buffer):
+            turn, event, _, target, code = record[:5]
+            # the hp of the creature losing it, after the event
+            if event in (
+                combat_log.HIT,
+                combat_log.RETALIATION,
+                combat_log.BEAT_OF_DEATH,
+            ):
+                hps[target] = record[7]
+        self.assertEqual((turn, event), (replayed.current_turn, combat_log.BATTLE_END))
+        self.assertEqual(code, int(replayed._keep_simulating()[1]))
+        self.assertEqual(
+            hps, [c.hp for c in replayed.left_creatures + replayed.right_creatures]
+        )
+
+    def test_recording_changes_nothing(self) -> None:
+        expected = self.s._simulate_mp(seed=1, num_battles=20)
+        recorder = combat_log.CombatRecorder()
+        self.s.use_recorder(recorder)
+        self.assertEqual(self.s._simulate_mp(seed=1, num_battles=20), expected)
+        self.s.use_recorder(None)
+        events = [record[1] for record in combat_log.decode(recorder.buffer)]
+        self.assertEqual(events.count(combat_log.BATTLE_START), 20)
+        self.assertEqual(events.count(combat_log.BATTLE_END), 20)
+
+    def test_status_codes(self) -> None:
+        self.assertTrue(
+            game_constants.ALL_STATUSES | game_constants.ALL_PERMANENTS
+            <= set(combat_log.STATUS_NAMES)
+        )
+        recorder = self.s.record(0, seed=0)
+        # a process that met the modifier names in another order renders the
+        # saved log the same
+        names = list(reversed(modifier_dict.MODIFIER_NAMES))
+        ids = {name: idx for idx, name in enumerate(names)}
+        with mock.patch.object(modifier_dict, "MODIFIER_NAMES", names), mock.patch.dict(
+            modifier_dict.MODIFIER_IDS, ids
+        ):
+            log = combat_log.render(bytes(recorder.buffer), self.creatures)
+        self.assertIn("Heart 2 applies 2 weak to JawWorm", log)
+        with self.assertRaises(ValueError):
+            recorder.status(0, self.creatures[2], self.creatures[0], "newAttr", 1)
+
+    def test_render(self) -> None:
+        recorder = combat_log.CombatRecorder()
+        self.s.use_recorder(recorder)
+        self.s._simulate_mp(seed=0, num_battles=2)
+        self.s.use_recorder(None)
+        log = combat_log.render(recorder.buffer, self.creatures)
+        self.assertTrue(log.startswith("Battle 0"))
+        self.assertIn("Battle 1", log)
+        self.assertIn("Turn 0: JawWorm 0 (44 hp) uses chomp", log)
+        self.assertIn("Heart 2 applies 2 weak to JawWorm 1", log)
+        second = combat_log.render(recorder.buffer, self.creatures, battle=1)
+        self.assertTrue(second.startswith("Battle 1"))
+        self.assertNotIn("Battle 0", second)
+        self.assertTrue(second.endswith("side won"))
+
+
+@unittest.skipIf(battle_records.np is None, "numpy is not installed")
+class TestBattleRecords(unittest.TestCase):
+    def setUp(self) -> None:
+        game_config.settings.ascension = 20
+        game_status.state.act = 3
+        logging.disable(logging.CRITICAL)
+        self.s = simulator.Simulator(
+            [jaw_worm.JawWorm(), jaw_worm.JawWorm()], [heart.Heart(hp=80)]
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "battles.bin")
+
+    def test_simulate(self) -> None:
+        files = []
+        for num_cores in (1, 2):
+            result = self.s.simulate(
+                num_battles=300, num_cores=num_cores, seed=7, records_path=self.path
+            )
+            self.assertIsNone(self.s.records)
+            records = battle_records.BattleRecords(self.path)
+            self.assertEqual((records.num_battles, records.num_slots), (300, 3))
+            columns = records.load()
+            self.assertEqual(columns["hp"].shape, (300, 3))
+            self.assertEqual(int(columns["winner"].sum()), result.left_wins)
+            self.assertEqual(columns["turns"].sum(), result.turns_total)
+            self.assertEqual(list(columns["hp"].clip(0).sum(axis=0)), result.hp_totals)
+            self.assertEqual(records.seed, 7)
+            self.assertNotIn("seed", columns)
+            self.assertTrue((columns["actions"] >= columns["turns"]).all())
+            recorder = self.s.record(42, seed=7)
+            events = [record[1] for record in combat_log.decode(recorder.buffer)]
+            self.assertEqual(columns["actions"][42], events.count(combat_log.ACTION))
+            with open(self.path, "rb") as file:
+                files.append(file.read())
+        self.assertEqual(files[0], files[1])
+
+    def test_early_stop(self) -> None:
+        result = self.s.simulate(
+            num_battles=1_000,
+            num_cores=1,
+            seed=0,
+            target_ci_width=0.5,
+            records_path=self.path,
+        )
+        winner = battle_records.BattleRecords(self.path).load()["winner"]
+        self.assertEqual(int((winner >= 0).sum()), result.num_battles)
+        self.assertTrue((winner[result.num_battles :] == -1).all())
+
+    def test_write_columns(self) -> None:
+        records = battle_records.BattleRecords.create(self.path, 4, 3, seed=1)
+        writer = pickle.loads(pickle.dumps(records)).writer(2)
+        for battle in (2, 3):
+            writer.add(
+                battle, True, 5, 9, self.s.left_creatures + self.s.right_creatures
+            )
+        writer.flush()
+        self.assertEqual(writer.first_battle, 4)
+        columns = records.load()
+        self.assertEqual(list(columns["winner"]), [-1, -1, 1, 1])
+        self.assertEqual(list(columns["actions"]), [0, 0, 9, 9])
+        self.assertEqual(
+            list(columns["hp"][3]),
+            [c.hp for c in self.s.left_creatures + self.s.right_creatures],
+        )
+        writer.add(4, True, 5, 9, self.s.left_creatures + self.s.right_creatures)
+        with self.assertRaises(ValueError):
+            writer.flush()
+        with self.assertRaises(ValueError):
+            records.writer(0).add(1, True, 5, 9, self.s.left_creatures)
+        # a column of the wrong type would shift every value after it
+        with self.assertRaises(ValueError):
+            records.write_columns(0, 1, {"turns": array.array("i", [5])})
+        self.assertEqual(list(records.load()["turns"]), [0, 0, 5, 5])
+        with self.assertRaises(ValueError):
+            self.s.simulate(num_battles=10, engine="numpy", records_path=self.path)
+        self.s.use_cache(transposition_cache.TranspositionCache())
+        with self.assertRaises(ValueError):
+            self.s.simulate(num_battles=10, records_path=self.path)
+        self.s.use_cache(None)
+        with open(self.path, "wb") as file:
+            file.write(bytes(64))
+        with self.assertRaises(ValueError):
+            battle_records.BattleRecords(self.path)
+
+
+class TestSearchPredicates(unittest.TestCase):
+    def setUp(self) -> None:
+        game_config.settings.ascension = 20
+        game_status.state.act = 3
+        logging.disable(logging.CRITICAL)
+        self.s = simulator.Simulator(
+            [jaw_worm.JawWorm() for _ in range(7)], [heart.Heart()]
+        )
+
+    def search(self, predicate: sp.Predicate) -> simulator.Simulator:
+        found = self.s.simulation_search(
+            predicate=predicate, num_cores=1, max_battles=2_000, seed=9
+        )
+        self.assertIsNotNone(found)
+        return self.s.replay(found, seed=9)
+
+    def test_predicates(self) -> None:
+        replayed = self.search(sp.LeftWins() & sp.Survives(0))
+        self.assertTrue(replayed.left_creatures[0].alive)
+        self.assertFalse(replayed.right_creatures[0].alive)
+
+        replayed = self.search(sp.LeftWinsWithHp(100))
+        self.assertGreater(sum(c.hp for c in replayed.left_creatures), 100)
+        self.assertFalse(replayed.right_creatures[0].alive)
+
+        replayed = self.search(sp.DiesByTurn(7, 12))
+        self.assertFalse(replayed.right_creatures[0].alive)
+        self.assertLessEqual(replayed.current_turn, 12)
+        # the Heart died in the final round, current_turn - 1
+        final_turn = replayed.current_turn
+        self.assertTrue(sp.DiesByTurn(7, final_turn).verdict(replayed, True))
+        self.assertFalse(sp.DiesByTurn(7, final_turn - 1).verdict(replayed, True))
+
+        replayed = self.search(sp.BuffedTimes(7, 2) & ~sp.Survives(3))
+        self.assertGreaterEqual(replayed.right_creatures[0].times_buffed, 2)
+        self.assertFalse(replayed.left_creatures[3].alive)
+
+    def test_early_termination(self) -> None:
+        with mock.patch.object(self.s, "one_battle", wraps=self.s.one_battle) as one:
+            found = self.s.simulation_search(
+                predicate=sp.DiesByTurn(7, 2), num_cores=1, max_battles=50
+            )
+        self.assertIsNone(found)
+        # every battle is abandoned once round 2 starts with the Heart alive
+        self.assertEqual(one.call_count, 100)
+        self.assertFalse(sp.DiesByTurn(7, 0).verdict(self.s, None))
+
+    def test_combinators(self) -> None:
+        class Fixed(sp.Predicate):
+            def __init__(self, value: sp.Verdict) -> None:
+                self.value = value
+
+            def verdict(self, simulator: t.Any, left_won: None | bool) -> sp.Verdict:
+                return self.value
+
+        yes, no, unknown = Fixed(True), Fixed(False), Fixed(None)
+        self.assertIsNone((yes & unknown).verdict(self.s, None))
+        self.assertFalse((no & unknown).verdict(self.s, None))
+        self.assertTrue((yes & yes).verdict(self.s, None))
+        self.assertTrue((no | yes).verdict(self.s, None))
+        self.assertIsNone((no | unknown).verdict(self.s, None))
+        self.assertFalse((no | no).verdict(self.s, None))
+        self.assertTrue((~no).verdict(self.s, None))
+        self.assertIsNone((~unknown).verdict(self.s, None))
+        self.assertEqual(repr(sp.DiesByTurn(7, 2)), "DiesByTurn(7, 2)")
+        with self.assertRaises(ValueError):
+            self.s.simulation_search(predicate=yes, a_left_win=True)
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_compare(self) -> None:
+        baseline = {
+            "micro.a": {"unit": benchmarks.NS_PER_CALL, "value": 100.0},
+            "macro.b": {"unit": benchmarks.BATTLES_PER_SECOND, "value": 100.0},
+            "macro.gone": {"unit": benchmarks.BATTLES_PER_SECOND, "value": 1.0},
+        }
+        results = {
+            "micro.a": {"unit": benchmarks.NS_PER_CALL, "value": 50.0},
+            "macro.b": {"unit": benchmarks.BATTLES_PER_SECOND, "value": 80.0},
+        }
+        rows = benchmarks.compare(results, baseline, tolerance=0.1)
+        self.assertEqual(rows, [("macro.b", 0.8, True), ("micro.a", 2.0, False)])
+
+    def test_main(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.json")
+            with mock.patch("builtins.print"):
+                status = benchmarks.main(
+                    [
+                        "--output",
+                        path,
+                        "--seconds",
+                        "0.001",
+                        "--team-sizes",
+                        "1",
+                        "--cores",
+                        "1",
+                        "--scale",
+                        "0.001",
+                    ]
+                )
+            self.assertEqual(status, 0)
+            with open(path) as file:
+                results = json.load(file)
+        self.assertIn("micro.take_hit", results["benchmarks"])
+        self.assertEqual(
+            results["benchmarks"]["macro.worms_1.cores_1"]["unit"], "battles/s"
+        )
+
+
+class TestSimulationResult(unittest.TestCase):
+    def setUp(self) -> None:
+        game_config.settings.ascension = 20
+        game_status.state.act = 3
+        self.worm = jaw_worm.JawWorm()
+        self.heart = heart.Heart(hp=80)
+
+    def test_add_battle(self) -> None:
+        result = simulation_result.SimulationResult.for_teams([self.worm], [self.heart])
+        self.assertEqual(result.left_win_rate, 0)
+        result.add_battle(True, [self.worm, self.heart], 3)
+        self.heart.hp = 0
+        result.add_battle(True, [self.worm, self.heart], 5)
+        self.worm.hp = 0
+        result.add_battle(False, [self.worm, self.heart], 1)
+        self.assertEqual(result.num_battles, 3)
+        self.assertEqual(result.left_wins, 2)
+        self.assertEqual(result.survived, [2, 1])
+        self.assertEqual(result.hp_totals, [88, 80])
+        self.assertEqual(result.turns_total, 9)
+        self.assertEqual(result.mean_turns, 3)
+        self.assertAlmostEqual(result.survival_rate(1), 1 / 3)
+        self.assertAlmostEqual(result.mean_hp(0), 88 / 3)
+        self.assertIn("right Heart 1", str(result))
+        self.assertEqual(result.turn_histogram.quantile(0.5), 3)
+        self.assertEqual(result.hp_histograms[0].counts[44], 2)
+        self.assertEqual(result.hp_histograms[0].counts[0], 1)
+        # damage dealt by the left side: 0, then all 80 hp of the heart, twice
+        self.assertEqual(result.damage_histograms[0].quantile(0.5), 80)
+        self.assertEqual(result.damage_histograms[1].quantile(1), 44)
+
+    def test_histogram(self) -> None:
+        histogram = simulation_result.Histogram(10)
+        with self.assertRaises(ValueError):
+            histogram.quantile(0.5)
+        for value in (0, 2, 2, 3, 7, 12):
+            histogram.add(value)
+        histogram.add(-1, count=2)
+        self.assertEqual(histogram.total, 8)
+        self.assertEqual(histogram.counts[0], 3)
+        # values above max_value land in the last bin
+        self.assertEqual(histogram.counts[10], 1)
+        self.assertEqual(histogram.quantile(0), 0)
+        self.assertEqual(histogram.quantile(0.5), 2)
+        self.assertEqual(histogram.quantile(0.75), 3)
+        self.assertEqual(histogram.quantile(1), 10)
+        self.assertAlmostEqual(histogram.fraction_between(2, 4), 3 / 8)
+        other = simulation_result.Histogram(10)
+        other.add_counts([0, 1])
+        histogram.merge(other)
+        self.assertEqual(histogram.counts[1], 1)
+        with self.assertRaises(ValueError):
+            histogram.merge(simulation_result.Histogram(5))
+
+    def test_merge(self) -> None:
+        first = simulation_result.SimulationResult(["JawWorm"], ["Heart"], [44, 80])
+        first.add_totals(10, 4, [4, 6], [100, 300], 50)
+        first.turn_histogram.add(5, 10)
+        second = simulation_result.SimulationResult(["JawWorm"], ["Heart"], [44, 80])
+        second.add_totals(5, 5, [5, 0], [20, 0], 10)
+        second.turn_histogram.add(2, 5)
+        self.assertIs(first.merge(second), first)
+        self.assertEqual(first.num_battles, 15)
+        self.assertEqual(first.left_wins, 9)
+        self.assertEqual(first.survived, [9, 6])
+        self.assertEqual(first.hp_totals, [120, 300])
+        self.assertEqual(first.turns_total, 60)
+        self.assertEqual(first.turn_histogram.quantile(0.5), 5)
+        self.assertEqual(first.turn_histogram.counts[2], 5)
+        with self.assertRaises(ValueError):
+            first.merge(
+                simulation_result.SimulationResult(["Heart"], ["Heart"], [44, 80])
+            )
+        with self.assertRaises(ValueError):
+            first.merge(
+                simulation_result.SimulationResult(["JawWorm"], ["Heart"], [40, 80])
+            )
 
 
 class TestAttack(unittest.TestCase):
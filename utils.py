@@ -9,6 +9,8 @@ Zachary McCullough
 # Classes
 #########
 
+from statistics import NormalDist
+import math
 import random
 import typing as t
 
@@ -53,57 +55,258 @@ def increment_status(obj: t.Any, status_name: str, increment_amount: int = -1) -
     safe_add(obj, "statuses", {})
 
 
+def wilson_interval(
+    successes: int, trials: int, confidence: float = 0.95
+) -> t.Tuple[float, float]:
+    """The Wilson score interval for a binomial proportion, e.g. a win rate.
+    Unlike the normal approximation it stays sensible near 0 and 1, which is
+    where lopsided matchups live.
+
+    Args:
+        successes (int): Number of successes, e.g. left wins.
+        trials (int): Number of trials, e.g. battles.
+        confidence (float, optional): Confidence level. Defaults to 0.95.
+
+    Returns:
+        t.Tuple[float, float]: (lower bound, upper bound)
+    """
+    if trials <= 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    proportion = successes / trials
+    denominator = 1 + z * z / trials
+    center = (proportion + z * z / (2 * trials)) / denominator
+    half_width = (
+        z
+        * math.sqrt(
+            proportion * (1 - proportion) / trials + z * z / (4 * trials * trials)
+        )
+        / denominator
+    )
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+
+def alias_table(weights: t.Sequence[float]) -> t.Tuple[t.List[float], t.List[int]]:
+    """Builds Walker's alias table for drawing index i with probability
+    weights[i] / sum(weights) from a single uniform draw u in [0, 1):
+
+        column = int(u * n), and with fraction = u * n - column,
+        column if fraction < probabilities[column] else aliases[column]
+
+    Built with Vose's method in O(n).
+
+    Args:
+        weights (t.Sequence[float]): Non-negative weights, not all 0. They
+            need not sum to 1.
+
+    Raises:
+        ValueError: If there are no weights, or they are negative or all 0.
+
+    Returns:
+        t.Tuple[t.List[float], t.List[int]]: (probabilities, aliases)
+    """
+    total = sum(weights)
+    if not weights or total <= 0 or min(weights) < 0:
+        raise ValueError("Weights must be non-negative and not all 0.")
+    num_columns = len(weights)
+    scaled = [weight * num_columns / total for weight in weights]
+    probabilities = [1.0] * num_columns
+    aliases = list(range(num_columns))
+    small = [idx for idx, value in enumerate(scaled) if value < 1]
+    large = [idx for idx, value in enumerate(scaled) if value >= 1]
+    while small and large:
+        low, high = small.pop(), large.pop()
+        probabilities[low] = scaled[low]
+        aliases[low] = high
+        # high donates what low lacks
+        scaled[high] -= 1 - scaled[low]
+        (small if scaled[high] < 1 else large).append(high)
+    # anything left over is 1 up to rounding
+    return probabilities, aliases
+
+
 #########
 # Classes
 #########
 
 
 class RandomChooser:
-    def __init__(self, elements: t.List[str], weights: t.List[float]) -> None:
+    def __init__(
+        self,
+        elements: t.Sequence[t.Any],
+        weights: t.Sequence[float],
+        rng: t.Any = None,
+    ) -> None:
         """
         Initializes the RandomChooser object with a list of elements and a
         corresponding list of weights.
 
+        choose draws without replacement: the chosen element is removed and
+        the weights of the rest are renormalised. It descends a Fenwick tree of
+        the weights, so a draw and the removal are O(log n). sample draws with
+        replacement from the remaining elements in O(1) with an alias table,
+        rebuilt only after an element was removed.
+
         Args:
-            elements (List[str]): List of elements to choose from.
-            weights (List[float]): Corresponding weights for each element.
-                Must sum up to 1.
+            elements (t.Sequence[t.Any]): Elements to choose from.
+            weights (t.Sequence[float]): Corresponding non-negative weights.
+                They need not sum to 1. Elements of weight 0 are never chosen
+                and are left out.
+            rng (t.Any, optional): Source of the uniform draws, anything with
+                a random() method like a creature's BattleRandom. Defaults to
+                the random module.
 
         Raises:
             ValueError: If the lists elements and weights do not have the same
-                length, or if weights do not sum to 1.
+                length, or if weights are negative or all 0.
         """
         if len(elements) != len(weights):
             raise ValueError("The lists elements and weights must have the same length")
+        if elements and (min(weights) < 0 or sum(weights) <= 0):
+            raise ValueError("The weights must be non-negative and not all 0")
+
+        self.rng = random if rng is None else rng
+        kept = [idx for idx, weight in enumerate(weights) if weight > 0]
+        self._elements = [elements[idx] for idx in kept]
+        self._weights = [float(weights[idx]) for idx in kept]
+        self._remaining = len(kept)
+        self._build_tree()
+        # (remaining indices, probabilities, aliases), built on first sample
+        self._alias: None | t.Tuple[t.List[int], t.List[float], t.List[int]] = None
 
-        if not sum(weights) == 1:
-            raise ValueError("The weights must sum up to 1")
+    def __len__(self) -> int:
+        return self._remaining
 
-        self.elements = elements
-        self.weights = weights
+    @property
+    def elements(self) -> t.List[t.Any]:
+        """The elements not chosen yet, in their original order."""
+        return [
+            element
+            for element, weight in zip(self._elements, self._weights)
+            if weight > 0
+        ]
 
-    def choose(self) -> str:
+    @property
+    def weights(self) -> t.List[float]:
+        """The weights of elements, normalised to sum to 1."""
+        remaining = [weight for weight in self._weights if weight > 0]
+        total = sum(remaining)
+        return [weight / total for weight in remaining]
+
+    def choose(self) -> t.Any:
+        """
+        Chooses a random element from the list of elements, based on their
+        weights, and removes it.
+
+        Returns:
+            t.Any: Chosen element.
+
+        Raises:
+            Exception: If all elements have been chosen and removed.
+        """
+        if not self._remaining:
+            raise Exception("All elements have been chosen")
+
+        index = self._find(self.rng.random() * self._total)
+        if not self._weights[index]:
+            # rounding in the tree landed on a removed element, start afresh
+            self._build_tree()
+            index = self._find(self.rng.random() * self._total)
+        self._remove(index)
+        return self._elements[index]
+
+    def sample(self) -> t.Any:
         """
-        Chooses a random element from the list of elements, based on their weights.
+        Chooses a random element from the remaining elements, based on their
+        weights, without removing it.
 
         Returns:
-            str: Chosen element.
+            t.Any: Chosen element.
 
         Raises:
             Exception: If all elements have been chosen and removed.
         """
-        if not self.elements:
+        if not self._remaining:
             raise Exception("All elements have been chosen")
+        if self._alias is None:
+            indices = [idx for idx, weight in enumerate(self._weights) if weight > 0]
+            self._alias = (
+                indices,
+                *alias_table([self._weights[idx] for idx in indices]),
+            )
+        indices, probabilities, aliases = self._alias
+        u = self.rng.random() * len(indices)
+        column = int(u)
+        if u - column >= probabilities[column]:
+            column = aliases[column]
+        return self._elements[indices[column]]
 
-        chosen = random.choices(self.elements, self.weights, k=1)[0]
+    def choose_many(self, k: int, replace: bool = False) -> t.List[t.Any]:
+        """
+        Chooses k elements in one go.
+
+        Args:
+            k (int): Number of elements to choose.
+            replace (bool, optional): Draw with replacement, as sample does,
+                rather than removing each chosen element, as choose does.
+                Defaults to False.
 
-        index = self.elements.index(chosen)
+        Returns:
+            t.List[t.Any]: The chosen elements, in the order they were drawn.
+
+        Raises:
+            ValueError: If k is negative, or more than the remaining elements
+                are chosen without replacement. Nothing is removed then.
+            Exception: If elements are sampled after all have been chosen.
+        """
+        if k < 0:
+            raise ValueError("Cannot choose a negative number of elements")
+        if replace:
+            return [self.sample() for _ in range(k)]
+        if k > self._remaining:
+            raise ValueError(
+                f"Cannot choose {k} of the {self._remaining} remaining elements"
+            )
+        return [self.choose() for _ in range(k)]
 
-        self.elements.pop(index)
-        self.weights.pop(index)
+    def _build_tree(self) -> None:
+        """Builds the Fenwick tree of the weights in O(n): tree[i] holds the
+        sum of the weights of indices i - (i & -i) to i - 1."""
+        size = len(self._weights)
+        tree = [0.0] + self._weights
+        for idx in range(1, size + 1):
+            parent = idx + (idx & -idx)
+            if parent <= size:
+                tree[parent] += tree[idx]
+        self._tree = tree
+        self._total = math.fsum(self._weights)
+        self._top_bit = 1 << size.bit_length() >> 1 if size else 0
 
-        if self.weights:
-            total = sum(self.weights)
-            self.weights = [w / total for w in self.weights]
+    def _find(self, target: float) -> int:
+        """The index whose weight covers target in the running sum of the
+        weights, in O(log n)."""
+        tree = self._tree
+        size = len(tree) - 1
+        position = 0
+        step = self._top_bit
+        while step:
+            following = position + step
+            if following <= size and tree[following] <= target:
+                position = following
+                target -= tree[following]
+            step >>= 1
+        return min(position, size - 1)
 
-        return chosen
+    def _remove(self, index: int) -> None:
+        """Sets the weight of index to 0 in O(log n)."""
+        weight = self._weights[index]
+        self._weights[index] = 0.0
+        self._remaining -= 1
+        self._total -= weight
+        self._alias = None
+        tree = self._tree
+        size = len(tree) - 1
+        position = index + 1
+        while position <= size:
+            tree[position] -= weight
+            position += position & -position